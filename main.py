@@ -3,110 +3,142 @@
 📦 Менеджер Telegram ботов (новая структура проекта)
 
 Использование:
-    python3 main.py start   - Запустить всех ботов
-    python3 main.py stop    - Остановить всех ботов
-    python3 main.py restart - Перезапустить всех ботов
+    python3 main.py start [bot]   - Запустить supervisor и ботов
+    python3 main.py stop [bot]    - Остановить ботов
+    python3 main.py restart [bot] - Перезапустить ботов
     python3 main.py status  - Проверить статус ботов
     python3 main.py logs    - Показать последние логи
+    python3 main.py profile <bot> [сек] - Профилировать бота
+    python3 main.py bench   - Бенчмарки с заглушками Telegram
+    python3 main.py run     - Supervisor на переднем плане
 """
 
 import sys
 import os
+import asyncio
 import subprocess
 import signal
 import time
 from pathlib import Path
 
+from src.supervisor.daemon import run_daemon, CONTROL_NAME, SPECS, PID_FILE
+from src.utils.ipc import send_command
+from src.utils.profiler import read_profile
+
 # --- Конфигурация проекта ---
 PROJECT_DIR = Path(__file__).resolve().parent
-PID_DIR = PROJECT_DIR / "data" / "pids"
 LOG_DIR = PROJECT_DIR / "data" / "logs"
-
-PID_DIR.mkdir(parents=True, exist_ok=True)
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+STARTUP_TIMEOUT = 10  # сек: ожидание control socket supervisor daemon
+STOP_TIMEOUT = 60  # сек: supervisor даёт процессам время на корректное завершение
+
 # --- Боты и WebPanel ---
+# Все процессы живут в supervisor daemon (src/supervisor/daemon.py),
+# start без параметров поднимает веб-панель, остальными управляет она.
 BOTS = {
-    # "Forwarder": "src.bot.forwarder",
-    # "Records": "src.bot.sil_bot",
     "WebPanel": "src.webpanel.webpanel",
 }
 
 class BotManager:
-    def __init__(self):
-        pass
+    """CLI-обёртка над supervisor daemon: команды идут через его control socket."""
 
-    def _pid_file(self, name): return PID_DIR / f"{name.lower()}.pid"
-    def _log_file(self, name): return LOG_DIR / f"{name.lower()}.log"
+    def _log_file(self, name): return LOG_DIR / f"{name.lower()}_subprocess.log"  # stdout; <name>.log пишет сам процесс
 
-    def is_running(self, name):
-        pid_file = self._pid_file(name)
-        if not pid_file.exists():
-            return False
+    def _send(self, cmd, **args):
+        return send_command(CONTROL_NAME, cmd, timeout=5.0, **args)
+
+    def is_running(self):
+        return self._send("ping") is not None
+
+    def get_pid(self):
+        response = self._send("ping")
+        return response["result"]["pid"] if response else None
+
+    @staticmethod
+    def _alive(pid):
         try:
-            pid = int(pid_file.read_text().strip())
             os.kill(pid, 0)
             return True
-        except (OSError, ValueError, ProcessLookupError):
-            pid_file.unlink(missing_ok=True)
+        except ProcessLookupError:
             return False
 
-    def get_pid(self, name):
-        pid_file = self._pid_file(name)
-        return int(pid_file.read_text().strip()) if pid_file.exists() else None
-
-    def start(self):
-        for name, module in BOTS.items():
-            if self.is_running(name):
-                print(f"⚠️  {name} уже запущен (PID: {self.get_pid(name)})")
-                continue
-
-            print(f"🚀 Запуск {name}...")
-            log_file = open(self._log_file(name), "a")
-            process = subprocess.Popen(
-                [sys.executable, "-m", module],
-                stdout=log_file,
-                stderr=subprocess.STDOUT,
-                cwd=PROJECT_DIR,
-                start_new_session=True
-            )
-            self._pid_file(name).write_text(str(process.pid))
-            print(f"✅ {name} запущен (PID: {process.pid}) — логи: {self._log_file(name)}")
-
-    def stop(self):
-        for name in BOTS.keys():
-            if not self.is_running(name):
-                print(f"⚠️  {name} не запущен")
-                continue
-            pid = self.get_pid(name)
-            print(f"🛑 Остановка {name} (PID: {pid})...")
-            try:
-                os.kill(pid, signal.SIGTERM)
-                for _ in range(10):
-                    if not self.is_running(name):
-                        break
-                    time.sleep(0.5)
-                if self.is_running(name):
-                    os.kill(pid, signal.SIGKILL)
-                self._pid_file(name).unlink(missing_ok=True)
-                print(f"✅ {name} остановлен")
-            except Exception as e:
-                print(f"❌ Ошибка при остановке {name}: {e}")
-
-    def restart(self):
+    def _ensure_daemon(self) -> bool:
+        if self.is_running():
+            return True
+        print("🚀 Запуск supervisor...")
+        log_file = open(self._log_file("supervisor"), "a")
+        subprocess.Popen(
+            [sys.executable, "-m", "src.supervisor.daemon"],
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            cwd=PROJECT_DIR,
+            start_new_session=True
+        )
+        deadline = time.time() + STARTUP_TIMEOUT
+        while time.time() < deadline:
+            if self.is_running():
+                print(f"✅ Supervisor запущен (PID: {self.get_pid()})")
+                return True
+            time.sleep(0.2)
+        print(f"❌ Supervisor не ответил за {STARTUP_TIMEOUT}s, см. {self._log_file('supervisor')}")
+        return False
+
+    def _control(self, action, name):
+        response = self._send(action, bot=name)
+        if response is None:
+            print("⚠️  Supervisor не запущен")
+        elif not response.get("ok"):
+            print(f"❌ {name}: {response.get('error')}")
+        else:
+            print(f"✅ {name}: {action} запрошен")
+
+    def start(self, name=None):
+        if not self._ensure_daemon():
+            return
+        for bot in [name] if name else BOTS:
+            self._control("start", bot)
+
+    def stop(self, name=None):
+        if name:
+            self._control("stop", name)
+            return
+        pid = self.get_pid()
+        if pid is None:
+            print("⚠️  Supervisor не запущен")
+            return
+        print(f"🛑 Остановка supervisor (PID: {pid})...")
+        self._send("shutdown")
+        deadline = time.time() + STOP_TIMEOUT
+        while self._alive(pid) and time.time() < deadline:
+            time.sleep(0.5)
+        if self._alive(pid):
+            os.kill(pid, signal.SIGKILL)
+            print("⚠️  Supervisor не завершился вовремя, отправлен SIGKILL")
+        else:
+            print("✅ Supervisor остановлен")
+        Path(PID_FILE).unlink(missing_ok=True)
+
+    def restart(self, name=None):
+        if name:
+            self._control("restart", name)
+            return
         print("🔄 Перезапуск всех ботов...")
         self.stop()
-        time.sleep(1)
         self.start()
 
     def status(self):
         print("📊 Статус ботов:\n")
-        for name in BOTS.keys():
-            if self.is_running(name):
-                pid = self.get_pid(name)
-                print(f"✅ {name}: запущен (PID {pid})")
+        response = self._send("status")
+        if response is None:
+            print("⚠️  Supervisor не запущен")
+            return
+        for p in response["result"]:
+            if p["active"]:
+                print(f"✅ {p['name']}: {p['state']} (PID {p['pid']}, CPU {p['cpu_percent']}%, "
+                      f"RSS {p['rss'] / 1048576:.1f} MB, перезапусков {p['restarts']})")
             else:
-                print(f"⚠️  {name}: не запущен")
+                print(f"⚠️  {p['name']}: {p['state']}")
 
     def logs(self, name=None, lines=40):
         if name:
@@ -118,8 +150,43 @@ class BotManager:
             os.system(f"tail -n {lines} {log_file}")
         else:
             print("📜 Все доступные логи:")
-            for name in BOTS.keys():
-                print(f"  - {name}: {self._log_file(name)}")
+            for spec in SPECS:
+                print(f"  - {spec.name}: {self._log_file(spec.name)}")
+
+    def profile(self, name, seconds=30):
+        """Профилирование работающего бота: сэмплер стеков + tracemalloc, отчёт в data/profiles/."""
+        spec = next((s for s in SPECS if name.lower() in (s.name.lower(), s.control or "")), None)
+        if not spec or not spec.control:
+            print(f"❌ Бот {name} не поддерживает профилирование")
+            return
+        response = send_command(spec.control, "profile", timeout=5.0, seconds=seconds)
+        if response is None:
+            print(f"⚠️  {spec.name} не запущен")
+            return
+        if not response.get("ok"):
+            print(f"❌ {response.get('error')}")
+            return
+        result = response["result"]
+        print(f"🔬 Профилирование {spec.name} {result['seconds']:.0f}s -> data/profiles/{result['file']}")
+        deadline = result["until"] + 10
+        report = None
+        while report is None and time.time() < deadline:
+            time.sleep(1)
+            report = read_profile(result["file"])
+        if report is None:
+            print("⚠️  Отчёт ещё не готов, посмотрите его позже в веб-панели")
+            return
+        print(f"\n📊 {report['samples']} сэмплов, простой event loop {report['idle_percent']}%\n")
+        print("Топ функций (self):")
+        for row in report["top_self"][:10]:
+            print(f"  {row['percent']:5.1f}%  {row['function']}")
+        print("\nТоп выделений памяти:")
+        for row in report["allocations"][:5]:
+            print(f"  {row['size_diff'] / 1024:+9.1f} KB  {row['where']}")
+
+    def run(self):
+        """Supervisor daemon на переднем плане (его же запускает start)."""
+        asyncio.run(run_daemon())
 
 def print_help():
     print("""
@@ -129,12 +196,15 @@ def print_help():
     python3 main.py <команда> [параметры]
 
 Команды:
-    start       — запустить всех ботов
-    stop        — остановить всех ботов
-    restart     — перезапустить всех ботов
-    status      — показать состояние
-    logs [bot]  — показать последние строки логов
-    help        — помощь
+    start [bot]   — запустить supervisor и веб-панель (или конкретного бота)
+    stop [bot]    — остановить supervisor со всеми ботами (или конкретного бота)
+    restart [bot] — перезапустить всё (или конкретного бота)
+    status        — показать состояние
+    logs [bot]    — показать последние строки логов
+    profile <bot> [сек] — профилировать работающего бота (по умолчанию 30 сек)
+    bench [--quick] [--only a,b] [--save-baseline] — бенчмарки (offline), сравнение с baseline
+    run           — supervisor на переднем плане (для tmux)
+    help          — помощь
 """)
 
 def main():
@@ -147,15 +217,22 @@ def main():
     args = sys.argv[2:] if len(sys.argv) > 2 else []
 
     if cmd == "start":
-        manager.start()
+        manager.start(args[0] if args else None)
     elif cmd == "stop":
-        manager.stop()
+        manager.stop(args[0] if args else None)
     elif cmd == "restart":
-        manager.restart()
+        manager.restart(args[0] if args else None)
     elif cmd == "status":
         manager.status()
     elif cmd == "logs":
         manager.logs(args[0] if args else None)
+    elif cmd == "profile" and args:
+        manager.profile(args[0], float(args[1]) if len(args) > 1 else 30)
+    elif cmd == "bench":
+        from src.bench.runner import main as bench_main
+        sys.exit(bench_main(args))
+    elif cmd == "run":
+        manager.run()
     else:
         print_help()
 
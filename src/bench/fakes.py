@@ -0,0 +1,151 @@
+import asyncio
+import json
+import random
+import time
+from telethon.errors import FloodWaitError
+from telethon.tl.types import PeerChannel
+
+# Заглушки Telegram для бенчмарков: всё работает локально, без сети.
+
+# --- Forwarder: заглушка Telethon ---
+class StubEntity(PeerChannel):
+    """PeerChannel с полем id, как у настоящего Channel: get_peer_id() его понимает."""
+
+    @property
+    def id(self):
+        return self.channel_id
+
+class StubTelethonClient:
+    """
+    Вместо TelegramClient: send_message/send_file ждут latency и с вероятностью
+    flood_rate отвечают FloodWaitError(flood_seconds).
+    """
+
+    def __init__(self, latency: float = 0.002, flood_rate: float = 0.0, flood_seconds: int = 0, seed: int = 42):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = random.Random(seed)
+        self.sent = 0
+        self.floods = 0
+        self._entities = {}
+
+    async def get_entity(self, chan):
+        entity = self._entities.get(chan)
+        if entity is None:
+            entity = self._entities[chan] = StubEntity(channel_id=1_000_000 + len(self._entities))
+        return entity
+
+    async def _send(self):
+        await asyncio.sleep(self.latency)
+        if self.rng.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWaitError(request=None, capture=self.flood_seconds)
+        self.sent += 1
+
+    async def send_message(self, **kwargs):
+        await self._send()
+
+    async def send_file(self, **kwargs):
+        await self._send()
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def make_event(entity: StubEntity, username: str, text: str, media=None):
+    """Минимальный NewMessage-event: ровно те поля, что читает forward_handler."""
+    return _Obj(
+        out=False,
+        chat_id=-1_000_000_000_000 - entity.channel_id,
+        chat=_Obj(username=username.lstrip("@"), title=username),
+        message=_Obj(text=text, media=media),
+        raw_text=text,
+    )
+
+# --- Sil bot: локальный Bot API ---
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+class FakeBotApiServer:
+    """
+    Минимальный HTTP/1.1-сервер с keep-alive, отвечающий как Bot API.
+    latency — задержка ответа, retry_after_rate — доля ответов 429 (RetryAfter).
+    """
+
+    def __init__(self, latency: float = 0.005, retry_after_rate: float = 0.0, seed: int = 42):
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.rng = random.Random(seed)
+        self.calls: dict[str, int] = {}
+        self._message_id = 0
+        self._server = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _result(self, method: str):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "sendPhoto"):
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": 1, "type": "private"}, "from": BOT_USER, "text": "ok"}
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                path = lines[0].split(" ")[1]
+                headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+                length = int(headers.get("content-length", 0))
+                if length:
+                    await reader.readexactly(length)
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                self.calls[method] = self.calls.get(method, 0) + 1
+                await asyncio.sleep(self.latency)
+                if method != "getMe" and self.rng.random() < self.retry_after_rate:
+                    status, body = "429 Too Many Requests", {
+                        "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                        "parameters": {"retry_after": 1}}
+                else:
+                    status, body = "200 OK", {"ok": True, "result": self._result(method)}
+                payload = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# --- Апдейты Bot API ---
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"User{uid}", "username": f"bench_user{uid}"}
+
+def message_update(update_id: int, uid: int, text: str) -> dict:
+    message = {"message_id": update_id, "date": int(time.time()),
+               "chat": {"id": uid, "type": "private"}, "from": _user(uid), "text": text}
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def callback_update(update_id: int, uid: int, data: str) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": _user(uid), "chat_instance": str(uid), "data": data,
+        "message": {"message_id": update_id, "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"}, "from": BOT_USER, "text": "Выбери движение 💪"},
+    }}
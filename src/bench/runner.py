@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from src.config import BASE_DIR, DATA_DIR
+from src.bench import scenarios
+
+# Запуск: python3 main.py bench [--quick] [--only forwarder,render] [--save-baseline]
+# Результаты: data/bench/<время>.json и data/bench/latest.json,
+# сравнение с data/bench/baseline.json; регрессия хуже REGRESSION_THRESHOLD — код выхода 1.
+
+BENCH_DIR = os.path.join(DATA_DIR, "bench")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+LATEST_FILE = os.path.join(BENCH_DIR, "latest.json")
+REGRESSION_THRESHOLD = 0.20  # 20%
+NOISE_FLOOR = {"ms": 1.0, "s": 0.01}  # абсолютная разница меньше — шум таймера, не регрессия
+
+SCENARIOS = {
+    "forwarder": lambda quick: asyncio.run(scenarios.bench_forwarder(events=500 if quick else 2000)),
+    "sil_bot": lambda quick: asyncio.run(scenarios.bench_sil_bot(users=50 if quick else 200)),
+    "render": lambda quick: scenarios.bench_render(sizes=(10, 100) if quick else (10, 1000, 10000)),
+    "storage": lambda quick: scenarios.bench_storage(sizes=(100, 1000, 10000) if quick else (100, 1000, 10000, 100000)),
+    "analytics": lambda quick: scenarios.bench_analytics(sizes=(1000, 10000) if quick else (1000, 10000, 50000)),
+}
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _write(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def _load(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[dict]:
+    """Построчное сравнение с baseline; change > 0 — хуже, с учётом направления метрики."""
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base or cur.get("value") is None or not base.get("value"):
+            continue
+        ratio = cur["value"] / base["value"] - 1
+        change = ratio if cur["better"] == "lower" else -ratio
+        noise = abs(cur["value"] - base["value"]) < NOISE_FLOOR.get(cur["unit"], 0)
+        rows.append({"name": name, "baseline": base["value"], "current": cur["value"], "unit": cur["unit"],
+                     "change": round(change, 4), "regression": change > threshold and not noise})
+    return rows
+
+def run(only: list[str] | None = None, quick: bool = False) -> dict:
+    report = {
+        "meta": {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": {},
+    }
+    for name, scenario in SCENARIOS.items():
+        if only and name not in only:
+            continue
+        print(f"⏱  {name}...", flush=True)
+        try:
+            report["results"].update(scenario(quick))
+        except Exception as e:
+            report["results"][f"{name}.error"] = {"value": None, "unit": type(e).__name__,
+                                                  "better": "lower", "error": str(e)[:200]}
+            print(f"❌ {name}: {e}")
+    return report
+
+def print_report(report: dict, rows: list[dict] | None):
+    changes = {row["name"]: row for row in rows or []}
+    print()
+    for name, res in report["results"].items():
+        if res.get("value") is None:
+            print(f"  {name:40} ❌ {res['unit']}: {res.get('error', '')}")
+            continue
+        line = f"  {name:40} {res['value']:>14.3f} {res['unit']}"
+        row = changes.get(name)
+        if row:
+            mark = "🔴" if row["regression"] else ("🟢" if row["change"] < -REGRESSION_THRESHOLD else "  ")
+            line += f"   {mark} {row['change'] * 100:+.1f}% vs baseline"
+        print(line)
+
+def main(argv: list[str]) -> int:
+    quick = "--quick" in argv
+    save_baseline = "--save-baseline" in argv
+    only = None
+    if "--only" in argv and argv.index("--only") + 1 < len(argv):
+        only = argv[argv.index("--only") + 1].split(",")
+
+    from src.logger import setup_logging
+    setup_logging("bench")  # предупреждения заглушек (FloodWait и т.п.) — в data/logs/bench.log
+
+    report = run(only, quick)
+    baseline = _load(BASELINE_FILE)
+    rows = None
+    if baseline and baseline["meta"].get("quick") == quick:
+        rows = compare(report, baseline)
+        report["comparison"] = {"baseline": baseline["meta"], "rows": rows}
+    _write(os.path.join(BENCH_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"), report)
+    _write(LATEST_FILE, report)
+    print_report(report, rows)
+
+    if save_baseline:
+        _write(BASELINE_FILE, report)
+        print(f"\n💾 Baseline сохранён: {BASELINE_FILE}")
+        return 0
+    if baseline is None:
+        print("\nℹ️  Baseline нет, сохраните его: python3 main.py bench --save-baseline")
+        return 0
+    if rows is None:
+        print("\nℹ️  Baseline снят в другом режиме (--quick), сравнение пропущено")
+        return 0
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n🔴 Регрессии (> {REGRESSION_THRESHOLD:.0%}): " + ", ".join(row["name"] for row in regressions))
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
@@ -0,0 +1,287 @@
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from src.bench.fakes import StubTelethonClient, make_event, FakeBotApiServer, message_update, callback_update
+
+# Сценарии бенчмарков. Каждый возвращает {имя: {"value", "unit", "better"}},
+# better = "lower" | "higher" — в какую сторону изменение считается улучшением.
+# Все файлы данных подменяются временными, реальные data/*.json не трогаются.
+
+def result(value: float, unit: str, better: str = "lower") -> dict:
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+def latency_results(prefix: str, latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {
+        f"{prefix}.p50_ms": result(pick(0.5), "ms"),
+        f"{prefix}.p95_ms": result(pick(0.95), "ms"),
+        f"{prefix}.p99_ms": result(pick(0.99), "ms"),
+    }
+
+@contextmanager
+def patched(obj, **attrs):
+    """Временно подменяет атрибуты модуля/объекта."""
+    saved = {name: getattr(obj, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(obj, name, value)
+
+def synthetic_records(n: int) -> list[dict]:
+    movements = ["Жим", "Присед", "Тяга"]
+    base = datetime(2025, 1, 1)
+    return [{"user": f"@user{i % max(1, n // 3)}", "movement": movements[i % 3],
+             "weight": 60 + (i * 7) % 140, "date": (base + timedelta(days=i % 365)).strftime("%d.%m.%Y")}
+            for i in range(n)]
+
+def synthetic_stats(n: int) -> list[dict]:
+    base = datetime(2025, 1, 1)
+    return [{"date": (base + timedelta(days=i % 365)).strftime("%Y-%m-%d"), "channel": f"@bench_chan_{i % 20}"}
+            for i in range(n)]
+
+# --- Forwarder ---
+async def bench_forwarder(events: int = 2000, channels: int = 20, latency: float = 0.002,
+                          flood_rate: float = 0.01) -> dict:
+    from src.bot import forwarder
+    from src.bot.send_scheduler import FairScheduler
+    from src.services import rollup_service
+    from src.utils import jsonstore
+    from src.utils.utils import save_json
+
+    client = StubTelethonClient(latency=latency, flood_rate=flood_rate)
+    names = [f"@bench_chan_{i}" for i in range(channels)]
+    with tempfile.TemporaryDirectory() as tmp, patched(
+        forwarder,
+        client=client,
+        scheduler=FairScheduler(),
+        CHANNELS_FILE=os.path.join(tmp, "channels.json"),
+        STATS_FILE=os.path.join(tmp, "stats.json"),
+        FORWARD_SCHEDULE_FILE=os.path.join(tmp, "forward_schedule.json"),
+        add_error_to_queue=lambda *args, **kwargs: None,
+    ), patched(rollup_service, ROLLUPS_FILE=os.path.join(tmp, "rollups.json")):
+        save_json(forwarder.CHANNELS_FILE, names)
+        await forwarder.update_monitored_channels()
+        entities = [await client.get_entity(name) for name in names]
+        # Первый канал — «болтливый»: половина всех сообщений приходит из него одной пачкой
+        burst = [make_event(entities[0], names[0], f"burst {i}") for i in range(events // 2)]
+        batch = [make_event(entities[i % channels], names[i % channels], f"message {i}") for i in range(events - len(burst))]
+
+        latencies, quiet = [], []
+
+        async def handle(event, quiet_channel: bool):
+            started = time.perf_counter()
+            job = await forwarder.forward_handler(event)
+            if job is not None:
+                await job
+            latencies.append(time.perf_counter() - started)
+            if quiet_channel:
+                quiet.append(latencies[-1])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(handle(event, False) for event in burst),
+                             *(handle(event, event.chat.title != names[0]) for event in batch))
+        elapsed = time.perf_counter() - started
+        await forwarder.scheduler.stop()
+        for path in (forwarder.STATS_FILE, forwarder.CHANNELS_FILE, rollup_service.ROLLUPS_FILE):
+            jsonstore.close_store(path)  # свернуть журнал, пока временный каталог существует
+
+    reordered = await scheduler_reordered()
+    return {
+        "forwarder.throughput": result(events / elapsed, "msg/s", "higher"),
+        **latency_results("forwarder.latency", latencies),
+        # Задержка тихих каналов, пока болтливый выгружает пачку: справедливость планировщика
+        **latency_results("forwarder.quiet_latency", quiet),
+        "forwarder.forwarded": result(client.sent, "msgs", "higher"),
+        "forwarder.flood_waits": result(client.floods, "count"),
+        # Должно быть 0: сообщения канала доходят в исходном порядке при любом числе воркеров
+        "forwarder.reordered": result(reordered, "msgs"),
+    }
+
+async def scheduler_reordered(jobs: int = 300, channels: int = 3, workers: int = 3, seed: int = 42) -> int:
+    """Сколько отправок завершилось раньше предыдущего сообщения своего канала."""
+    from src.bot.send_scheduler import FairScheduler
+
+    rng = random.Random(seed)
+    scheduler = FairScheduler(workers=workers)
+    done: dict[str, list[int]] = {}
+
+    def send(key: str, n: int, delay: float):
+        async def run():
+            await asyncio.sleep(delay)
+            done.setdefault(key, []).append(n)
+        return run
+
+    futures = [scheduler.submit(f"@chan_{i % channels}", send(f"@chan_{i % channels}", i, rng.uniform(0, 0.003)))
+               for i in range(jobs)]
+    await asyncio.gather(*futures)
+    await scheduler.stop()
+    return sum(a > b for order in done.values() for a, b in zip(order, order[1:]))
+
+# --- Sil bot ---
+async def bench_sil_bot(users: int = 200, latency: float = 0.005, retry_after_rate: float = 0.0) -> dict:
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
+    from src.bot.handlers.help_handlers import help_cmd
+    from src.bot.handlers.top_handlers import top_cmd
+    from src.bot.handlers.sil_handlers import sil_menu, callback_movement, handle_text_for_weight
+    from src.bot.update_processor import KeyedUpdateProcessor
+    from src.services import records_service
+    from src.utils import safe_senders
+
+    server = FakeBotApiServer(latency=latency, retry_after_rate=retry_after_rate)
+    await server.start()
+    # Лимиты Telegram здесь не измеряем: иначе бенчмарк показывал бы 1 сообщение/сек на чат
+    unlimited = dict(GLOBAL_RATE=1e9, PRIVATE_RATE=1e9, PRIVATE_BURST=1e9, GROUP_RATE=1e9, GROUP_BURST=1e9)
+    with tempfile.TemporaryDirectory() as tmp, \
+            patched(records_service, RECORDS_DIR=tmp), \
+            patched(safe_senders, **unlimited):
+        with patched(safe_senders, limiter=safe_senders.DeliveryLimiter()):
+            app = (
+                ApplicationBuilder()
+                .token("123456:BENCH")
+                .base_url(server.base_url)
+                .base_file_url(server.base_url)
+                .concurrent_updates(KeyedUpdateProcessor(64))
+                .updater(None)
+                .build()
+            )
+            app.add_handler(CommandHandler("help", help_cmd))
+            app.add_handler(CommandHandler("sil", sil_menu))
+            app.add_handler(CommandHandler("top", top_cmd))
+            app.add_handler(CallbackQueryHandler(callback_movement))
+            app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_for_weight))
+            await app.initialize()
+
+            latencies = []
+            counter = iter(range(1, 10 ** 9))
+
+            async def process(data):
+                update = Update.de_json(data, app.bot)
+                started = time.perf_counter()
+                await app.update_processor.process_update(update, app.process_update(update))
+                latencies.append(time.perf_counter() - started)
+
+            async def user_session(uid):
+                # Полный диалог /sil плюс справка и топ — апдейты одного пользователя идут по очереди
+                await process(message_update(next(counter), uid, "/help"))
+                await process(message_update(next(counter), uid, "/sil"))
+                await process(callback_update(next(counter), uid, "bench"))
+                await process(message_update(next(counter), uid, "100"))
+                await process(message_update(next(counter), uid, "/top"))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user_session(10_000 + i) for i in range(users)))
+            elapsed = time.perf_counter() - started
+            store = records_service.records_store
+            await store.stop()
+            store.shards.clear()  # шарды указывают на временный каталог
+            # Личные чаты — у каждого пользователя свой шард
+            saved = sum(len(records_service.read_shard(records_service.shard_path(t)))
+                        for t in records_service.list_tenants())
+            await app.shutdown()
+    await server.stop()
+
+    return {
+        "sil_bot.throughput": result(len(latencies) / elapsed, "updates/s", "higher"),
+        **latency_results("sil_bot.latency", latencies),
+        "sil_bot.records_saved": result(saved, "records", "higher"),
+        "sil_bot.api_calls": result(sum(server.calls.values()), "calls"),
+    }
+
+# --- Рендер таблицы ---
+def bench_render(sizes=(10, 1000, 10000)) -> dict:
+    from src.utils.rendering import render_table_image
+
+    results = {}
+    for n in sizes:
+        records = synthetic_records(n)
+        started = time.perf_counter()
+        try:
+            buf = render_table_image(records)
+        except Exception as e:
+            results[f"render.{n}.error"] = {"value": None, "unit": type(e).__name__, "better": "lower", "error": str(e)[:200]}
+            continue
+        results[f"render.{n}_s"] = result(time.perf_counter() - started, "s")
+        results[f"render.{n}_kb"] = result(len(buf.getvalue()) / 1024, "KB")
+    return results
+
+# --- JSON-хранилище ---
+def _median_time(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def bench_storage(sizes=(100, 1000, 10000, 100000), repeats: int = 5) -> dict:
+    from src.utils.utils import load_json, save_json, record_stat
+    from src.utils import jsonstore
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"stats_{n}.json")
+            data = synthetic_stats(n)
+            results[f"storage.save_json.{n}_ms"] = result(_median_time(lambda: save_json(path, data), repeats) * 1000, "ms")
+            results[f"storage.load_json.{n}_ms"] = result(_median_time(lambda: load_json(path, []), repeats) * 1000, "ms")
+            # record_stat дописывает строку в журнал; снимок файла — отдельно, раз в FLUSH_INTERVAL
+            record_stat(path, "@bench_chan_0")  # загрузка снимка — не в замере
+            results[f"storage.record_stat.{n}_ms"] = result(
+                _median_time(lambda: record_stat(path, "@bench_chan_0"), repeats) * 1000, "ms")
+            store = jsonstore.get_store(path)
+            started = time.perf_counter()
+            store.flush()
+            results[f"storage.jsonstore_flush.{n}_ms"] = result((time.perf_counter() - started) * 1000, "ms")
+            # Снимок пишется вне блокировки: record_stat не должен ждать перезаписи файла
+            record_stat(path, "@bench_chan_0")
+            flusher = threading.Thread(target=store.flush)
+            flusher.start()
+            waits = []
+            while flusher.is_alive():
+                started = time.perf_counter()
+                record_stat(path, "@bench_chan_0")
+                waits.append(time.perf_counter() - started)
+            flusher.join()
+            results[f"storage.record_stat_during_flush.{n}_max_ms"] = result(max(waits, default=0) * 1000, "ms")
+            jsonstore.close_store(path)
+    return results
+
+# --- Аналитика рекордов ---
+def bench_analytics(sizes=(1000, 10000, 50000)) -> dict:
+    from src.services import records_service
+    from src.services.analytics_service import AnalyticsCache
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, patched(records_service, RECORDS_DIR=tmp):
+        for n in sizes:
+            tenant = (-n, None)
+            entries = synthetic_records(n)
+            for i, entry in enumerate(entries):
+                entry["user"] = f"@user{i % 50}"  # реалистичная группа: десятки людей, длинная история
+                entry["reps"] = 1 + i % 8
+            records_service.append_history(records_service.history_path(tenant), entries)
+            cache = AnalyticsCache()
+            started = time.perf_counter()
+            cache.get(tenant)
+            results[f"analytics.full.{n}_ms"] = result((time.perf_counter() - started) * 1000, "ms")
+
+            def incremental():
+                records_service.append_history(records_service.history_path(tenant), [
+                    {"user": "@user1", "movement": "Жим", "weight": 150, "reps": 3, "date": "01.06.2026"}])
+                cache.get(tenant)
+            results[f"analytics.incremental.{n}_ms"] = result(_median_time(incremental, 5) * 1000, "ms")
+            started = time.perf_counter()
+            cache.get(tenant)
+            results[f"analytics.cached.{n}_ms"] = result((time.perf_counter() - started) * 1000, "ms")
+    return results
@@ -0,0 +1,221 @@
+import asyncio
+import re
+import time
+from telethon.errors import (
+    FloodWaitError, ChannelPrivateError, ChannelInvalidError, UsernameNotOccupiedError, UsernameInvalidError,
+    InviteHashExpiredError, InviteHashInvalidError,
+)
+from telethon.tl.functions.messages import CheckChatInviteRequest
+from telethon.tl.types import Channel, ChatInviteAlready
+from telethon.utils import get_peer_id
+from src.config import CHANNEL_IMPORT_CONCURRENCY, CHANNEL_IMPORT_RATE, CHANNEL_IMPORT_MAX_FLOOD, CHANNEL_IMPORT_LIMIT
+from src.logger import logger
+from src.utils.safe_senders import TokenBucket
+
+# Массовое добавление каналов forwarder. Список (текст или файл) разбирается и
+# нормализуется: @name, name, t.me/name, t.me/name/123, t.me/s/name, tg://resolve?domain=name
+# приводятся к @name, ссылки-приглашения — к https://t.me/+hash; повторы и уже
+# отслеживаемые каналы отсекаются без запросов к Telegram. Остальные проверяются
+# пачками по BATCH_SIZE: не больше CHANNEL_IMPORT_CONCURRENCY запросов одновременно
+# и не чаще CHANNEL_IMPORT_RATE в секунду, так что время импорта предсказуемо
+# (estimate_seconds). FloodWait останавливает все проверки на указанное время;
+# если он длиннее CHANNEL_IMPORT_MAX_FLOOD — оставшиеся каналы помечаются failed,
+# а проверенные всё равно сохраняются.
+
+RESOLVED = "resolved"
+PRIVATE = "private"
+NOT_FOUND = "not_found"
+PRESENT = "already_present"
+DUPLICATE = "duplicate"  # повтор внутри того же списка
+INVALID = "invalid"  # не похоже на канал
+FAILED = "failed"  # не удалось проверить (FloodWait, ошибка сети) — стоит повторить позже
+STATUSES = (RESOLVED, PRIVATE, NOT_FOUND, PRESENT, DUPLICATE, INVALID, FAILED)
+
+BATCH_SIZE = 25
+MAX_ATTEMPTS = 3
+HEADER_WORDS = {"channel", "channels", "username", "usernames", "name"}  # заголовок CSV из одной колонки
+
+USERNAME_RE = re.compile(r"^[a-z][a-z0-9_]{3,31}$", re.IGNORECASE)
+LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.(?:me|dog)/(?P<path>[^?#]+)", re.IGNORECASE)
+RESOLVE_RE = re.compile(r"^tg://resolve\?(?:.*&)?domain=(?P<name>[^&]+)", re.IGNORECASE)
+SPLIT_RE = re.compile(r"[\s,;]+")
+
+# --- Разбор списка ---
+def normalize(raw: str) -> str | None:
+    """Канал в том виде, в каком он хранится в channels.json, или None."""
+    value = raw.strip().strip("\"'<>")
+    if match := RESOLVE_RE.match(value):
+        value = match["name"]
+    elif match := LINK_RE.match(value):
+        path = [part for part in match["path"].split("/") if part]
+        if not path:
+            return None
+        if path[0].startswith("+") and len(path[0]) > 1:
+            return f"https://t.me/{path[0]}"
+        if path[0].lower() == "joinchat" and len(path) > 1:
+            return f"https://t.me/+{path[1]}"
+        value = path[1] if path[0].lower() == "s" and len(path) > 1 else path[0]
+    value = value.removeprefix("@")
+    return f"@{value}" if USERNAME_RE.match(value) else None
+
+def invite_hash(channel: str) -> str | None:
+    return channel.removeprefix("https://t.me/+") if channel.startswith("https://t.me/+") else None
+
+def channel_key(channel: str) -> str:
+    """Ключ для сравнения: username без учёта регистра, хэш приглашения — как есть."""
+    normalized = normalize(channel) or channel
+    return normalized if invite_hash(normalized) else normalized.lower()
+
+def parse_channels(text: str) -> list[str]:
+    """Элементы списка: через пробелы, переводы строк, запятые или точку с запятой."""
+    tokens = [token for token in SPLIT_RE.split(text or "") if token]
+    if tokens and tokens[0].lower() in HEADER_WORDS:
+        tokens = tokens[1:]
+    return tokens
+
+def estimate_seconds(count: int) -> float:
+    """Сколько займёт проверка count каналов без FloodWait."""
+    return count / CHANNEL_IMPORT_RATE
+
+# --- Проверка ---
+class ChannelResolver:
+    def __init__(self, client, concurrency: int = CHANNEL_IMPORT_CONCURRENCY, rate: float = CHANNEL_IMPORT_RATE,
+                 max_flood: int = CHANNEL_IMPORT_MAX_FLOOD):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate, 1)  # ровный темп; blocked_until — пауза FloodWait
+        self.max_flood = max_flood
+        self.aborted = None  # секунды FloodWait, из-за которого проверки прекращены
+
+    async def _slot(self):
+        while True:
+            delay = self.bucket.wait_time(time.monotonic())
+            if delay <= 0:
+                self.bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+    async def resolve(self, channel: str) -> tuple[str, int | None, str, str | None]:
+        """(статус, peer id, имя для channels.json, пояснение)."""
+        async with self.semaphore:
+            for _ in range(MAX_ATTEMPTS):
+                if self.aborted:
+                    return FAILED, None, channel, f"FloodWait {self.aborted}s"
+                await self._slot()
+                try:
+                    return await self._resolve(channel)
+                except FloodWaitError as e:
+                    if e.seconds > self.max_flood:
+                        self.aborted = e.seconds
+                        logger.warning(f"⏳ Channel import: FloodWait {e.seconds}s, remaining checks stopped")
+                    else:
+                        logger.warning(f"⏳ Channel import: FloodWait {e.seconds}s, pausing checks")
+                        self.bucket.blocked_until = max(self.bucket.blocked_until, time.monotonic() + e.seconds)
+                except Exception as e:
+                    return FAILED, None, channel, str(e)
+            return FAILED, None, channel, f"FloodWait {MAX_ATTEMPTS} times"
+
+    async def _resolve(self, channel: str) -> tuple[str, int | None, str, str | None]:
+        if hash_ := invite_hash(channel):
+            try:
+                invite = await self.client(CheckChatInviteRequest(hash_))
+            except (InviteHashExpiredError, InviteHashInvalidError):
+                return NOT_FOUND, None, channel, "invite link expired or invalid"
+            if isinstance(invite, ChatInviteAlready):
+                return RESOLVED, get_peer_id(invite.chat), channel, None
+            return PRIVATE, None, channel, "private, join by the invite link first"
+        try:
+            entity = await self.client.get_entity(channel)
+        except ChannelPrivateError:
+            return PRIVATE, None, channel, "private or banned"
+        except (UsernameNotOccupiedError, UsernameInvalidError, ChannelInvalidError, ValueError):
+            return NOT_FOUND, None, channel, None
+        if not isinstance(entity, Channel):
+            return INVALID, None, channel, "not a channel"
+        # Регистр — как в Telegram, чтобы список в channels.json выглядел аккуратно
+        name = f"@{entity.username}" if entity.username else channel
+        return RESOLVED, get_peer_id(entity), name, None
+
+async def resolve_channels(client, tokens: list[str], existing: list[str],
+                           progress=None) -> tuple[list[dict], dict[str, int]]:
+    """
+    Отчёт по каждому элементу списка и {канал: peer id} для прошедших проверку.
+    Уже отслеживаемые (existing) и повторы не проверяются.
+    progress(проверено, всего к проверке) вызывается после каждого запроса.
+    """
+    if len(tokens) > CHANNEL_IMPORT_LIMIT:
+        raise ValueError(f"too many channels: {len(tokens)} > {CHANNEL_IMPORT_LIMIT}, split the list")
+    known = {channel_key(chan) for chan in existing}
+    seen = set()
+    items = []
+    to_check = []
+    for token in tokens:
+        channel = normalize(token)
+        item = {"input": token, "channel": channel, "status": None}
+        items.append(item)
+        if channel is None:
+            item.update(status=INVALID, detail="not a username or t.me link")
+        elif channel_key(channel) in known:
+            item["status"] = PRESENT
+        elif channel_key(channel) in seen:
+            item["status"] = DUPLICATE
+        else:
+            seen.add(channel_key(channel))
+            to_check.append(item)
+
+    resolver = ChannelResolver(client)
+    peers = {}
+    started = time.monotonic()
+    checked = 0
+
+    async def check(item):
+        nonlocal checked
+        result = await resolver.resolve(item["channel"])
+        checked += 1
+        if progress:
+            progress(checked, len(to_check))
+        return result
+
+    if progress:
+        progress(0, len(to_check))
+    for start in range(0, len(to_check), BATCH_SIZE):
+        batch = to_check[start:start + BATCH_SIZE]
+        results = await asyncio.gather(*(check(item) for item in batch))
+        for item, (status, peer_id, name, detail) in zip(batch, results):
+            item.update(status=status, channel=name)
+            if detail:
+                item["detail"] = detail
+            if status == RESOLVED:
+                peers[name] = peer_id
+        logger.info(f"🔎 Channel import: {min(start + BATCH_SIZE, len(to_check))}/{len(to_check)} checked "
+                    f"({time.monotonic() - started:.0f}s)")
+    return items, peers
+
+def summarize(items: list[dict]) -> dict:
+    counts = dict.fromkeys(STATUSES, 0)
+    for item in items:
+        counts[item["status"]] += 1
+    return counts
+
+# --- Ответ в группу ---
+STATUS_TITLES = {
+    NOT_FOUND: "❌ Не найдены",
+    PRIVATE: "🔒 Приватные",
+    INVALID: "⚠️ Некорректные",
+    FAILED: "⏳ Не проверены (повторите позже)",
+}
+MAX_REPLY = 3500  # символов; лимит сообщения Telegram — 4096
+
+def format_report(report: dict) -> str:
+    counts = report["counts"]
+    lines = [
+        f"📥 Импорт каналов: добавлено {len(report['added'])}",
+        f"уже есть: {counts[PRESENT]}, повторы в списке: {counts[DUPLICATE]}",
+    ]
+    for status, title in STATUS_TITLES.items():
+        bad = [item.get("channel") or item["input"] for item in report["items"] if item["status"] == status]
+        if bad:
+            lines.append(f"\n{title} ({len(bad)}):")
+            lines.extend(f"• {chan}" for chan in bad)
+    text = "\n".join(lines)
+    return text if len(text) <= MAX_REPLY else text[:MAX_REPLY].rsplit("\n", 1)[0] + "\n…"
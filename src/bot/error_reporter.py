@@ -1,25 +1,157 @@
-import asyncio
+import atexit
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from telegram.ext import Application
-from src.config import REPORT_TIME, ADMIN_ID, MSK_TZ
-from src.logger import logger
+from src.config import REPORT_TIME, ADMIN_ID, MSK_TZ, ERRORS_FILE
+from src.utils.utils import load_json, save_json, file_lock
+from src.utils.safe_senders import safe_reply, PRIORITY_BACKGROUND
+from src.logger import logger, get_process_name
 
-_error_queue = []
+# Ошибки агрегируются по отпечатку (тип + нормализованный текст):
+# fingerprint -> {type, message, count, first_seen, last_seen, sample, processes}.
+# Каждый процесс копит их в ограниченном буфере и периодически сливает
+# в общий ERRORS_FILE, откуда берут данные ежедневный отчёт и веб-панель.
 
-def add_error_to_queue(err: str):
-    _error_queue.append(f"[{datetime.now(MSK_TZ).strftime('%Y-%m-%d %H:%M:%S')}] {err}")
+MAX_FINGERPRINTS = 200  # предел и для буфера процесса, и для общего файла
+MAX_MESSAGE_LEN = 300
+FLUSH_INTERVAL = 5.0  # сек
+REPORT_LIMIT = 50
+REPORT_MAX_CHARS = 4000  # лимит сообщения Telegram — 4096
+
+_pending = OrderedDict()
+_lock = threading.Lock()
+_flush_timer = None
+
+_NORMALIZE = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<hex>"),
+    (re.compile(r"\d+"), "N"),
+]
+
+def normalize_error(err) -> tuple[str, str]:
+    """Тип ошибки и текст без переменных частей (id, секунды, адреса)."""
+    err_type = type(err).__name__ if isinstance(err, BaseException) else "Error"
+    message = " ".join(str(err).split())[:MAX_MESSAGE_LEN]
+    for pattern, repl in _NORMALIZE:
+        message = pattern.sub(repl, message)
+    return err_type, message
+
+def add_error_to_queue(err, detail: str = ""):
+    """Учитывает ошибку (строку или исключение). Память не растёт при штормах ошибок."""
+    err_type, message = normalize_error(err)
+    key = f"{err_type}: {message}"
+    now = time.time()
+    with _lock:
+        entry = _pending.get(key)
+        if entry:
+            entry["count"] += 1
+            entry["last_seen"] = now
+            _pending.move_to_end(key)
+        else:
+            entry = _pending[key] = {
+                "type": err_type, "message": message, "count": 1,
+                "first_seen": now, "last_seen": now,
+            }
+        entry["sample"] = f"{detail}{err}"[:MAX_MESSAGE_LEN]
+        overflow = len(_pending) >= MAX_FINGERPRINTS
+        if not overflow:
+            _schedule_flush()
+    if overflow:
+        flush_errors()
+
+def _schedule_flush():
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(FLUSH_INTERVAL, flush_errors)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+def _trim(data: dict) -> dict:
+    if len(data) <= MAX_FINGERPRINTS:
+        return data
+    newest = sorted(data.items(), key=lambda kv: kv[1]["last_seen"], reverse=True)
+    return dict(newest[:MAX_FINGERPRINTS])
+
+def flush_errors():
+    """Сливает буфер процесса в общий файл ошибок."""
+    global _flush_timer
+    with _lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel()
+            _flush_timer = None
+        if not _pending:
+            return
+        batch = list(_pending.items())
+        _pending.clear()
+    process = get_process_name()
+    try:
+        with file_lock(ERRORS_FILE):
+            data = load_json(ERRORS_FILE, {})
+            for key, entry in batch:
+                current = data.get(key)
+                if current:
+                    current["count"] += entry["count"]
+                    current["last_seen"] = max(current["last_seen"], entry["last_seen"])
+                    current["sample"] = entry["sample"]
+                    if process not in current.setdefault("processes", []):
+                        current["processes"].append(process)
+                else:
+                    data[key] = {**entry, "processes": [process]}
+            save_json(ERRORS_FILE, _trim(data))
+    except Exception as e:
+        logger.error(f"flush_errors error: {e}")
+
+atexit.register(flush_errors)
+
+def get_errors() -> list[dict]:
+    """Общий список ошибок всех процессов, свежие первыми."""
+    flush_errors()
+    data = load_json(ERRORS_FILE, {})
+    return sorted(({"fingerprint": k, **v} for k, v in data.items()), key=lambda e: e["last_seen"], reverse=True)
+
+def _acknowledge(sent: list[dict]):
+    """Убирает из файла отправленное; ошибки, пришедшие после отправки, остаются."""
+    with file_lock(ERRORS_FILE):
+        data = load_json(ERRORS_FILE, {})
+        for entry in sent:
+            current = data.get(entry["fingerprint"])
+            if not current:
+                continue
+            current["count"] -= entry["count"]
+            if current["count"] <= 0:
+                data.pop(entry["fingerprint"])
+        save_json(ERRORS_FILE, data)
+
+def _fmt_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts, MSK_TZ).strftime('%Y-%m-%d %H:%M:%S')
 
 async def send_daily_error_report(app: Application):
-    if not _error_queue:
+    errors = get_errors()
+    if not errors:
         logger.info("Нет ошибок для отчёта.")
         return
-    text = "📋 Ежедневный отчёт об ошибках:\n\n" + "\n".join(_error_queue[-50:])
-    _error_queue.clear()
-    try:
-        await app.bot.send_message(chat_id=ADMIN_ID, text=text)
+    top = sorted(errors, key=lambda e: e["count"], reverse=True)[:REPORT_LIMIT]
+    header = "📋 Ежедневный отчёт об ошибках:\n"
+    more = f"\n… и ещё {len(errors)} видов ошибок"  # самая длинная строка-итог: место под неё держим всегда
+    budget = REPORT_MAX_CHARS - len(header) - len(more)
+    lines = []
+    for e in top:
+        line = (f"\n[{_fmt_ts(e['first_seen'])} … {_fmt_ts(e['last_seen'])}] ×{e['count']} "
+                f"({', '.join(e.get('processes', []))}) {e['fingerprint']}")
+        if len(line) > budget:
+            break  # строки не режем: лучше честно посчитать её в «ещё N»
+        lines.append(line)
+        budget -= len(line)
+    text = header + "".join(lines)
+    if len(errors) > len(lines):
+        text += f"\n… и ещё {len(errors) - len(lines)} видов ошибок"
+    if await safe_reply(app.bot, ADMIN_ID, text, priority=PRIORITY_BACKGROUND):
+        _acknowledge(errors)
         logger.info("Отчёт об ошибках отправлен админу.")
-    except Exception as e:
-        logger.error(f"Не удалось отправить отчёт админу: {e}")
+    else:
+        logger.error("Не удалось отправить отчёт админу")
 
 def start_daily_error_scheduler(app: Application):
     app.job_queue.run_daily(send_daily_error_report, time=REPORT_TIME, name="daily_error_report")
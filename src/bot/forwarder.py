@@ -1,30 +1,108 @@
 import asyncio
+import logging
 import os
+import signal
+import time
+import uuid
 from telethon import TelegramClient, events
 from telethon.errors import RPCError, FloodWaitError, ChannelPrivateError, UserAlreadyParticipantError
 from telethon.tl.functions.channels import JoinChannelRequest
+from telethon.utils import get_peer_id
 
-from src.config import API_ID, API_HASH, SESSION_NAME, GROUP_ID, TOPIC_FORWARD, CHANNELS_FILE, STATS_FILE
+from src.config import (API_ID, API_HASH, SESSION_NAME, GROUP_ID, TOPIC_FORWARD, CHANNELS_FILE, STATS_FILE,
+                        FORWARD_SCHEDULE_FILE, FORWARDER_STATE_FILE, FORWARD_DRAIN_TIMEOUT)
 from src.utils.utils import load_json, save_json, record_stat
-from src.logger import logger
-from src.bot.error_reporter import add_error_to_queue
+from src.utils.jsonstore import open_store, flush_all as flush_stores
+from src.logger import logger, setup_logging, log_sampled
+from src.bot.error_reporter import add_error_to_queue, flush_errors
+from src.utils.ipc import ControlServer
+from src.utils.heartbeat import heartbeat_loop, add_heartbeat_info
+from src.utils.metrics import counter, gauge, histogram, write_snapshot
+from src.utils.loop_monitor import monitor as loop_monitor, start_loop_monitor, register_loop_control
+from src.utils.profiler import register_profile_control
+from src.bot.send_scheduler import FairScheduler
+from src.bot import channel_import
+from src.services import rollup_service
+
+if __name__ == "__main__":
+    setup_logging("forwarder")
+
+# --- Metrics ---
+EVENTS = counter("forwarder_events_total", "Incoming NewMessage events")
+FORWARDED = counter("forwarder_messages_total", "Messages forwarded to the group", ["channel"])
+FORWARD_ERRORS = counter("forwarder_errors_total", "Forwarding failures", ["kind"])
+FLOOD_WAIT = counter("forwarder_flood_wait_seconds_total", "Seconds spent in FloodWait")
+SEND_SECONDS = histogram("forwarder_send_seconds", "Time to re-send one message to the group")
+CHANNELS_IMPORTED = counter("forwarder_channel_import_total", "Channels processed by bulk import", ["status"])
+MONITORED = gauge("forwarder_monitored_channels", "Channels resolved and monitored")
+MONITORED.set_function(lambda: len(monitored_entities))
 
 # --- Session ---
 SESSION_PATH = os.path.join(os.path.dirname(__file__), SESSION_NAME)
 client = TelegramClient(SESSION_PATH, API_ID, API_HASH)
 
+# --- Send scheduler: очередь на канал, ответы на команды — вне очереди ---
+scheduler = FairScheduler()
+
+async def reply(event, text):
+    return await scheduler.call(lambda: event.reply(text))
+
 # --- Channels ---
 channels = []
 monitored_entities = []  # Список entity для мониторинга
 
+def channels_store():
+    return open_store(CHANNELS_FILE, [])
+
 def reload_channels():
     global channels
-    channels = load_json(CHANNELS_FILE, [])
-    logger.info(f"Loaded {len(channels)} channels: {channels}")
+    channels = list(channels_store().get())
+    # Веса, лимиты и приоритеты каналов: {"default": {...}, "@channel": {"weight": 2, "rate_per_min": 10, "priority": 0}}
+    scheduler.configure(load_json(FORWARD_SCHEDULE_FILE, {}))
+    log_sampled("reload_channels", logging.INFO, f"Loaded {len(channels)} channels", interval=300)
+    logger.debug(f"Channels: {channels}")
     return channels
 
 reload_channels()
 
+# --- Checkpoint: тёплый рестарт без повторного resolve/join и без повторной пересылки ---
+CHECKPOINT_INTERVAL = 30  # сек; при остановке сохраняется ещё и очередь
+
+peer_cache = {}  # канал из channels.json -> peer id
+joined = set()  # каналы, в которые уже вступили
+last_ids = {}  # peer id -> id последнего пересланного сообщения
+restored_pending = []  # очередь прошлого запуска, ещё не поставленная заново
+shutting_down = False
+
+def load_checkpoint():
+    global restored_pending
+    if not os.path.exists(FORWARDER_STATE_FILE):
+        return
+    state = load_json(FORWARDER_STATE_FILE, {})
+    peer_cache.update(state.get("peers", {}))
+    joined.update(state.get("joined", []))
+    last_ids.update({int(peer): msg_id for peer, msg_id in state.get("last_ids", {}).items()})
+    forward_handler._counter = state.get("events", 0)
+    restored_pending = state.get("pending", [])
+    logger.info(f"♻️ Checkpoint: {len(peer_cache)} peers, {len(last_ids)} channels, "
+                f"{len(restored_pending)} pending forwards")
+
+def save_checkpoint(pending: list[dict] | None = None):
+    state = {
+        "saved_at": time.time(),
+        "events": getattr(forward_handler, "_counter", 0),
+        "peers": peer_cache,
+        "joined": sorted(joined),
+        "last_ids": {str(peer): msg_id for peer, msg_id in last_ids.items()},
+        "pending": restored_pending if pending is None else pending,
+    }
+    save_json(FORWARDER_STATE_FILE, state)
+
+async def checkpoint_loop():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        save_checkpoint()
+
 # --- Join channel helper ---
 async def try_join_channel(chan):
     try:
@@ -36,38 +114,177 @@ async def try_join_channel(chan):
             logger.info(f"Already participant in {chan}")
         except ChannelPrivateError:
             logger.warning(f"⚠️ Channel {chan} is private")
+            return entity
+        joined.add(chan)
+        peer_cache[chan] = get_peer_id(entity)
         return entity
+    except FloodWaitError:
+        raise
     except Exception as e:
         logger.warning(f"❌ Failed to join {chan}: {e}")
-        add_error_to_queue(str(e))
+        add_error_to_queue(e)
         return None
 
+JOIN_INTERVAL = 1  # сек между вступлениями
+
+async def join_channels(chans: list[str]):
+    """Вступает в каналы по одному; на FloodWait ждёт и продолжает."""
+    for chan in chans:
+        try:
+            await try_join_channel(chan)
+        except FloodWaitError as e:
+            logger.warning(f"⏳ Join FloodWait {e.seconds}s, waiting...")
+            FLOOD_WAIT.inc(e.seconds)
+            await asyncio.sleep(e.seconds)
+            try:
+                await try_join_channel(chan)
+            except FloodWaitError as e:
+                logger.warning(f"❌ Failed to join {chan}: FloodWait {e.seconds}s")
+        await asyncio.sleep(JOIN_INTERVAL)
+
 # --- Update monitored channels ---
-async def update_monitored_channels():
+async def update_monitored_channels(resolve: bool = False):
+    """resolve=True — заново запросить peer id всех каналов, а не брать из кеша."""
     global monitored_entities
     monitored_entities = []
     reload_channels()
+    if resolve:
+        peer_cache.clear()
     if not channels:
         logger.warning("No channels to monitor")
         return
 
-    logger.info(f"🔄 Updating monitored channels: {channels}")
+    logger.debug(f"🔄 Updating monitored channels: {channels}")
     for chan in channels:
+        # peer id из чекпоинта/прошлого обновления — без запроса get_entity
+        peer_id = peer_cache.get(chan)
+        if peer_id is None:
+            try:
+                peer_id = peer_cache[chan] = get_peer_id(await client.get_entity(chan))
+            except Exception as e:
+                logger.warning(f"❌ Cannot get entity for {chan}: {e}")
+                continue
+        monitored_entities.append(peer_id)
+        logger.debug(f"✓ Monitoring: {chan} (Peer ID: {peer_id})")
+    for chan in [chan for chan in peer_cache if chan not in channels]:
+        del peer_cache[chan]
+        joined.discard(chan)
+    log_sampled("monitored_entities", logging.INFO,
+                f"📡 Total monitored entities: {len(monitored_entities)}", interval=300)
+    logger.debug(f"Monitored IDs: {monitored_entities}")
+
+# --- Bulk import ---
+import_lock = asyncio.Lock()
+background_tasks = set()
+
+async def import_channels(text: str, progress=None, replace: str | None = None) -> dict:
+    """
+    Добавляет список каналов: проверка в Telegram (channel_import), в channels.json —
+    одной операцией и только найденные. Отчёт — статус каждого элемента списка.
+    replace — канал, который заменяет найденный (правка из панели): новое имя
+    встаёт на его место; если канал уже отслеживается под другим именем, старое удаляется.
+    """
+    if import_lock.locked():
+        raise RuntimeError("channel import is already running")
+    async with import_lock:
+        started = time.monotonic()
+        tokens = channel_import.parse_channels(text)
+        existing = [chan for chan in reload_channels() if chan != replace]
+        items, peers = await channel_import.resolve_channels(client, tokens, existing, progress)
+        known_peers = {peer for chan, peer in peer_cache.items() if chan != replace}
+        added = []
+        replaced = False
+        with channels_store().transaction() as tx:
+            # Пока шла проверка, каналы могли добавить из панели; ссылка и username одного канала — тоже повтор
+            present = {channel_import.channel_key(chan) for chan in tx.data if chan != replace}
+            for item in items:
+                if item["status"] != channel_import.RESOLVED:
+                    continue
+                chan = item["channel"]
+                if channel_import.channel_key(chan) in present or peers[chan] in known_peers:
+                    item["status"] = channel_import.PRESENT
+                    continue
+                present.add(channel_import.channel_key(chan))
+                known_peers.add(peers[chan])
+                added.append(chan)
+            if replace in tx.data and (added or any(item["status"] == channel_import.PRESENT for item in items)):
+                if added:
+                    tx.set(tx.data.index(replace), added[0])
+                    if added[1:]:
+                        tx.extend(added[1:])
+                else:
+                    tx.remove(replace)
+                replaced = True
+            elif added:
+                tx.extend(added)
+        for item in items:
+            CHANNELS_IMPORTED.labels(item["status"]).inc()
+        if added or replaced:
+            # peer id уже известны — мониторинг без повторного resolve, вступление — фоном
+            peer_cache.update({chan: peers[chan] for chan in added})
+            await update_monitored_channels()
+            task = asyncio.create_task(join_channels(added))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        counts = channel_import.summarize(items)
+        logger.info(f"📥 Channel import: {len(added)} added of {len(tokens)} "
+                    f"({', '.join(f'{k}={v}' for k, v in counts.items() if v)}) in {time.monotonic() - started:.1f}s")
+        return {"added": added, "replaced": replace if replaced else None, "counts": counts, "items": items,
+                "elapsed": round(time.monotonic() - started, 1)}
+
+# --- Импорт из веб-панели: фоновое задание, панель опрашивает его ход ---
+IMPORT_JOBS_KEEP = 20  # завершённых заданий храним для опроса
+import_jobs: dict[str, dict] = {}
+
+def start_import_job(text: str, replace: str | None = None) -> dict:
+    tokens = channel_import.parse_channels(text)
+    if not tokens:
+        raise ValueError("no channels in the list")
+    if len(tokens) > channel_import.CHANNEL_IMPORT_LIMIT:
+        raise ValueError(f"too many channels: {len(tokens)} > {channel_import.CHANNEL_IMPORT_LIMIT}, split the list")
+    # Без await между проверкой и регистрацией: второй запрос увидит это задание
+    if import_lock.locked() or any(job["state"] == "running" for job in import_jobs.values()):
+        raise RuntimeError("channel import is already running")
+    job = {
+        "id": uuid.uuid4().hex[:12], "state": "running", "total": len(tokens), "checked": 0, "to_check": None,
+        "started": time.time(), "estimate": round(channel_import.estimate_seconds(len(tokens)), 1),
+    }
+    import_jobs[job["id"]] = job
+    for old in [key for key, item in import_jobs.items() if item["state"] != "running"][:-IMPORT_JOBS_KEEP]:
+        del import_jobs[old]
+
+    def progress(checked: int, to_check: int):
+        job.update(checked=checked, to_check=to_check)
+
+    async def run():
         try:
-            entity = await client.get_entity(chan)
-            # Важно: для каналов ID всегда отрицательный в event.chat_id
-            chat_id = -1000000000000 - entity.id if entity.id > 1000000000000 else -entity.id
-            # Но проще: просто используем input_peer_to_peer_id или get_peer_id
-            from telethon.utils import get_peer_id
-            peer_id = get_peer_id(entity)
-            monitored_entities.append(peer_id)
-            logger.info(f"✓ Monitoring: {chan} (Peer ID: {peer_id})")
+            job["report"] = await import_channels(text, progress, replace)
+            job["state"] = "done"
         except Exception as e:
-            logger.warning(f"❌ Cannot get entity for {chan}: {e}")
-    logger.info(f"📡 Total monitored entities: {len(monitored_entities)} - IDs: {monitored_entities}")
+            logger.exception(f"Channel import {job['id']} failed: {e}")
+            job.update(state="error", error=str(e))
+
+    task = asyncio.create_task(run(), name=f"channel_import:{job['id']}")
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return job
+
+IMPORT_FILE_LIMIT = 256 * 1024  # байт; список на 500 каналов — несколько КБ
+
+async def import_text(event, text: str) -> str:
+    """Текст после команды плюс приложенный к команде (или к сообщению, на которое она отвечает) файл."""
+    message = event.message if event.message.file else await event.get_reply_message()
+    if message is not None and message.file:
+        if not (message.file.mime_type or "").startswith("text/") and message.file.ext not in (".txt", ".csv"):
+            raise ValueError("expected a text file (.txt/.csv) with one channel per line")
+        if (message.file.size or 0) > IMPORT_FILE_LIMIT:
+            raise ValueError(f"file is too large (> {IMPORT_FILE_LIMIT // 1024} KB)")
+        data = await message.download_media(bytes)
+        text = f"{text}\n{data.decode('utf-8-sig', errors='replace')}"
+    return text
 
 # --- Command handler ---
-@client.on(events.NewMessage(pattern=r"^/channels(?:\s.*)?$", chats=GROUP_ID))
+@client.on(events.NewMessage(pattern=r"(?s)^/channels(?:\s.*)?$", chats=GROUP_ID))
 async def channels_command(event):
     try:
         text = event.raw_text.strip()
@@ -76,45 +293,68 @@ async def channels_command(event):
         if len(parts) == 1:
             reload_channels()
             if channels:
-                await event.reply("📋 Отслеживаемые каналы:\n" + "\n".join(f"• {ch}" for ch in channels))
+                await reply(event, "📋 Отслеживаемые каналы:\n" + "\n".join(f"• {ch}" for ch in channels))
             else:
-                await event.reply("📋 Список каналов пуст. Добавьте канал: /channels add @username")
+                await reply(event, "📋 Список каналов пуст. Добавьте канал: /channels add @username")
             return
 
         cmd = parts[1].lower()
-        if cmd == "add" and len(parts) >= 3:
-            chan = parts[2]
-            reload_channels()
-            if chan not in channels:
-                channels.append(chan)
-                save_json(CHANNELS_FILE, channels)
-                entity = await try_join_channel(chan)
-                # Обновляем список мониторинга
-                await update_monitored_channels()
-                await event.reply(f"✅ Канал {chan} добавлен и мониторится")
+        if cmd == "add" and len(parts) == 3:
+            # Один канал: тоже через проверку, чтобы опечатка не попала в channels.json
+            try:
+                report = await import_channels(parts[2])
+            except (ValueError, RuntimeError) as e:
+                await reply(event, f"⚠️ {e}")
+                return
+            if not report["items"]:
+                # Слово вроде "channel" parse_channels отбрасывает как заголовок списка
+                await reply(event, f"⚠️ {parts[2]} — не username канала. Пример: /channels add @username")
+                return
+            item = report["items"][0]
+            if report["added"]:
+                await reply(event, f"✅ Канал {item['channel']} добавлен и мониторится")
+            elif item["status"] == channel_import.PRESENT:
+                await reply(event, f"⚠️ Канал {parts[2]} уже есть")
             else:
-                await event.reply(f"⚠️ Канал {chan} уже есть")
+                await reply(event, channel_import.format_report(report))
+        elif cmd in ("add", "import"):
+            payload = text.split(None, 2)[2] if len(parts) >= 3 else ""
+            try:
+                tokens = channel_import.parse_channels(await import_text(event, payload))
+                if not tokens:
+                    await reply(event, "⚠️ Пустой список. Каналы — в тексте команды или файлом (.txt/.csv)")
+                    return
+                if 1 < len(tokens) <= channel_import.CHANNEL_IMPORT_LIMIT:
+                    await reply(event, f"⏳ Проверяю {len(tokens)} каналов, "
+                                       f"около {channel_import.estimate_seconds(len(tokens)):.0f} сек...")
+                report = await import_channels("\n".join(tokens))
+            except (ValueError, RuntimeError) as e:
+                await reply(event, f"⚠️ {e}")
+                return
+            await reply(event, channel_import.format_report(report))
         elif cmd == "remove" and len(parts) >= 3:
             chan = parts[2]
-            reload_channels()
-            if chan in channels:
-                channels.remove(chan)
-                save_json(CHANNELS_FILE, channels)
+            with channels_store().transaction() as tx:
+                removed = chan in tx.data
+                if removed:
+                    tx.remove(chan)
+            if removed:
                 # Обновляем список мониторинга
                 await update_monitored_channels()
-                await event.reply(f"❌ Канал {chan} удалён")
+                await reply(event, f"❌ Канал {chan} удалён")
             else:
-                await event.reply(f"⚠️ Канал {chan} не найден")
+                await reply(event, f"⚠️ Канал {chan} не найден")
         else:
-            await event.reply(
+            await reply(event,
                 "**Управление каналами:**\n"
                 "/channels — показать список\n"
                 "/channels add @username — добавить\n"
+                "/channels import @a @b ... — добавить списком (или файлом .txt/.csv с этой подписью)\n"
                 "/channels remove @username — удалить"
             )
     except Exception as e:
         logger.exception(f"channels_command error: {e}")
-        add_error_to_queue(str(e))
+        add_error_to_queue(e)
 
 # --- Forward handler ---
 @client.on(events.NewMessage(incoming=True))
@@ -123,6 +363,9 @@ async def forward_handler(event):
         if not hasattr(forward_handler, '_counter'):
             forward_handler._counter = 0
         forward_handler._counter += 1
+        EVENTS.inc()
+        if shutting_down:
+            return  # новые события не берём: очередь уже досылается и сохраняется
         
         # Периодическое обновление списка каналов
         if forward_handler._counter % 100 == 0:
@@ -156,64 +399,174 @@ async def forward_handler(event):
         else:
             matched_channel = chat_id
 
-        logger.info(f"🔄 Forwarding from {matched_channel} (ID: {event.chat_id})")
+        msg_id = getattr(event.message, "id", None)
+        if msg_id is not None and msg_id <= last_ids.get(event.chat_id, 0):
+            return  # уже переслано до рестарта (повторная доставка апдейта)
+
+        # Формируем подпись канала
+        if chat_username:
+            channel_link = f"@{chat_username}"
+        elif chat_title:
+            channel_link = chat_title
+        else:
+            channel_link = f"ID: {chat_id}"
+
+        logger.debug(f"🔄 Queued from {matched_channel} (ID: {event.chat_id})")
+        return submit_forward(event.message, event.chat_id, matched_channel, channel_link)
+
+    except Exception as e:
+        logger.exception(f"Critical forward_handler error: {e}")
+        add_error_to_queue(e)
+
+# --- Отправка одного сообщения (вызывает планировщик) ---
+def submit_forward(message, peer_id, matched_channel, channel_link):
+    """В очередь канала; meta позволяет сохранить задание при остановке и поднять после рестарта."""
+    msg_id = getattr(message, "id", None)
+    meta = {"peer": peer_id, "id": msg_id, "channel": matched_channel, "link": channel_link} if msg_id else None
+    # Отправка — через планировщик: свой канал не обгонит, чужие не задержит
+    return scheduler.submit(matched_channel,
+                            lambda: send_forward(message, peer_id, matched_channel, channel_link), meta)
+
+async def send_forward(message, peer_id, matched_channel, channel_link):
+    try:
+        # Получаем текст оригинального сообщения
+        original_text = message.text or ""
+        footer = f"\n\n📢 Переслано из канала: {channel_link}"
+        
+        send_started = time.perf_counter()
+        # Если это медиа, пересылаем с подписью
+        if message.media:
+            new_caption = (message.text or "") + footer
+            kwargs = {
+                "entity": GROUP_ID,
+                "file": message.media,
+                "message": new_caption,
+                "silent": True
+            }
+            if TOPIC_FORWARD:
+                kwargs["reply_to"] = TOPIC_FORWARD
+            await client.send_file(**kwargs)
+        else:
+            # Если это текстовое сообщение
+            new_text = original_text + footer
+            kwargs = {
+                "entity": GROUP_ID,
+                "message": new_text,
+                "silent": True
+            }
+            if TOPIC_FORWARD:
+                kwargs["reply_to"] = TOPIC_FORWARD
+            await client.send_message(**kwargs)
+        
+        SEND_SECONDS.observe(time.perf_counter() - send_started)
+        FORWARDED.labels(matched_channel).inc()
+        record_stat(STATS_FILE, matched_channel)
+        rollup_service.record(matched_channel)
+        msg_id = getattr(message, "id", None)
+        if msg_id and msg_id > last_ids.get(peer_id, 0):
+            last_ids[peer_id] = msg_id
+        log_sampled(f"forwarded:{matched_channel}", logging.INFO, f"✅ Forwarded from {matched_channel} (silent)")
+        return True
+        
+    except FloodWaitError as e:
+        logger.warning(f"⏳ FloodWait {e.seconds}s")
+        FORWARD_ERRORS.labels("flood_wait").inc()
+        FLOOD_WAIT.inc(e.seconds)
+        add_error_to_queue(f"Forwarder FloodWait {e.seconds}s: {matched_channel}")
+        raise  # планировщик приостановит все отправки и повторит это сообщение
         
+    except RPCError as e:
+        logger.error(f"RPCError forwarding from {matched_channel}: {e}")
+        FORWARD_ERRORS.labels("rpc").inc()
+        add_error_to_queue(f"Forwarder RPCError: {e}")
+    except Exception as e:
+        logger.exception(f"Forwarding error from {matched_channel}: {e}")
+        FORWARD_ERRORS.labels("other").inc()
+        add_error_to_queue(e)
+
+# --- Очередь прошлого запуска ---
+async def replay_pending():
+    """Ставит в очередь задания, сохранённые при остановке: сообщения перечитываются по id."""
+    global restored_pending
+    pending, restored_pending = restored_pending, []
+    by_peer = {}
+    for item in pending:
+        by_peer.setdefault(item["peer"], []).append(item)
+    queued = 0
+    for peer_id, items in by_peer.items():
         try:
-            # Получаем текст оригинального сообщения
-            original_text = event.message.text or ""
-            
-            # Формируем подпись канала
-            if chat_username:
-                channel_link = f"@{chat_username}"
-            elif chat_title:
-                channel_link = chat_title
-            else:
-                channel_link = f"ID: {chat_id}"
-            
-            footer = f"\n\n📢 Переслано из канала: {channel_link}"
-            
-            # Если это медиа, пересылаем с подписью
-            if event.message.media:
-                new_caption = (event.message.text or "") + footer
-                kwargs = {
-                    "entity": GROUP_ID,
-                    "file": event.message.media,
-                    "message": new_caption,
-                    "silent": True
-                }
-                if TOPIC_FORWARD:
-                    kwargs["reply_to"] = TOPIC_FORWARD
-                await client.send_file(**kwargs)
-            else:
-                # Если это текстовое сообщение
-                new_text = original_text + footer
-                kwargs = {
-                    "entity": GROUP_ID,
-                    "message": new_text,
-                    "silent": True
-                }
-                if TOPIC_FORWARD:
-                    kwargs["reply_to"] = TOPIC_FORWARD
-                await client.send_message(**kwargs)
-            
-            record_stat(STATS_FILE, matched_channel)
-            logger.info(f"✅ Forwarded from {matched_channel} (silent)")
-            
-        except FloodWaitError as e:
-            logger.warning(f"⏳ FloodWait {e.seconds}s")
-            add_error_to_queue(f"Forwarder FloodWait {e.seconds}s: {matched_channel}")
-            await asyncio.sleep(e.seconds)
-            
-        except RPCError as e:
-            logger.error(f"RPCError forwarding from {matched_channel}: {e}")
-            add_error_to_queue(f"Forwarder RPCError: {e}")
+            messages = await client.get_messages(peer_id, ids=[item["id"] for item in items])
         except Exception as e:
-            logger.exception(f"Forwarding error from {matched_channel}: {e}")
-            add_error_to_queue(str(e))
-                
-    except Exception as e:
-        logger.exception(f"Critical forward_handler error: {e}")
-        add_error_to_queue(str(e))
+            logger.warning(f"❌ Cannot fetch pending messages from {items[0]['channel']}: {e}")
+            add_error_to_queue(e)
+            restored_pending.extend(items)  # останутся в чекпоинте до следующей попытки
+            continue
+        for item, message in zip(items, messages):
+            if message is None:
+                continue  # удалено, пока forwarder не работал
+            submit_forward(message, peer_id, item["channel"], item["link"])
+            queued += 1
+    if pending:
+        logger.info(f"♻️ Re-queued {queued}/{len(pending)} pending forwards")
+
+# --- Остановка ---
+async def shutdown(reason: str):
+    """
+    SIGTERM/SIGINT: новые события не берём, очередь досылаем до FORWARD_DRAIN_TIMEOUT,
+    недосланное и прогресс каналов — в чекпоинт, затем отключаемся.
+    """
+    global shutting_down
+    if shutting_down:
+        return
+    shutting_down = True
+    logger.info(f"🛑 {reason}: draining {scheduler.depth()} queued forwards (up to {FORWARD_DRAIN_TIMEOUT:g}s)")
+    pending = await scheduler.drain(FORWARD_DRAIN_TIMEOUT)
+    save_checkpoint(restored_pending + pending)
+    if pending:
+        logger.warning(f"💾 {len(pending)} forwards not sent in time, saved for next start")
+    flush_stores()  # stats.json/channels.json: журнал — в снимок
+    flush_errors()
+    write_snapshot("forwarder")
+    await control.stop()
+    await client.disconnect()
+
+# --- Control socket (веб-панель -> forwarder) ---
+control = ControlServer("forwarder")
+
+@control.command("reload")
+async def control_reload(resolve: bool = False):
+    await update_monitored_channels(resolve=resolve)
+    return {"channels": len(channels), "monitored": len(monitored_entities)}
+
+@control.command("status")
+async def control_status():
+    return {
+        **(await control.handlers["ping"]()),
+        "connected": client.is_connected(),
+        "channels": len(channels),
+        "monitored": len(monitored_entities),
+        "events": getattr(forward_handler, "_counter", 0),
+        "queued": scheduler.depth(),
+        "loop": loop_monitor.lag_summary(),
+    }
+
+@control.command("import_channels")
+async def control_import_channels(text: str, replace: str | None = None):
+    """Запускает добавление каналов в фоне (replace — правка одного канала); ход и отчёт — import_status."""
+    return start_import_job(text, replace)
+
+@control.command("import_status")
+async def control_import_status(job: str):
+    """Ход импорта: checked/to_check, по завершении — отчёт (None — задание не найдено)."""
+    return import_jobs.get(job)
+
+@control.command("queues")
+async def control_queues():
+    """Глубина очередей и ожидание по каналам — для подбора весов в forward_schedule.json."""
+    return scheduler.snapshot()
+
+register_loop_control(control)
+register_profile_control(control)
 
 # --- Run forwarder ---
 async def run_forwarder():
@@ -222,34 +575,60 @@ async def run_forwarder():
         logger.error(f"Session file not found: {session_file}")
         raise FileNotFoundError(f"Session file not found: {session_file}")
 
-    while True:
+    load_checkpoint()
+    rollup_service.backfill(STATS_FILE)  # до client.start(): пересылок ещё нет
+    loop = asyncio.get_running_loop()
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda sig=sig: stopping.append(asyncio.create_task(shutdown(sig.name))))
+
+    await control.start()
+    add_heartbeat_info("connected", client.is_connected)
+    add_heartbeat_info("monitored", lambda: len(monitored_entities))
+    add_heartbeat_info("queued", scheduler.depth)
+    add_heartbeat_info("loop", loop_monitor.lag_summary)
+    start_loop_monitor()
+    heartbeat = asyncio.create_task(heartbeat_loop("forwarder"))
+    checkpoint = asyncio.create_task(checkpoint_loop())
+    while not shutting_down:
         try:
             await client.start()
             me = await client.get_me()
             logger.info(f"✅ Logged in as: {me.first_name} (@{me.username})")
             
-            # Загружаем и подписываемся на все каналы
+            # Подписываемся на каналы, в которые ещё не вступали (остальные — из чекпоинта)
             reload_channels()
-            if channels:
-                logger.info(f"📡 Joining {len(channels)} channels...")
-                for ch in channels:
-                    await try_join_channel(ch)
-                    await asyncio.sleep(1)
+            to_join = [ch for ch in channels if ch not in joined]
+            if to_join:
+                logger.info(f"📡 Joining {len(to_join)} channels...")
+                await join_channels(to_join)
             
             # Обновляем список мониторинга
             await update_monitored_channels()
+            if restored_pending:
+                await replay_pending()
             
             logger.info("🚀 Forwarder running...")
             logger.info(f"👀 Watching {len(monitored_entities)} channels")
             await client.run_until_disconnected()
         except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+            if shutting_down:
+                break
             logger.warning(f"Connection lost: {e}. Reconnecting in 10s...")
-            add_error_to_queue(str(e))
+            add_error_to_queue(e)
             await asyncio.sleep(10)
         except Exception as e:
+            if shutting_down:
+                break
             logger.exception(f"Critical forwarder error: {e}")
-            add_error_to_queue(str(e))
+            add_error_to_queue(e)
             await asyncio.sleep(10)
 
+    if stopping:
+        await stopping[0]
+    checkpoint.cancel()
+    heartbeat.cancel()
+    logger.info("👋 Forwarder stopped")
+
 if __name__ == "__main__":
-    asyncio.run(run_forwarder())
\ No newline at end of file
+    asyncio.run(run_forwarder())
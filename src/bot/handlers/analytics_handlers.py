@@ -0,0 +1,86 @@
+import asyncio
+import math
+import re
+from datetime import datetime
+from telegram import Update
+from telegram.ext import ContextTypes
+from src.services.records_service import tenant_of, set_bodyweight, load_bodyweights
+from src.services.analytics_service import analytics
+from src.utils.safe_senders import safe_reply
+import src.config as config
+
+BW_RE = re.compile(r"^(\d+(?:[.,]\d+)?)\s*(?:кг|kg)?\s*([мmжfw])?", re.IGNORECASE)
+SEX_MAP = {"м": "m", "m": "m", "ж": "f", "f": "f", "w": "f"}
+
+def _display_name(user) -> str:
+    return f"@{user.username}" if user.username else user.full_name
+
+async def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    thread_id = getattr(update.message, "message_thread_id", None)
+    await safe_reply(context.bot, update.effective_chat.id, text, thread_id=thread_id or config.TOPIC_FORWARD)
+
+async def _analytics(update: Update):
+    # Первый расчёт по большой истории — в потоке, дальше из кеша/инкрементально
+    return await asyncio.to_thread(analytics.get, tenant_of(update.message))
+
+async def bw_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bw 82.5 [м|ж] — собственный вес для DOTS; без аргументов — показать текущий."""
+    tenant = tenant_of(update.message)
+    username = _display_name(update.effective_user)
+    m = BW_RE.match(" ".join(context.args or []))
+    if not m:
+        current = (await asyncio.to_thread(load_bodyweights, tenant)).get(username)
+        text = (f"⚖️ {username}: {current['bodyweight']} кг" if current else "⚖️ Вес не указан") + \
+            "\nПример: /bw 82.5 или /bw 60 ж"
+        await _reply(update, context, text)
+        return
+    bodyweight = float(m.group(1).replace(",", "."))
+    if not 30 <= bodyweight <= 300:
+        await _reply(update, context, "⚠️ Вес должен быть от 30 до 300 кг")
+        return
+    sex = SEX_MAP.get((m.group(2) or "м").lower(), "m")
+    await set_bodyweight(tenant, username, bodyweight, sex, datetime.now().strftime("%d.%m.%Y"))
+    await _reply(update, context, f"✅ {username}: собственный вес {bodyweight} кг")
+
+async def dots_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/dots — рейтинг по DOTS (сумма e1RM жима, приседа и тяги относительно веса)."""
+    users = (await _analytics(update)).users
+    rated = users[users["dots"].notna()].head(10)
+    if rated.empty:
+        await _reply(update, context, "Нет данных для DOTS: укажите вес командой /bw 82.5")
+        return
+    lines = ["🏋️ Рейтинг DOTS:"] + [
+        f"{i}. {user} — {row.dots:.1f} (сумма {row.total:.0f} кг, вес {row.bodyweight:g})"
+        for i, (user, row) in enumerate(rated.iterrows(), 1)
+    ]
+    await _reply(update, context, "\n".join(lines))
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats [@user] — лучшие e1RM по движениям, перцентиль в группе и прогресс."""
+    user = context.args[0] if context.args else _display_name(update.effective_user)
+    result = await _analytics(update)
+    lifts = result.user_lifts(user)
+    if lifts.empty:
+        await _reply(update, context, f"Нет записей для {user}")
+        return
+    lines = [f"📈 {user}:"]
+    for row in lifts.itertuples():
+        progress = f", {row.progress_month:+.1f} кг/мес" if not math.isnan(row.progress_month) else ""
+        lines.append(f"{row.movement}: e1RM {row.best:.1f} кг, перцентиль {row.percentile:.0f}{progress}")
+    if user in result.users.index:
+        summary = result.users.loc[user]
+        if not math.isnan(summary["dots"]):
+            lines.append(f"DOTS: {summary['dots']:.1f}")
+    await _reply(update, context, "\n".join(lines))
+
+async def progress_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/progress — самый быстрый прирост e1RM (кг в месяц)."""
+    top = (await _analytics(update)).top_progress(10)
+    if top.empty:
+        await _reply(update, context, "Мало данных: нужно хотя бы два подхода в разные дни")
+        return
+    lines = ["🚀 Прогресс (e1RM, кг/мес):"] + [
+        f"{i}. {row.user} — {row.movement}: {row.progress_month:+.1f} ({row.change_pct:+.0f}%)"
+        for i, row in enumerate(top.itertuples(), 1)
+    ]
+    await _reply(update, context, "\n".join(lines))
@@ -4,8 +4,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-MAX_ERROR_LEN = 1000  # максимальная длина строки ошибки в очереди
-
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок: логируем и добавляем в очередь для ежедневного отчёта."""
     err = context.error
@@ -17,15 +15,11 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
             user_id = getattr(getattr(update, "effective_user", None), "id", None)
             update_info = f"[chat_id={chat_id} user_id={user_id}] "
 
-        error_text = f"{update_info}{str(err)}"
-        if len(error_text) > MAX_ERROR_LEN:
-            error_text = error_text[:MAX_ERROR_LEN] + " ... [truncated]"
-
         # Логируем локально
         logger.exception("⚠️ Sil bot error: %s", err)
 
-        # Добавляем в очередь для ежедневного отчёта админу
-        add_error_to_queue(error_text)
+        # Добавляем в очередь для ежедневного отчёта админу (агрегируется по типу ошибки)
+        add_error_to_queue(err, detail=update_info)
 
     except Exception as e:
         # Если сам обработчик упал — хотя бы залогируем
@@ -1,7 +1,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from src.utils.safe_senders import safe_reply
-import src.config
+import src.config as config
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (
@@ -9,9 +9,14 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 			"/sil — добавить рекорд (Жим / Присед / Тяга / Свое движение)\n" 
 			"/top — топ по сумме\n"
 			"/table — таблица PNG\n" 
+			"/bw 82.5 [м|ж] — свой вес (для DOTS)\n"
+			"/dots — рейтинг по DOTS\n"
+			"/stats [@user] — e1RM, место в группе, прогресс\n"
+			"/progress — кто быстрее прибавляет\n"
 			"/help — список команд\n\n" 
 			"Forwarder команды:\n" 
 			"/channels add @username\n" 
+			"/channels import @a @b ... (или файл .txt/.csv)\n"
 			"/channels remove @username"
     )
     thread_id = getattr(update.message, "message_thread_id", None)
@@ -1,11 +1,16 @@
 import re
+import time
 from datetime import datetime, timezone
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
-from src.services.records_service import load_records, save_records
+from src.services.records_service import upsert_record, tenant_of
+from src.services.ephemeral_service import ephemeral
 from src.utils.safe_senders import safe_reply
 from src.logger import logger
-import src.config
+import src.config as config
+
+# "100", "87.5кг", "100x5", "100 на 5" — вес и (необязательно) повторения для оценки 1ПМ
+WEIGHT_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:кг|kg)?(?:\s*(?:[xх×*]|на)\s*(\d+))?", re.IGNORECASE)
 
 MOVE_MAP = {
     "bench": "Жим",
@@ -22,35 +27,35 @@ async def sil_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     thread_id = getattr(update.message, "message_thread_id", None)
-    sent = await safe_reply(context.bot, update.effective_chat.id, "Выбери движение 💪",
+    chat_id = update.effective_chat.id
+    await ephemeral.discard(context.bot, chat_id, update.effective_user.id)
+    context.user_data["flow_ts"] = time.time()
+    sent = await safe_reply(context.bot, chat_id, "Выбери движение 💪",
                             thread_id=thread_id or config.TOPIC_FORWARD, reply_markup=reply_markup)
     if sent:
-        context.user_data["bot_msgs"] = [sent.message_id]
+        ephemeral.register(chat_id, sent.message_id, owner=update.effective_user.id)
 
 async def callback_movement(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     data = query.data
     context.user_data["movement"] = data
+    context.user_data["flow_ts"] = time.time()
 
-    for mid in context.user_data.get("bot_msgs", []):
-        try:
-            await context.bot.delete_message(query.message.chat_id, mid)
-        except Exception:
-            pass
+    chat_id = query.message.chat_id
+    user_id = update.effective_user.id
+    await ephemeral.discard(context.bot, chat_id, user_id)
 
     thread_id = getattr(query.message, "message_thread_id", None)
     if data == "custom":
-        sent = await safe_reply(context.bot, query.message.chat_id, "Введи название упражнения:",
+        sent = await safe_reply(context.bot, chat_id, "Введи название упражнения:",
                                 thread_id=thread_id or config.TOPIC_FORWARD)
         context.user_data["waiting_for_custom_name"] = True
-        if sent:
-            context.user_data["bot_msgs"] = [sent.message_id]
     else:
-        sent = await safe_reply(context.bot, query.message.chat_id, "Введи вес в кг:",
+        sent = await safe_reply(context.bot, chat_id, "Введи вес в кг (можно с повторами: 100x5):",
                                 thread_id=thread_id or config.TOPIC_FORWARD)
-        if sent:
-            context.user_data["bot_msgs"] = [sent.message_id]
+    if sent:
+        ephemeral.register(chat_id, sent.message_id, owner=user_id)
 
 async def handle_text_for_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
@@ -61,24 +66,28 @@ async def handle_text_for_weight(update: Update, context: ContextTypes.DEFAULT_T
     if context.user_data.get("waiting_for_custom_name"):
         context.user_data["custom_name"] = text
         context.user_data.pop("waiting_for_custom_name")
-        sent = await safe_reply(context.bot, update.message.chat_id,
+        context.user_data["flow_ts"] = time.time()
+        chat_id = update.message.chat_id
+        await ephemeral.discard(context.bot, chat_id, update.effective_user.id)
+        sent = await safe_reply(context.bot, chat_id,
                                 f"Теперь введи вес для {text} (пример: 100кг):",
                                 thread_id=thread_id or config.TOPIC_FORWARD)
         if sent:
-            context.user_data["bot_msgs"] = [sent.message_id]
+            ephemeral.register(chat_id, sent.message_id, owner=update.effective_user.id)
         return
 
     if "movement" not in context.user_data:
         return
 
-    m = re.search(r"(\d+[.,]?\d*)", text)
+    m = WEIGHT_RE.search(text)
     if not m:
         await safe_reply(context.bot, update.effective_chat.id,
-                         "⚠️ Вес не распознан. Пример: 100 или 87.5",
+                         "⚠️ Вес не распознан. Пример: 100, 87.5 или 100x5",
                          thread_id=thread_id)
         return
 
     weight = float(m.group(1).replace(",", "."))
+    reps = int(m.group(2)) if m.group(2) else None
     movement_key = context.user_data.get("movement")
     movement_name = context.user_data.get("custom_name", "Другое") if movement_key == "custom" else MOVE_MAP.get(movement_key, "Другое")
     user = update.effective_user
@@ -89,17 +98,18 @@ async def handle_text_for_weight(update: Update, context: ContextTypes.DEFAULT_T
         "weight": weight,
         "date": datetime.now().strftime("%d.%m.%Y")
     }
-    records = load_records()
-    records = [r for r in records if not (r["user"] == username and r["movement"] == movement_name)]
-    records.append(record)
-    save_records(records)
+    if reps:
+        record["reps"] = reps
+    try:
+        await upsert_record(tenant_of(update.message), record)
+    except OSError:
+        # Диалог не сбрасываем: пользователь может отправить вес ещё раз
+        await safe_reply(context.bot, update.effective_chat.id,
+                         "⚠️ Не удалось сохранить запись, попробуйте ещё раз", thread_id=thread_id)
+        return
 
-    for mid in context.user_data.get("bot_msgs", []):
-        try:
-            await context.bot.delete_message(update.message.chat_id, mid)
-        except Exception:
-            pass
+    await ephemeral.discard(context.bot, update.message.chat_id, user.id)
     context.user_data.clear()
 
-    msg = f"✅ Записано: {username} — {weight} кг в {movement_name.upper()}"
+    msg = f"✅ Записано: {username} — {weight} кг{f' x {reps}' if reps else ''} в {movement_name.upper()}"
     await safe_reply(context.bot, update.message.chat_id, msg, thread_id=thread_id or config.TOPIC_FORWARD)
@@ -1,12 +1,12 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from src.services.records_service import load_records
+from src.services.records_service import records_store, tenant_of
 from src.utils.safe_senders import safe_reply, safe_reply_photo
 from src.utils.rendering import render_table_image
-import src.config
+import src.config as config
 
 async def top_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    records = load_records()
+    records = await records_store.records(tenant_of(update.message))
     totals = {}
     for r in records:
         totals.setdefault(r["user"], 0)
@@ -17,7 +17,7 @@ async def top_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await safe_reply(context.bot, update.effective_chat.id, "\n".join(lines), thread_id=thread_id or config.TOPIC_FORWARD)
 
 async def table_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    records = load_records()
+    records = await records_store.records(tenant_of(update.message))
     buf = render_table_image(records)
     thread_id = getattr(update.message, "message_thread_id", None)
     await safe_reply_photo(context.bot, update.effective_chat.id, buf, "📊 Таблица рекордов",
@@ -1,49 +1,91 @@
 import os
 from datetime import datetime
 import src.config as config
-from src.services.records_service import load_records
+from src.services.records_service import records_store, list_tenants, shard_name
 from src.utils.rendering import render_table_image
+from src.utils.safe_senders import safe_reply_photo, PRIORITY_BACKGROUND
 from src.logger import logger
+from src.utils.metrics import histogram
 
 REQUESTS_DIR = os.path.join(os.path.dirname(config.RECORDS_FILE), "requests")
 os.makedirs(REQUESTS_DIR, exist_ok=True)
 
-# --- Авто-отчёт каждые 14 дней ---
-async def send_auto_report_job(context):
-    try:
-        records = load_records()
+MANUAL_REPORT_JOB = "manual_report"
+REPORT_DEBOUNCE = 2  # сек: повторные запросы за это время схлопываются в один отчёт
+TRIGGER_POLL_INTERVAL = 60  # сек: файловый триггер — только запасной путь
+
+RENDER_SECONDS = histogram("report_render_seconds", "Records table rendering time", ["kind"])
+
+def report_thread(tenant: tuple) -> int | None:
+    """Тема для отчёта: своя тема тенанта, для основной группы — TOPIC_FORWARD."""
+    chat_id, topic = tenant
+    if topic:
+        return topic
+    return config.TOPIC_FORWARD if chat_id == config.GROUP_ID else None
+
+async def send_tenant_report(bot, tenant: tuple, kind: str, caption: str):
+    """Таблица рекордов тенанта — в его же чат/тему; пустые чаты пропускаются."""
+    records = await records_store.read(tenant)
+    if not records:
+        return
+    with RENDER_SECONDS.labels(kind).time():
         buf = render_table_image(records)
-        caption = f"📅 Авто-отчёт ({datetime.now().strftime('%Y-%m-%d')})"
-        await context.bot.send_photo(
-            chat_id=config.GROUP_ID,
-            photo=buf,
-            caption=caption,
-            message_thread_id=config.TOPIC_FORWARD or None
-        )
-    except Exception as e:
-        logger.exception("send_auto_report_job error: %s", e)
-        # Ошибки не шлём сразу, они попадут в ежедневный отчёт
+    await safe_reply_photo(bot, tenant[0], buf, caption,
+                           thread_id=report_thread(tenant), priority=PRIORITY_BACKGROUND)
 
-# --- Проверка триггера для ручных отчётов (через веб-панель) ---
+async def send_reports(bot, tenants: list[tuple], kind: str, caption: str):
+    for tenant in tenants:
+        try:
+            await send_tenant_report(bot, tenant, kind, caption)
+        except Exception as e:
+            # Ошибка в одном чате не мешает отчётам остальных; попадёт в ежедневный отчёт
+            logger.exception("report for %s failed: %s", shard_name(tenant), e)
+
+# --- Авто-отчёт каждые 14 дней (каждому чату — его рекорды) ---
+async def send_auto_report_job(context):
+    caption = f"📅 Авто-отчёт ({datetime.now().strftime('%Y-%m-%d')})"
+    await send_reports(context.bot, list_tenants(), "auto", caption)
+
+# --- Ручной отчёт (по команде веб-панели) ---
+def manual_report_job_name(tenant: tuple | None) -> str:
+    return f"{MANUAL_REPORT_JOB}:{shard_name(tenant)}" if tenant else MANUAL_REPORT_JOB
+
+def manual_report_pending(job_queue) -> bool:
+    return any(job.name.startswith(MANUAL_REPORT_JOB) for job in job_queue.jobs())
+
+def request_manual_report(job_queue, tenant: tuple | None = None) -> bool:
+    """
+    Ставит ручной отчёт в очередь: по одному чату (tenant) или по всем (None).
+    Если такой отчёт уже запланирован — новый запрос присоединяется к нему.
+    Возвращает True, если создан новый job.
+    """
+    name = manual_report_job_name(tenant)
+    if job_queue.get_jobs_by_name(name):
+        return False
+    job_queue.run_once(send_manual_report_job, when=REPORT_DEBOUNCE, name=name, data=tenant)
+    return True
+
+def _pop_trigger_files():
+    files = [f for f in os.listdir(REQUESTS_DIR) if f.startswith("report_trigger")]
+    for f in files:
+        try:
+            os.remove(os.path.join(REQUESTS_DIR, f))
+        except Exception:
+            pass
+    return files
+
+async def send_manual_report_job(context):
+    tenant = context.job.data
+    if tenant is None:
+        # Триггер-файлы, появившиеся до рендера, покрываются этим же отчётом
+        _pop_trigger_files()
+    caption = f"📅 Ручной отчёт ({datetime.now().strftime('%Y-%m-%d %H:%M')})"
+    await send_reports(context.bot, [tenant] if tenant else list_tenants(), "manual", caption)
+
+# --- Запасной путь: триггер-файлы в REQUESTS_DIR ---
 async def check_trigger_and_send_report(context):
     try:
-        files = [f for f in os.listdir(REQUESTS_DIR) if f.startswith("report_trigger")]
-        if not files:
-            return
-        records = load_records()
-        buf = render_table_image(records)
-        caption = f"📅 Ручной отчёт ({datetime.now().strftime('%Y-%m-%d %H:%M')})"
-        await context.bot.send_photo(
-            chat_id=config.GROUP_ID,
-            photo=buf,
-            caption=caption,
-            message_thread_id=config.TOPIC_FORWARD or None
-        )
-        for f in files:
-            try:
-                os.remove(os.path.join(REQUESTS_DIR, f))
-            except Exception:
-                pass
+        if any(f.startswith("report_trigger") for f in os.listdir(REQUESTS_DIR)):
+            request_manual_report(context.job_queue)
     except Exception as e:
         logger.exception("check_trigger_and_send_report error: %s", e)
-        # Ошибки попадут в ежедневный отчёт
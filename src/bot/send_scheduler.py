@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telethon.errors import FloodWaitError
+from src.config import FORWARD_WORKERS, FORWARD_QUEUE_LIMIT
+from src.logger import logger, log_sampled
+from src.utils.metrics import counter, gauge, histogram
+from src.utils.safe_senders import TokenBucket
+
+# Планировщик отправок forwarder. У каждого канала своя очередь; воркеры берут
+# задания по deficit round robin: за круг канал получает weight единиц «кредита»,
+# отправка стоит COST, так что болтливый канал не задерживает остальные дольше
+# одного своего сообщения на круг. Пока сообщение канала отправляется, следующее
+# из той же очереди не берётся — в группу они приходят в исходном порядке, даже
+# при нескольких воркерах. Дополнительно:
+#   rate_per_min — потолок отправок канала (token bucket), сверх него канал ждёт;
+#   priority     — уровень: пока есть задания с меньшим числом, большие ждут;
+#   ответы на /channels идут отдельной очередью раньше любой пересылки.
+# FloodWait касается всего аккаунта: отправки останавливаются целиком, задание
+# возвращается в начало своей очереди. drain() при остановке процесса дожидается
+# очередей до дедлайна и возвращает meta неотправленных заданий для сохранения.
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+CONTROL = "__control__"  # ключ очереди ответов на команды
+
+COST = 1.0  # кредита на одно сообщение
+MIN_WEIGHT = 0.1
+MAX_ATTEMPTS = 3  # отправок одного сообщения с FloodWait до отказа
+DEFAULTS = {"weight": 1.0, "rate_per_min": None, "priority": PRIORITY_NORMAL}
+
+QUEUE_DEPTH = gauge("forwarder_queue_depth", "Messages waiting to be forwarded", ["channel"])
+QUEUE_WAIT = histogram("forwarder_queue_wait_seconds", "Time from event to send start", ["channel"],
+                       buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+DROPPED = counter("forwarder_queue_dropped_total", "Messages dropped: queue full or FloodWait retries exhausted",
+                  ["channel", "reason"])
+PAUSED = gauge("forwarder_paused_seconds", "Seconds left until FloodWait pause ends")
+
+class SendJob:
+    __slots__ = ("source", "send", "future", "enqueued", "attempts", "meta")
+
+    def __init__(self, source: str, send, future, meta: dict | None = None):
+        self.source = source
+        self.send = send  # async () -> result
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        self.meta = meta  # JSON-описание задания: по нему его можно восстановить после рестарта
+
+class SourceQueue:
+    """Очередь одного канала и его параметры планирования."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.jobs: deque[SendJob] = deque()
+        self.deficit = 0.0
+        self.weight = DEFAULTS["weight"]
+        self.priority = DEFAULTS["priority"]
+        self.rate_per_min = None
+        self.bucket: TokenBucket | None = None
+        self.sent = 0
+        self.dropped = 0
+        self.last_wait = 0.0
+        self.busy = False  # отправка канала в полёте: следующая ждёт её, чтобы не обогнать
+        self.depth = QUEUE_DEPTH.labels(key)
+
+    def configure(self, settings: dict):
+        self.weight = max(MIN_WEIGHT, float(settings.get("weight") or DEFAULTS["weight"]))
+        self.priority = int(settings.get("priority", DEFAULTS["priority"]))
+        rate = settings.get("rate_per_min")
+        if rate != self.rate_per_min:
+            self.rate_per_min = rate
+            # Всплеск — не больше одного сообщения: лимит означает именно равномерность
+            self.bucket = TokenBucket(float(rate) / 60, 1) if rate else None
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "depth": len(self.jobs),
+            "oldest_wait": round(now - self.jobs[0].enqueued, 1) if self.jobs else 0.0,
+            "last_wait": round(self.last_wait, 2),
+            "weight": self.weight,
+            "rate_per_min": self.rate_per_min,
+            "priority": self.priority,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+class FairScheduler:
+    def __init__(self, workers: int = FORWARD_WORKERS, queue_limit: int = FORWARD_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self.sources: dict[str, SourceQueue] = {}
+        self.rings: dict[int, deque[SourceQueue]] = {}  # priority -> каналы с заданиями, по кругу
+        self.control: deque[SendJob] = deque()
+        self.settings: dict = {}
+        self.paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.running: set[SendJob] = set()
+        self.closed = False  # после drain() новые задания не принимаются
+        PAUSED.set_function(lambda: max(0.0, self.paused_until - time.monotonic()))
+
+    # --- Настройки ---
+    def configure(self, settings: dict):
+        """settings: {"default": {...}, "@channel": {"weight", "rate_per_min", "priority"}}."""
+        self.settings = {str(k).lower(): v for k, v in (settings or {}).items() if isinstance(v, dict)}
+        for source in self.sources.values():
+            source.configure(self._settings_for(source.key))
+        # Приоритет мог поменяться — раскладываем активные каналы по уровням заново
+        active = [source for ring in self.rings.values() for source in ring]
+        self.rings = {}
+        for source in active:
+            self.rings.setdefault(source.priority, deque()).append(source)
+        self._wakeup.set()
+
+    def _settings_for(self, key: str) -> dict:
+        return {**DEFAULTS, **self.settings.get("default", {}), **self.settings.get(key.lower(), {})}
+
+    def _source(self, key: str) -> SourceQueue:
+        source = self.sources.get(key)
+        if source is None:
+            source = self.sources[key] = SourceQueue(key)
+            source.configure(self._settings_for(key))
+        return source
+
+    # --- Постановка в очередь ---
+    def _ensure_started(self):
+        if self.closed:
+            return
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for i in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"forward_sender:{i}"))
+
+    def submit(self, key: str, send, meta: dict | None = None) -> asyncio.Future:
+        """
+        Ставит отправку канала key в его очередь, не дожидаясь её.
+        Future получает результат send() или None, если сообщение отброшено.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        if self.closed:
+            future.set_result(None)
+            return future
+        source = self._source(key)
+        if len(source.jobs) >= self.queue_limit:
+            source.dropped += 1
+            DROPPED.labels(key, "queue_full").inc()
+            log_sampled(f"queue_full:{key}", logging.WARNING,
+                        f"⚠️ Очередь {key} переполнена ({self.queue_limit}), сообщение пропущено")
+            future.set_result(None)
+            return future
+        source.jobs.append(SendJob(key, send, future, meta))
+        source.depth.set(len(source.jobs))
+        if len(source.jobs) == 1:
+            source.deficit = 0.0
+            self.rings.setdefault(source.priority, deque()).append(source)
+        self._wakeup.set()
+        return future
+
+    async def call(self, send):
+        """Отправка вне очередей каналов (ответы на команды): раньше любой пересылки."""
+        if self.closed:
+            raise RuntimeError("scheduler is closed")
+        self._ensure_started()
+        job = SendJob(CONTROL, send, asyncio.get_running_loop().create_future())
+        self.control.append(job)
+        self._wakeup.set()
+        return await job.future
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # --- Выбор следующего задания ---
+    def _next_job(self, now: float) -> tuple[SendJob | None, float | None]:
+        """(задание, None) или (None, через сколько секунд проверить снова; None — ждать submit)."""
+        if now < self.paused_until:
+            return None, self.paused_until - now
+        if self.control:
+            return self.control.popleft(), None
+        retry_in = None
+        for priority in sorted(self.rings):
+            ring = self.rings[priority]
+            limited = 0  # подряд пропущенных из-за rate_per_min или отправки в полёте
+            while ring and limited < len(ring):
+                source = ring[0]
+                if source.busy:
+                    limited += 1
+                    ring.rotate(-1)
+                    continue
+                delay = source.bucket.wait_time(now) if source.bucket else 0.0
+                if delay > 0:
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    limited += 1
+                    ring.rotate(-1)
+                    continue
+                if source.deficit < COST:
+                    source.deficit += source.weight
+                    limited = 0
+                    if source.deficit < COST:
+                        ring.rotate(-1)
+                        continue
+                job = source.jobs.popleft()
+                source.busy = True
+                source.deficit -= COST
+                if source.bucket:
+                    source.bucket.take()
+                source.depth.set(len(source.jobs))
+                if not source.jobs:
+                    source.deficit = 0.0
+                    ring.popleft()
+                elif source.deficit < COST:
+                    ring.rotate(-1)  # квант израсходован — ход следующему каналу
+                return job, None
+            if not ring:
+                del self.rings[priority]
+            # весь уровень упёрся в лимиты — пробуем уровни ниже
+        return None, retry_in
+
+    # --- Воркеры ---
+    async def _worker(self):
+        while True:
+            job, retry_in = self._next_job(time.monotonic())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: SendJob):
+        wait = time.monotonic() - job.enqueued
+        source = self.sources.get(job.source)
+        if source is not None:
+            source.last_wait = wait
+            QUEUE_WAIT.labels(job.source).observe(wait)
+        job.attempts += 1
+        self.in_flight += 1
+        self.running.add(job)
+        try:
+            result = await job.send()
+        except FloodWaitError as e:
+            self.pause(e.seconds)
+            if job.attempts < MAX_ATTEMPTS:
+                self._requeue(job)
+                return
+            logger.warning(f"⏳ {job.source}: FloodWait {MAX_ATTEMPTS} раза подряд, сообщение пропущено")
+            if source is not None:
+                source.dropped += 1
+            DROPPED.labels(job.source, "flood_wait").inc()
+            result = None
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+            self.running.discard(job)
+            if source is not None:
+                source.busy = False
+                self._wakeup.set()  # очередь канала снова доступна воркерам
+        if source is not None:
+            source.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _requeue(self, job: SendJob):
+        if job.source == CONTROL:
+            self.control.appendleft(job)
+        else:
+            source = self._source(job.source)
+            source.jobs.appendleft(job)
+            source.depth.set(len(source.jobs))
+            if len(source.jobs) == 1:
+                self.rings.setdefault(source.priority, deque()).appendleft(source)
+        self._wakeup.set()
+
+    # --- Состояние ---
+    def depth(self) -> int:
+        return len(self.control) + sum(len(source.jobs) for source in self.sources.values())
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "queued": self.depth(),
+            "paused": round(max(0.0, self.paused_until - now), 1),
+            "workers": self.workers,
+            "channels": {key: source.snapshot(now) for key, source in sorted(self.sources.items())},
+        }
+
+    async def join(self):
+        """Ждёт, пока очереди опустеют (бенчмарки, остановка)."""
+        while self.depth() or self.in_flight:
+            await asyncio.sleep(0.01)
+
+    async def drain(self, timeout: float) -> list[dict]:
+        """
+        Остановка: даёт очередям опустеть за timeout секунд, затем прерывает воркеров.
+        Возвращает meta заданий, которые так и не отправились (прерванные — первыми).
+        """
+        self.closed = True
+        deadline = time.monotonic() + timeout
+        while (self.depth() or self.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        # Прерванная на середине отправка могла и дойти — лучше повтор, чем потеря
+        unsent = [job for job in self.running] + [job for source in self.sources.values() for job in source.jobs]
+        await self.stop()
+        for source in self.sources.values():
+            source.jobs.clear()
+            source.depth.set(0)
+        self.rings = {}
+        self.control.clear()
+        return [job.meta for job in unsent if job.meta is not None]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import timedelta
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
@@ -6,19 +7,106 @@ from src.config import BOT_TOKEN
 from src.bot.handlers.help_handlers import help_cmd
 from src.bot.handlers.sil_handlers import sil_menu, callback_movement, handle_text_for_weight
 from src.bot.handlers.top_handlers import top_cmd, table_cmd
+from src.bot.handlers.analytics_handlers import bw_cmd, dots_cmd, stats_cmd, progress_cmd
 from src.bot.handlers.error_handler import error_handler
-from src.bot.jobs.report_jobs import send_auto_report_job, check_trigger_and_send_report
+from src.bot.jobs.report_jobs import (
+    send_auto_report_job, check_trigger_and_send_report, request_manual_report,
+    manual_report_pending, TRIGGER_POLL_INTERVAL,
+)
 from src.bot.error_reporter import start_daily_error_scheduler
-from src.logger import logger
+from src.services.records_service import records_store, list_tenants, parse_shard_name, migrate_legacy_records
+from src.services.ephemeral_service import ephemeral, SWEEP_INTERVAL
+from src.bot.update_processor import KeyedUpdateProcessor
+from src.utils.ipc import ControlServer
+from src.utils.safe_senders import get_delivery_stats
+from src.utils.heartbeat import heartbeat_loop, add_heartbeat_info
+from src.utils.loop_monitor import monitor as loop_monitor, start_loop_monitor, register_loop_control
+from src.utils.profiler import register_profile_control
+from src.logger import logger, setup_logging
+
+if __name__ == "__main__":
+    setup_logging("sil_bot")
+
+CONTROL_NAME = "sil_bot"
+MAX_CONCURRENT_UPDATES = 64
+RECORDS_EVICT_INTERVAL = 60  # сек
+
+# --- Канал управления (веб-панель -> бот) ---
+def build_control(app) -> ControlServer:
+    control = ControlServer(CONTROL_NAME)
+
+    @control.command("report")
+    async def report(chat: str | None = None):
+        # chat — имя шарда (<chat_id> или <chat_id>_<topic>); без него — отчёт каждому чату
+        tenant = parse_shard_name(chat) if chat else None
+        if chat and tenant is None:
+            raise ValueError(f"invalid chat '{chat}'")
+        queued = request_manual_report(app.job_queue, tenant)
+        return {"queued": queued}
+
+    @control.command("reload")
+    async def reload():
+        # Загруженные шарды сами перечитывают файл, если его изменили извне
+        return {"tenants": len(list_tenants()), "loaded": len(records_store.shards)}
+
+    @control.command("status")
+    async def status():
+        return {
+            **(await control.handlers["ping"]()),
+            "report_pending": manual_report_pending(app.job_queue),
+            "records_shards": len(records_store.shards),
+            "jobs": [job.name for job in app.job_queue.jobs()],
+            "delivery": get_delivery_stats(),
+            "ephemeral_messages": ephemeral.pending(),
+            "user_data": len(app.user_data),
+            "loop": loop_monitor.lag_summary(),
+        }
+
+    register_loop_control(control)
+    register_profile_control(control)
+
+    return control
+
+async def post_init(app):
+    migrate_legacy_records()
+    control = build_control(app)
+    app.bot_data["control"] = control
+    await control.start()
+    add_heartbeat_info("delivery", get_delivery_stats)
+    add_heartbeat_info("loop", loop_monitor.lag_summary)
+    start_loop_monitor()
+    app.bot_data["heartbeat"] = asyncio.create_task(heartbeat_loop(CONTROL_NAME))
+
+async def post_shutdown(app):
+    heartbeat = app.bot_data.get("heartbeat")
+    if heartbeat:
+        heartbeat.cancel()
+    loop_monitor.disable()
+    control = app.bot_data.get("control")
+    if control:
+        await control.stop()
+    await records_store.stop()
 
 def build_app():
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        # Апдейты разных пользователей обрабатываются параллельно, одного — по очереди
+        .concurrent_updates(KeyedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # --- Команды ---
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("sil", sil_menu))
     app.add_handler(CommandHandler("top", top_cmd))
     app.add_handler(CommandHandler("table", table_cmd))
+    app.add_handler(CommandHandler("bw", bw_cmd))
+    app.add_handler(CommandHandler("dots", dots_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
+    app.add_handler(CommandHandler("progress", progress_cmd))
 
     # --- Callback и ввод данных ---
     app.add_handler(CallbackQueryHandler(callback_movement))
@@ -31,8 +119,13 @@ def build_app():
     jq = app.job_queue
     # Авто-отчёт каждые 14 дней
     jq.run_repeating(send_auto_report_job, interval=timedelta(days=14), first=timedelta(days=14))
-    # Проверка ручного триггера
-    jq.run_repeating(check_trigger_and_send_report, interval=10, first=10)
+    # Выгрузка из памяти рекордов неактивных чатов
+    jq.run_repeating(records_store.evict_idle, interval=RECORDS_EVICT_INTERVAL, first=RECORDS_EVICT_INTERVAL,
+                     name="records_evict")
+    # Удаление просроченных подсказок и брошенных диалогов /sil
+    jq.run_repeating(ephemeral.sweep, interval=SWEEP_INTERVAL, first=SWEEP_INTERVAL, name="ephemeral_sweep")
+    # Запасная проверка файлового триггера (основной путь — control socket)
+    jq.run_repeating(check_trigger_and_send_report, interval=TRIGGER_POLL_INTERVAL, first=10)
 
     # Ежедневная отправка ошибок админу
     start_daily_error_scheduler(app)
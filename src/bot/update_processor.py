@@ -0,0 +1,76 @@
+import asyncio
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.utils.metrics import histogram, gauge
+
+UPDATE_SECONDS = histogram("bot_update_seconds", "Update handling time including per-user queueing")
+UPDATES_IN_FLIGHT = gauge("bot_updates_in_flight", "Updates currently being processed")
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов с последовательностью внутри ключа.
+    Апдейты одного пользователя (его диалог /sil живёт в user_data) идут строго
+    по очереди, апдейты разных пользователей и чатов — параллельно.
+    """
+
+    # Лимит базового класса не используем: свой семафор берётся уже после очереди
+    # пользователя, а PTB только запускает апдейты параллельно
+    UNBOUNDED = 2 ** 16
+
+    def __init__(self, max_concurrent_updates: int = 64):
+        super().__init__(self.UNBOUNDED)
+        self.slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: dict[object, asyncio.Lock] = {}
+        self._waiters: dict[object, int] = {}
+
+    @staticmethod
+    def update_key(update: object):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        # Сначала очередь пользователя, потом слот: ожидающие апдейты одного
+        # пользователя не занимают слоты, и его всплеск не останавливает остальные чаты.
+        started = time.perf_counter()
+        try:
+            await self._process_keyed(update, coroutine)
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started)
+
+    async def _process_slot(self, coroutine):
+        async with self.slots:
+            UPDATES_IN_FLIGHT.inc()
+            try:
+                await coroutine
+            finally:
+                UPDATES_IN_FLIGHT.dec()
+
+    async def _process_keyed(self, update, coroutine):
+        key = self.update_key(update)
+        if key is None:
+            await self._process_slot(coroutine)
+            return
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._process_slot(coroutine)
+        finally:
+            # Замок живёт, пока есть ожидающие, — память не растёт с числом пользователей
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
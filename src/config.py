@@ -23,10 +23,25 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 LOG_DIR = os.path.join(DATA_DIR, "logs")
 CHANNELS_FILE = os.path.join(DATA_DIR, "channels.json")
 STATS_FILE = os.path.join(DATA_DIR, "stats.json")
-RECORDS_FILE = os.path.join(DATA_DIR, "records.json")
-RECORDS_FILE = os.path.join(DATA_DIR, "records.json")
+ROLLUPS_FILE = os.path.join(DATA_DIR, "rollups.json")  # пересылки по каналам: минуты / часы / дни
+FORWARD_SCHEDULE_FILE = os.path.join(DATA_DIR, "forward_schedule.json")  # веса/лимиты/приоритеты каналов forwarder
+RECORDS_FILE = os.path.join(DATA_DIR, "records.json")  # до шардирования; переносится в RECORDS_DIR при старте
+RECORDS_DIR = os.path.join(DATA_DIR, "records")  # рекорды по чатам: <chat_id>.json / <chat_id>_<topic>.json
+RECORDS_PER_TOPIC = os.getenv("RECORDS_PER_TOPIC", "0") == "1"  # отдельные рекорды для каждой темы форума
+RECORDS_IDLE_TTL = int(os.getenv("RECORDS_IDLE_TTL", "900"))  # сек: неактивный чат выгружается из памяти
 REQUESTS_DIR = os.path.join(DATA_DIR, "requests")
+ERRORS_FILE = os.path.join(DATA_DIR, "errors.json")  # агрегированные ошибки всех процессов
+RUN_DIR = os.path.join(DATA_DIR, "run")  # сокеты управления, heartbeat-файлы
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")  # отчёты профилировщика (main.py profile / веб-панель)
 SESSION_NAME = "forwarder_session"
+FORWARD_WORKERS = int(os.getenv("FORWARD_WORKERS", "3"))  # параллельных отправок forwarder
+FORWARD_QUEUE_LIMIT = int(os.getenv("FORWARD_QUEUE_LIMIT", "1000"))  # сообщений в очереди одного канала
+FORWARD_DRAIN_TIMEOUT = float(os.getenv("FORWARD_DRAIN_TIMEOUT", "15"))  # сек на досылку очереди при остановке
+FORWARDER_STATE_FILE = os.path.join(DATA_DIR, "forwarder_state.json")  # чекпоинт: peer id, последние id, очередь
+CHANNEL_IMPORT_CONCURRENCY = int(os.getenv("CHANNEL_IMPORT_CONCURRENCY", "4"))  # параллельных запросов при импорте каналов
+CHANNEL_IMPORT_RATE = float(os.getenv("CHANNEL_IMPORT_RATE", "1"))  # проверок username в секунду
+CHANNEL_IMPORT_MAX_FLOOD = int(os.getenv("CHANNEL_IMPORT_MAX_FLOOD", "120"))  # сек: FloodWait дольше — импорт прерывается
+CHANNEL_IMPORT_LIMIT = int(os.getenv("CHANNEL_IMPORT_LIMIT", "500"))  # каналов в одном импорте
 
 # === LOGGING ===
 BOT_LOG_FILE = os.path.join(LOG_DIR, "sil_bot.log")
@@ -40,4 +55,8 @@ REPORT_TIME = time(REPORT_HOUR, REPORT_MINUTE, tzinfo=MSK_TZ)
 # === Веб-сервер ===
 WEB_HOST = os.getenv("WEB_HOST", "localhost")
 WEB_PORT = int(os.getenv("WEB_PORT", "9000"))
-WEB_LOG = os.path.join(os.path.dirname(__file__), "../data/logs/webpanel.log")
\ No newline at end of file
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))  # панель без состояния, боты живут в supervisor
+WEB_LOG = os.path.join(os.path.dirname(__file__), "../data/logs/webpanel.log")
+# === Диагностика ===
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "1") == "1"  # можно переключить на лету через control socket
+LOOP_SLOW_THRESHOLD = float(os.getenv("LOOP_SLOW_THRESHOLD", "0.25"))  # сек блокировки event loop
@@ -1,14 +1,110 @@
+import atexit
+import fcntl
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-from src.config import BOT_LOG_FILE
 import os
+import queue
+import sys
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from src.config import BOT_LOG_FILE, LOG_DIR, RUN_DIR
+
+# Все записи идут через очередь: event loop только кладёт запись в очередь,
+# запись на диск и ротация происходят в фоновом потоке QueueListener.
+# Каждый процесс пишет в свой файл (setup_logging), чтобы ротация
+# одного файла из нескольких процессов не портила логи.
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+MAX_BYTES = 2_000_000
+BACKUP_COUNT = 5
 
 os.makedirs(os.path.dirname(BOT_LOG_FILE), exist_ok=True)
 
+_process_name = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; ts первым полем — его читает индекс логов."""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "process": _process_name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+def _make_file_handler(path):
+    handler = RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8")
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    return handler
+
 logger = logging.getLogger("sil_bot")
 logger.setLevel(logging.INFO)
 
-handler = RotatingFileHandler(BOT_LOG_FILE, maxBytes=2_000_000, backupCount=5)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(_queue))
+_listener = QueueListener(_queue, _make_file_handler(BOT_LOG_FILE), respect_handler_level=True)
+_listener.start()
+atexit.register(lambda: _listener.stop())
+
+def setup_logging(process_name: str):
+    """Переключает процесс на собственный файл data/logs/<process_name>.log."""
+    global _listener, _process_name
+    _process_name = process_name
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = QueueListener(_queue, _make_file_handler(os.path.join(LOG_DIR, f"{process_name}.log")),
+                              respect_handler_level=True)
+    _listener.start()
+
+_slot_fd = None  # держим открытым до конца процесса: пока он открыт, номер занят
+
+def worker_log_name(process_name: str, workers: int) -> str:
+    """
+    Имя лога для одного из workers одинаковых процессов (воркеры uvicorn):
+    <process_name>-<номер>, номер — первый свободный слот (flock на файл в RUN_DIR).
+    После перезапуска воркер занимает освободившийся номер, так что файлов не
+    становится больше, чем воркеров; запас — на время, пока старый ещё не вышел.
+    """
+    global _slot_fd
+    os.makedirs(RUN_DIR, exist_ok=True)
+    for slot in range(workers * 2):
+        fd = os.open(os.path.join(RUN_DIR, f"{process_name}-{slot}.slot"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        _slot_fd = fd
+        return f"{process_name}-{slot}"
+    return f"{process_name}-{os.getpid()}"
+
+def get_process_name() -> str:
+    return _process_name
+
+# --- Сэмплирование частых сообщений ---
+_sampled: dict[str, tuple[float, int]] = {}
+
+def log_sampled(key: str, level: int, msg: str, *args, interval: float = 10.0):
+    """
+    Пишет сообщение с ключом key не чаще раза в interval секунд.
+    Пропущенные записи учитываются: "... (+N suppressed)".
+    """
+    if not logger.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    last, suppressed = _sampled.get(key, (0.0, 0))
+    if now - last < interval:
+        _sampled[key] = (last, suppressed + 1)
+        return
+    _sampled[key] = (now, 0)
+    if suppressed:
+        msg = f"{msg} (+{suppressed} suppressed)"
+    logger.log(level, msg, *args)
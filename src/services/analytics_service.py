@@ -0,0 +1,294 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from src.services.records_service import history_path, bodyweight_path, shard_path, read_shard, load_bodyweights
+from src.utils.metrics import histogram
+from src.logger import logger
+
+# Силовая аналитика по истории подходов тенанта: оценка 1ПМ (Эпли), DOTS по
+# собственному весу, перцентиль внутри движения и скорость прогресса.
+# История (<шард>.history.jsonl) только дописывается, поэтому при росте файла
+# разбирается лишь новый хвост: каждая строка превращается в частичные суммы
+# по (пользователь, движение), которые сворачиваются с накопленными одной
+# группировкой. Всё считается операциями pandas/numpy над столбцами, без
+# цикла по записям; итог кешируется по версии файлов. Пометку об удалении
+# (правка в панели) из свёрнутых сумм не вычесть — best/first/last не обратимы, —
+# поэтому хвост с такой пометкой запускает пересчёт всей истории.
+
+BIG_THREE = ("Жим", "Присед", "Тяга")
+MAX_REPS = 12  # дальше формула Эпли сильно завышает 1ПМ
+# DOTS: 500 / (a·bw⁴ + b·bw³ + c·bw² + d·bw + e)
+DOTS_COEFFS = {
+    "m": (-0.0000010930, 0.0007391293, -0.1918759221, 24.0900756, -307.75076),
+    "f": (-0.0000010706, 0.0005158568, -0.1126655495, 13.6175032, -57.96288),
+}
+DOTS_BW_LIMITS = {"m": (40.0, 210.0), "f": (40.0, 150.0)}
+EPOCH = pd.Timestamp("2000-01-01")
+CACHE_SIZE = 64  # тенантов с посчитанной аналитикой
+
+COMPUTE_SECONDS = histogram("analytics_compute_seconds", "Analytics refresh duration", ["mode"])
+
+def e1rm(weight, reps):
+    """Оценка 1ПМ по Эпли; одиночный подход — сам вес. Работает с Series/ndarray."""
+    reps = np.clip(reps, 1, MAX_REPS)
+    return np.where(reps > 1, weight * (1 + reps / 30), weight)
+
+def dots_coefficient(bodyweight, sex):
+    """Коэффициент DOTS (векторно); sex: "m" | "f", неизвестный считается "m"."""
+    bodyweight = np.asarray(bodyweight, dtype=float)
+    female = np.asarray(sex) == "f"
+    coeffs = np.where(female[:, None], DOTS_COEFFS["f"], DOTS_COEFFS["m"])
+    low = np.where(female, DOTS_BW_LIMITS["f"][0], DOTS_BW_LIMITS["m"][0])
+    high = np.where(female, DOTS_BW_LIMITS["f"][1], DOTS_BW_LIMITS["m"][1])
+    bw = np.clip(bodyweight, low, high)
+    denominator = (((coeffs[:, 0] * bw + coeffs[:, 1]) * bw + coeffs[:, 2]) * bw + coeffs[:, 3]) * bw + coeffs[:, 4]
+    return 500 / denominator
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    dd.mm.yyyy / dd-mm-yyyy (записи бота и панели) и ISO. Разных дат в истории
+    мало, поэтому разбираем только уникальные значения и раскладываем по кодам.
+    """
+    codes, uniques = pd.factorize(values.astype("string"))
+    uniques = pd.Series(uniques, dtype="string")
+    dmy = pd.to_datetime(uniques.str.replace("-", ".", regex=False), format="%d.%m.%Y", errors="coerce")
+    parsed = dmy.fillna(pd.to_datetime(uniques, format="%Y-%m-%d", errors="coerce")).to_numpy()
+    dates = np.where(codes >= 0, parsed[np.maximum(codes, 0)], np.datetime64("NaT"))
+    return pd.Series(dates, index=values.index, dtype="datetime64[ns]")
+
+# --- Частичные суммы на (пользователь, движение) ---
+# n, Σt, Σy, Σt², Σty — для наклона МНК (прогресс), best — лучший e1RM,
+# first/last — e1RM в первый и последний день. Строки одной записи и уже
+# свёрнутые группы имеют одинаковый вид, поэтому свёртка одна и та же.
+SUM_COLUMNS = ["n", "st", "sy", "stt", "sty"]
+
+def _entries_to_rows(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.reindex(columns=["user", "movement", "weight", "reps", "date"])
+    weight = pd.to_numeric(df["weight"], errors="coerce")
+    reps = pd.to_numeric(df["reps"], errors="coerce").fillna(1)
+    date = parse_dates(df["date"])
+    valid = (weight > 0) & date.notna() & df["user"].notna() & df["movement"].notna()
+    t = ((date - EPOCH).dt.days.astype(float))[valid]
+    y = pd.Series(e1rm(weight.to_numpy(float), reps.to_numpy(float)), index=df.index)[valid]
+    return pd.DataFrame({
+        "user": df["user"][valid].astype(str), "movement": df["movement"][valid].astype(str),
+        "n": 1, "st": t, "sy": y, "stt": t * t, "sty": t * y,
+        "best": y, "first_t": t, "first_y": y, "last_t": t, "last_y": y,
+    })
+
+def _reduce(rows: pd.DataFrame) -> pd.DataFrame:
+    keys = ["user", "movement"]
+    grouped = rows.groupby(keys, sort=False)
+    result = grouped[SUM_COLUMNS].sum()
+    result["best"] = grouped["best"].max()
+    first = rows.sort_values("first_t", kind="stable").groupby(keys, sort=False)[["first_t", "first_y"]].first()
+    last = rows.sort_values("last_t", kind="stable").groupby(keys, sort=False)[["last_t", "last_y"]].last()
+    return result.join(first).join(last).reset_index()
+
+def _summarize(agg: pd.DataFrame, bodyweights: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(lifts, users) по свёрнутым суммам — размер зависит от числа людей и движений, не истории."""
+    lifts = agg.copy()
+    denominator = lifts["n"] * lifts["stt"] - lifts["st"] ** 2
+    slope = (lifts["n"] * lifts["sty"] - lifts["st"] * lifts["sy"]) / denominator.where(denominator > 0)
+    lifts["progress_month"] = slope * 30  # кг e1RM в месяц по МНК
+    lifts["change_pct"] = (lifts["last_y"] / lifts["first_y"] - 1) * 100
+    lifts["percentile"] = lifts.groupby("movement")["best"].rank(pct=True) * 100
+    lifts["last_date"] = EPOCH + pd.to_timedelta(lifts["last_t"], unit="D")
+
+    big = lifts[lifts["movement"].isin(BIG_THREE)]
+    users = big.groupby("user").agg(total=("best", "sum"), lifts=("best", "size"))
+    users = users.reindex(lifts["user"].unique(), fill_value=0)
+    bw = pd.DataFrame.from_dict(bodyweights, orient="index").reindex(users.index)
+    users["bodyweight"] = pd.to_numeric(bw.get("bodyweight"), errors="coerce")
+    users["sex"] = bw.get("sex", pd.Series(index=users.index, dtype=object)).fillna("m")
+    users["dots"] = np.where(users["bodyweight"] > 0,
+                             users["total"] * dots_coefficient(users["bodyweight"].fillna(0), users["sex"]), np.nan)
+    return lifts, users.sort_values(["dots", "total"], ascending=False, na_position="last")
+
+def _clean(value):
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 2)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+class Analytics:
+    """Результат для одного тенанта: lifts — по (пользователь, движение), users — по людям."""
+
+    def __init__(self, lifts: pd.DataFrame, users: pd.DataFrame, entries: int):
+        self.lifts = lifts
+        self.users = users
+        self.entries = entries
+
+    def user_lifts(self, user: str) -> pd.DataFrame:
+        return self.lifts[self.lifts["user"] == user].sort_values("best", ascending=False)
+
+    def top_progress(self, limit: int = 10, min_entries: int = 2) -> pd.DataFrame:
+        lifts = self.lifts[(self.lifts["n"] >= min_entries) & self.lifts["progress_month"].notna()]
+        return lifts.sort_values("progress_month", ascending=False).head(limit)
+
+    def to_dict(self, movement: str | None = None) -> dict:
+        lifts = self.lifts if not movement else self.lifts[self.lifts["movement"] == movement]
+        lift_columns = ["user", "movement", "n", "best", "percentile", "progress_month", "change_pct", "last_date"]
+        return {
+            "entries": self.entries,
+            "users": [{"user": user, **{k: _clean(v) for k, v in row.items()}}
+                      for user, row in self.users.to_dict("index").items()],
+            "lifts": [{k: _clean(v) for k, v in row.items()}
+                      for row in lifts.sort_values(["movement", "best"], ascending=[True, False])[lift_columns]
+                      .to_dict("records")],
+        }
+
+# --- Пометки об удалении ---
+KEY_COLUMNS = ["user", "movement", "weight", "reps", "date"]
+
+def _has_deletions(frame: pd.DataFrame) -> bool:
+    return "op" in frame and bool((frame["op"] == "delete").any())
+
+def _drop_deleted(frame: pd.DataFrame) -> pd.DataFrame:
+    """Записи без пометок; каждая пометка {"op": "delete"} убирает одну такую же запись."""
+    if "op" not in frame:
+        return frame
+    dead = (frame["op"] == "delete").to_numpy()
+    entries = frame[~dead]
+    if dead.any():
+        raw = frame.reindex(columns=KEY_COLUMNS)
+        keys = pd.DataFrame({
+            "user": raw["user"].astype(str), "movement": raw["movement"].astype(str),
+            "weight": pd.to_numeric(raw["weight"], errors="coerce").fillna(-1),
+            "reps": pd.to_numeric(raw["reps"], errors="coerce").fillna(1),
+            "date": raw["date"].astype(str),
+        })
+        deleted = keys[dead].groupby(KEY_COLUMNS).size().rename("deleted")
+        rank = keys[~dead].groupby(KEY_COLUMNS).cumcount()
+        counts = keys[~dead].join(deleted, on=KEY_COLUMNS)["deleted"].fillna(0)
+        entries = entries[(rank >= counts).to_numpy()]
+    return entries.drop(columns="op")
+
+EMPTY_ROWS = _entries_to_rows(pd.DataFrame(columns=["user", "movement", "weight", "reps", "date"]))
+
+class TenantAnalytics:
+    """
+    Инкрементальное состояние тенанта. Пока файл истории растёт — читаем только
+    новые байты; укоротился или заменён — пересчёт. Нет истории (шард старше неё) —
+    считаем по текущим рекордам.
+    """
+
+    def __init__(self, tenant: tuple):
+        self.tenant = tenant
+        self.source = None  # ("history", inode) | "records"
+        self.offset = 0
+        self.entries = 0
+        self.agg = None
+        self.version = None
+        self.result: Analytics | None = None
+        self._lock = threading.Lock()
+
+    def version_key(self) -> tuple:
+        return tuple(_stat(path) for path in (history_path(self.tenant), shard_path(self.tenant),
+                                              bodyweight_path(self.tenant)))
+
+    def get(self) -> Analytics:
+        with self._lock:
+            version = self.version_key()
+            if self.result is not None and version == self.version:
+                return self.result
+            history, _, _ = version
+            if history is not None:
+                self._update_from_history(history)
+            else:
+                with COMPUTE_SECONDS.labels("records").time():
+                    self.source, self.offset = "records", 0
+                    records = read_shard(shard_path(self.tenant))
+                    self.entries = len(records)
+                    self.agg = _reduce(_entries_to_rows(pd.DataFrame(records)) if records else EMPTY_ROWS)
+            with COMPUTE_SECONDS.labels("summary").time():
+                lifts, users = _summarize(self.agg, load_bodyweights(self.tenant))
+            self.result = Analytics(lifts, users, self.entries)
+            self.version = version
+            return self.result
+
+    def _update_from_history(self, history: tuple):
+        inode, size = history[0], history[2]
+        if self.source != ("history", inode) or size < self.offset:
+            self._reset(inode)
+        if size == self.offset and self.agg is not None:
+            return
+        started = time.perf_counter()
+        frame, end = self._read_tail(size)
+        if self.agg is not None and _has_deletions(frame):
+            self._reset(inode)
+            frame, end = self._read_tail(size)
+        mode = "full" if self.agg is None else "incremental"
+        frame = _drop_deleted(frame)
+        rows = _entries_to_rows(frame) if len(frame) else EMPTY_ROWS
+        self.entries += len(frame)
+        self.offset += end
+        self.agg = _reduce(rows if self.agg is None else pd.concat([self.agg, rows], ignore_index=True))
+        COMPUTE_SECONDS.labels(mode).observe(time.perf_counter() - started)
+
+    def _reset(self, inode):
+        self.source, self.offset, self.entries, self.agg = ("history", inode), 0, 0, None
+
+    def _read_tail(self, size: int) -> tuple[pd.DataFrame, int]:
+        """Строки истории с self.offset до size: (записи, сколько байт разобрано)."""
+        with open(history_path(self.tenant), "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b"\n") + 1  # недописанная последняя строка подождёт следующего раза
+        if not end:
+            return pd.DataFrame(), 0
+        try:
+            # Строки склеиваются в один JSON-массив: один вызов парсера на весь хвост
+            return pd.DataFrame(json.loads(b"[" + chunk[:end - 1].replace(b"\n", b",") + b"]")), end
+        except ValueError:
+            pass
+        # Есть битая строка — разбираем по одной и пропускаем только её
+        entries = []
+        for line_no, line in enumerate(chunk[:end].splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"analytics: bad line {line_no} after offset {self.offset} "
+                               f"in {history_path(self.tenant)}: {e}")
+                continue
+            if isinstance(entry, dict):
+                entries.append(entry)
+        return pd.DataFrame(entries), end
+
+def _stat(path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+class AnalyticsCache:
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._tenants: OrderedDict[tuple, TenantAnalytics] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant: tuple) -> Analytics:
+        """Синхронно (веб-панель, потоки); из event loop — через asyncio.to_thread."""
+        with self._lock:
+            state = self._tenants.get(tenant)
+            if state is None:
+                state = self._tenants[tenant] = TenantAnalytics(tenant)
+            self._tenants.move_to_end(tenant)
+            while len(self._tenants) > self.size:
+                self._tenants.popitem(last=False)
+        return state.get()
+
+    def version(self, tenant: tuple) -> tuple:
+        return TenantAnalytics(tenant).version_key()
+
+analytics = AnalyticsCache()
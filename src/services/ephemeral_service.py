@@ -0,0 +1,61 @@
+import time
+from src.logger import logger
+
+PROMPT_TTL = 10 * 60  # сек: подсказки бота живут не дольше
+FLOW_TTL = 30 * 60  # сек: брошенный диалог /sil забывается
+SWEEP_INTERVAL = 60  # сек
+DELETE_BATCH = 100  # лимит deleteMessages в Bot API
+
+class EphemeralMessages:
+    """
+    Временные сообщения бота (подсказки диалога /sil).
+    Хранит chat_id -> {message_id: (expires_at, owner_id)} и удаляет их пачками.
+    """
+
+    def __init__(self):
+        self._chats: dict[int, dict[int, tuple[float, int | None]]] = {}
+
+    def register(self, chat_id, message_id, owner=None, ttl=PROMPT_TTL):
+        self._chats.setdefault(chat_id, {})[message_id] = (time.time() + ttl, owner)
+
+    def pending(self) -> int:
+        return sum(len(msgs) for msgs in self._chats.values())
+
+    def _pop(self, chat_id, predicate) -> list[int]:
+        msgs = self._chats.get(chat_id)
+        if not msgs:
+            return []
+        ids = [mid for mid, (expires, owner) in msgs.items() if predicate(expires, owner)]
+        for mid in ids:
+            del msgs[mid]
+        if not msgs:
+            del self._chats[chat_id]
+        return ids
+
+    async def _delete(self, bot, chat_id, ids: list[int]):
+        for i in range(0, len(ids), DELETE_BATCH):
+            try:
+                await bot.delete_messages(chat_id, ids[i:i + DELETE_BATCH])
+            except Exception as e:
+                # Сообщения могли удалить вручную — это не ошибка
+                logger.debug(f"delete_messages {chat_id}: {e}")
+
+    async def discard(self, bot, chat_id, owner):
+        """Удаляет все подсказки, показанные пользователю owner в чате."""
+        await self._delete(bot, chat_id, self._pop(chat_id, lambda expires, o: o == owner))
+
+    async def sweep(self, context):
+        """Job: удаляет просроченные подсказки и забывает брошенные диалоги."""
+        now = time.time()
+        for chat_id in list(self._chats):
+            await self._delete(context.bot, chat_id, self._pop(chat_id, lambda expires, o: expires <= now))
+
+        app = context.application
+        stale = [
+            uid for uid, data in app.user_data.items()
+            if not data or now - data.get("flow_ts", now) > FLOW_TTL
+        ]
+        for uid in stale:
+            app.drop_user_data(uid)
+
+ephemeral = EphemeralMessages()
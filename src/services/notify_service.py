@@ -1,5 +1,6 @@
 from telegram import Bot
 from src.config import ADMIN_ID, BOT_TOKEN
+from src.utils.safe_senders import safe_reply, PRIORITY_BACKGROUND
 from src.logger import logger
 
 bot = Bot(BOT_TOKEN)
@@ -9,7 +10,5 @@ async def notify_admins(message: str):
     if not ADMIN_ID:
         logger.warning("ADMIN_ID не указан, пропуск уведомления.")
         return
-    try:
-        await bot.send_message(chat_id=ADMIN_ID, text=message)
-    except Exception as e:
-        logger.error(f"Не удалось отправить сообщение админу: {e}")
+    if not await safe_reply(bot, ADMIN_ID, message, priority=PRIORITY_BACKGROUND):
+        logger.error("Не удалось отправить сообщение админу")
@@ -0,0 +1,228 @@
+import base64
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from src.utils.jsonstore import get_store
+from src.logger import logger
+
+# Чтение JSON-хранилищ для веб-панели: файл разбирается заново только когда
+# меняются его mtime/размер, отсортированные и отфильтрованные представления
+# кешируются по версии файла, страницы отдаются по курсору (keyset), поэтому
+# страница не зависит от длины истории, а вставки не сдвигают следующую страницу.
+
+MAX_LIMIT = 500
+VIEW_CACHE_SIZE = 32
+
+def file_version(path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class JsonCache:
+    """Разобранный JSON-файл и производные данные, пересчитываемые при смене версии файла."""
+
+    def __init__(self):
+        self._files: dict[str, tuple] = {}
+        self._views: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # FastAPI выполняет sync-эндпоинты в пуле потоков
+
+    def load(self, path, default):
+        """(данные, версия). Данные общие для всех запросов — не изменять."""
+        store = get_store(path)
+        if store is not None:
+            return store.read()  # write-behind файл: снимок + журнал
+        path = str(path)
+        version = file_version(path)
+        cached = self._files.get(path)
+        if cached and cached[0] == version:
+            return cached[1], version
+        if version is None:
+            return default, None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"query cache: cannot read {path}: {e}")
+            return (cached[1], cached[0]) if cached else (default, version)
+        with self._lock:
+            self._files[path] = (version, data)
+        return data, version
+
+    def view(self, key: tuple, build):
+        """Кеш производных представлений; key обязан включать версию файла."""
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                return self._views[key]
+        value = build()
+        with self._lock:
+            self._views[key] = value
+            while len(self._views) > VIEW_CACHE_SIZE:
+                self._views.popitem(last=False)
+        return value
+
+cache = JsonCache()
+
+# --- Курсоры ---
+# Курсор — [scope, ключ]: scope (например, поле сортировки) не даёт применить
+# курсор одной сортировки к ключам другой, где сравнение str с float упало бы
+def encode_cursor(key: tuple, scope: str = "") -> str:
+    payload = json.dumps([scope, list(key)], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None, scope: str = "") -> tuple | None:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_scope, key = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_scope != scope:
+            raise ValueError("cursor from another query")
+        return tuple(key)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+def paginate(keys: list[tuple], cursor: str | None, limit: int, descending: bool = False, scope: str = ""):
+    """
+    keys — отсортированные по возрастанию кортежи (ключ сортировки, ..., уникальный id).
+    Возвращает (ключи страницы, next_cursor).
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    after = decode_cursor(cursor, scope)
+    try:
+        if descending:
+            end = bisect_left(keys, after) if after else len(keys)
+            page = keys[max(0, end - limit):end][::-1]
+            has_more = end - limit > 0
+        else:
+            start = bisect_right(keys, after) if after else 0
+            page = keys[start:start + limit]
+            has_more = start + limit < len(keys)
+    except TypeError:
+        raise ValueError("invalid cursor")  # ключ другой формы: курсор подделан или устарел
+    return page, (encode_cursor(page[-1], scope) if has_more and page else None)
+
+def iso_date(value: str) -> str:
+    """dd.mm.yyyy / dd-mm-yyyy (форматы записей) -> yyyy-mm-dd; ISO возвращается как есть."""
+    if isinstance(value, str) and len(value) == 10 and value[2] in ".-" and value[5] == value[2]:
+        return f"{value[6:]}-{value[3:5]}-{value[:2]}"  # срезы в ~20 раз быстрее strptime на больших файлах
+    return value or ""
+
+def _in_range(date: str, date_from: str | None, date_to: str | None) -> bool:
+    return (not date_from or date >= date_from) and (not date_to or date <= date_to)
+
+# --- Рекорды ---
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+RECORD_SORTS = {
+    "date": lambda r: iso_date(r.get("date")),
+    "weight": lambda r: _number(r.get("weight")),
+    "user": lambda r: str(r.get("user", "")).lower(),
+    "movement": lambda r: str(r.get("movement", "")).lower(),
+}
+
+def query_records(path, user=None, movement=None, date_from=None, date_to=None,
+                  sort="date", order="desc", cursor=None, limit=50) -> dict:
+    if sort not in RECORD_SORTS:
+        raise ValueError(f"unknown sort '{sort}'")
+    records, version = cache.load(path, [])
+    user_q = (user or "").lower().lstrip("@")
+
+    def build():
+        sort_key = RECORD_SORTS[sort]
+        keys = []
+        for i, r in enumerate(records):
+            if user_q and user_q not in str(r.get("user", "")).lower():
+                continue
+            if movement and r.get("movement") != movement:
+                continue
+            if (date_from or date_to) and not _in_range(iso_date(r.get("date")), date_from, date_to):
+                continue
+            keys.append((sort_key(r), i))
+        keys.sort()
+        return keys
+
+    keys = cache.view(("records", str(path), version, user_q, movement, date_from, date_to, sort), build)
+    page, next_cursor = paginate(keys, cursor, limit, descending=order == "desc", scope=f"records:{sort}")
+    return {
+        "items": [{**records[i], "index": i} for _, i in page],  # index — для edit/delete
+        "next_cursor": next_cursor,
+        "total": len(keys),
+    }
+
+def record_facets(path) -> dict:
+    records, version = cache.load(path, [])
+    return cache.view(("record_facets", str(path), version), lambda: {
+        "users": sorted({r.get("user", "") for r in records}),
+        "movements": sorted({r.get("movement", "") for r in records}),
+    })
+
+# --- Каналы ---
+def query_channels(path, q=None, cursor=None, limit=100) -> dict:
+    channels, version = cache.load(path, [])
+    needle = (q or "").lower()
+    keys = cache.view(("channels", str(path), version, needle), lambda: sorted(
+        (ch.lower(), ch) for ch in channels if needle in ch.lower()))
+    page, next_cursor = paginate(keys, cursor, limit, scope="channels")
+    return {"items": [ch for _, ch in page], "next_cursor": next_cursor, "total": len(keys)}
+
+# --- Статистика пересылок ---
+class StatsAggregate:
+    """
+    Счётчики (канал, день) по stats.json. Файл только дописывается (record_stat),
+    поэтому при росте обрабатываются лишь новые записи; если файл укоротился — пересчёт.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.version = None
+        self.processed = 0
+        self.counts: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        stats, version = cache.load(self.path, [])
+        with self._lock:
+            if version == self.version:
+                return
+            if not isinstance(stats, list):
+                stats = []
+            if len(stats) < self.processed:
+                self.counts, self.processed = {}, 0
+            for entry in stats[self.processed:]:
+                key = (entry.get("channel", "?"), entry.get("date", ""))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.processed = len(stats)
+            self.version = version
+
+    def query(self, channel=None, date_from=None, date_to=None, cursor=None, limit=100) -> dict:
+        self.refresh()
+        version = self.version
+
+        def build():
+            # Ключ сортировки: (день, канал); по умолчанию новые дни первыми
+            keys = sorted((date, ch) for (ch, date) in self.counts
+                          if (not channel or ch == channel) and _in_range(date, date_from, date_to))
+            totals: dict[str, int] = {}
+            for date, ch in keys:
+                totals[ch] = totals.get(ch, 0) + self.counts[(ch, date)]
+            top = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            return keys, [{"channel": ch, "count": n} for ch, n in top]
+
+        keys, totals = cache.view(("stats", self.path, version, channel, date_from, date_to), build)
+        page, next_cursor = paginate(keys, cursor, limit, descending=True, scope="stats")
+        return {
+            "items": [{"date": date, "channel": ch, "count": self.counts.get((ch, date), 0)} for date, ch in page],
+            "next_cursor": next_cursor,
+            "total": len(keys),
+            "totals": totals[:50],
+            "messages": sum(item["count"] for item in totals),
+        }
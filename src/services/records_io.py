@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import os
+from collections import Counter
+from itertools import islice
+import pandas as pd
+from src.services.records_service import (
+    shard_path, history_path, read_shard, write_shard, append_changes,
+)
+from src.services.analytics_service import parse_dates
+from src.utils.utils import file_lock
+from src.logger import logger
+
+# Массовый импорт/экспорт рекордов (веб-панель). Импорт читает файл потоком,
+# пачками по CHUNK_ROWS строк: проверка и нормализация весов и дат — операциями
+# pandas над пачкой, дубликаты (user, movement, date) отсекаются по множеству
+# ключей шарда и истории. Все новые строки уходят в историю (аналитика), а в
+# шард — как у /sil: одна текущая запись на (user, movement), импортированная
+# заменяет её, только если она новее. Экспорт отдаёт строки по мере
+# формирования, не собирая ответ в памяти.
+
+CHUNK_ROWS = 5000
+MAX_WEIGHT = 1000  # кг — всё, что больше, считаем опечаткой
+MAX_ERRORS = 20  # примеров ошибок в отчёте
+FIELDS = ["user", "movement", "weight", "reps", "date"]
+FORMATS = ("csv", "jsonl")
+
+def detect_format(filename: str | None, explicit: str | None = None) -> str:
+    fmt = (explicit or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt in ("json", "ndjson"):
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format '{fmt}', expected csv or jsonl")
+    return fmt
+
+def iter_rows(stream, fmt: str):
+    """(номер строки, dict) из бинарного потока; кривая JSON-строка — dict с __error__."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {"__error__": f"invalid JSON: {e.msg}"}
+        yield line_no, row if isinstance(row, dict) else {"__error__": "expected JSON object"}
+
+def normalize_chunk(chunk: list[tuple[int, dict]]) -> tuple[pd.DataFrame, list[dict]]:
+    """Проверяет пачку целиком; возвращает (валидные строки, ошибки)."""
+    lines = [line for line, _ in chunk]
+    df = pd.DataFrame([row for _, row in chunk], index=lines).reindex(columns=FIELDS + ["__error__"])
+    user = df["user"].astype("string").str.strip()
+    movement = df["movement"].astype("string").str.strip()
+    weight = pd.to_numeric(df["weight"].astype("string").str.replace(",", ".", regex=False).str.strip(),
+                           errors="coerce")
+    reps_raw = df["reps"].astype("string").str.strip().replace("", pd.NA)  # пустая ячейка CSV — повторов нет
+    reps = pd.to_numeric(reps_raw, errors="coerce")
+    date = parse_dates(df["date"])
+
+    problems = pd.Series("", index=df.index, dtype=object)
+    checks = [
+        (df["__error__"].notna(), df["__error__"].astype(str)),
+        (user.isna() | (user == ""), "missing user"),
+        (movement.isna() | (movement == ""), "missing movement"),
+        (weight.isna(), "invalid weight"),
+        ((weight <= 0) | (weight > MAX_WEIGHT), f"weight out of range (0, {MAX_WEIGHT}]"),
+        (reps_raw.notna() & (reps.isna() | (reps < 1)), "invalid reps"),
+        (date.isna(), "invalid date"),
+    ]
+    for mask, message in checks:
+        mask = mask.fillna(False) & (problems == "")
+        problems[mask] = message[mask] if isinstance(message, pd.Series) else message
+    bad = problems != ""
+    errors = [{"line": int(line), "error": problems[line]} for line in problems.index[bad]]
+
+    valid = pd.DataFrame({
+        "user": user, "movement": movement, "weight": weight,
+        "reps": reps.round().astype("Int64"), "date": date.dt.strftime("%d.%m.%Y"),
+    })[~bad]
+    return valid, errors
+
+def _key(record: dict) -> tuple:
+    return (record.get("user"), record.get("movement"), record.get("date"))
+
+def _to_records(frame: pd.DataFrame) -> list[dict]:
+    records = []
+    for row in frame.itertuples(index=False):
+        record = {"user": row.user, "movement": row.movement, "weight": float(row.weight), "date": row.date}
+        if not pd.isna(row.reps):
+            record["reps"] = int(row.reps)
+        records.append(record)
+    return records
+
+def _known_keys(tenant: tuple, records: list[dict]) -> set[tuple]:
+    """Ключи шарда и истории (без удалённых из панели — пометки op=delete)."""
+    keys = Counter()
+    try:
+        with open(history_path(tenant), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                keys[_key(entry)] += -1 if entry.get("op") == "delete" else 1
+    except FileNotFoundError:
+        pass
+    return {key for key, count in keys.items() if count > 0} | {_key(r) for r in records}
+
+def _merge_latest(records: list[dict], new_records: list[dict]) -> int:
+    """
+    Как upsert_record: в шарде одна запись на (user, movement). Импортированная
+    (самая поздняя по дате из файла) заменяет текущую, только если новее неё.
+    Возвращает число обновлённых записей шарда.
+    """
+    dates = parse_dates(pd.Series([r.get("date") for r in records + new_records], dtype=object))
+    current_dates, new_dates = dates.iloc[:len(records)].tolist(), dates.iloc[len(records):].tolist()
+    latest = {}
+    for record, date in zip(new_records, new_dates):
+        key = (record["user"], record["movement"])
+        if key not in latest or date > latest[key][1]:
+            latest[key] = (record, date)
+    current = {(r.get("user"), r.get("movement")): (i, date) for i, (r, date) in enumerate(zip(records, current_dates))}
+    updated = 0
+    for key, (record, date) in latest.items():
+        if key not in current:
+            records.append(record)
+        elif pd.notna(current[key][1]) and date > current[key][1]:
+            records[current[key][0]] = record
+        else:
+            continue
+        updated += 1
+    return updated
+
+def import_records(stream, fmt: str, tenant: tuple, dry_run: bool = False) -> dict:
+    """
+    Импорт рекордов тенанта: все новые строки — в историю, в шард — самая
+    поздняя по каждому (user, movement). Дубликаты (user, movement, date) — и с уже
+    сохранёнными, и внутри файла — пропускаются. dry_run — только отчёт.
+    """
+    path = shard_path(tenant)
+    records = read_shard(path)
+    seen = _known_keys(tenant, records)
+    report = {"rows": 0, "valid": 0, "invalid": 0, "duplicates": 0, "added": 0, "current_updated": 0,
+              "errors": [], "dry_run": dry_run}
+    new_records = []
+    rows = iter_rows(stream, fmt)
+    while chunk := list(islice(rows, CHUNK_ROWS)):
+        valid, errors = normalize_chunk(chunk)
+        report["rows"] += len(chunk)
+        report["valid"] += len(valid)
+        report["invalid"] += len(errors)
+        report["errors"].extend(errors[:MAX_ERRORS - len(report["errors"])])
+        for record in _to_records(valid):
+            key = _key(record)
+            if key in seen:
+                report["duplicates"] += 1
+                continue
+            seen.add(key)
+            new_records.append(record)
+
+    if dry_run:
+        report["would_add"] = len(new_records)
+        report["would_update"] = _merge_latest(list(records), new_records)
+        return report
+    if not new_records:
+        return report
+
+    with file_lock(path):
+        # Шард и историю могли изменить, пока разбирали файл: повторная сверка под блокировкой
+        records = read_shard(path)
+        before = list(records)
+        existing = _known_keys(tenant, records)
+        new_records = [r for r in new_records if _key(r) not in existing]
+        updated = _merge_latest(records, new_records)
+        if updated:
+            write_shard(path, records)
+        append_changes(tenant, before, new_records, [])
+    report["added"] = len(new_records)
+    report["current_updated"] = updated
+    logger.info(f"📥 Импорт рекордов в {os.path.basename(path)}: {report['added']} в историю, "
+                f"{updated} текущих обновлено, {report['duplicates']} дубликатов, {report['invalid']} с ошибками")
+    return report
+
+# --- Экспорт ---
+EXPORT_BATCH = 500  # строк на один кусок ответа
+
+def export_rows(records: list[dict], fmt: str):
+    """Генератор кусков ответа: CSV с заголовком или JSON Lines."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for start in range(0, len(records), EXPORT_BATCH):
+            writer.writerows(records[start:start + EXPORT_BATCH])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for start in range(0, len(records), EXPORT_BATCH):
+        yield "".join(json.dumps({k: r[k] for k in FIELDS if k in r}, ensure_ascii=False) + "\n"
+                      for r in records[start:start + EXPORT_BATCH])
@@ -1,24 +1,327 @@
+import asyncio
 import json
 import os
-from src.config import RECORDS_FILE, REQUESTS_DIR
+import re
+import threading
+import time
+from src.config import RECORDS_FILE, RECORDS_DIR, REQUESTS_DIR, RECORDS_PER_TOPIC, RECORDS_IDLE_TTL, GROUP_ID
+from src.utils.utils import file_lock, atomic_write_json, JSON_IO_SECONDS
+from src.utils.metrics import histogram, gauge
 from src.logger import logger
 
-os.makedirs(os.path.dirname(RECORDS_FILE), exist_ok=True)
+os.makedirs(RECORDS_DIR, exist_ok=True)
 os.makedirs(REQUESTS_DIR, exist_ok=True)
 
-def load_records() -> dict:
-    if not os.path.exists(RECORDS_FILE):
-        return {}
+# Рекорды разделены по чатам (тенантам): (chat_id, topic_id | None) ->
+# RECORDS_DIR/<chat_id>.json или <chat_id>_<topic>.json. Шард загружается при первом
+# обращении, держит записи в памяти, пишется своей задачей-писателем и выгружается
+# через RECORDS_IDLE_TTL без обращений — запись в одной группе не трогает и не ждёт
+# файлы других, а память растёт с числом активных групп, а не с историей.
+
+SHARD_RE = re.compile(r"^(-?\d+)(?:_(\d+))?\.json$")
+
+def tenant_of(message) -> tuple:
+    """Тенант сообщения: чат, а при RECORDS_PER_TOPIC — ещё и тема форума."""
+    topic = message.message_thread_id if RECORDS_PER_TOPIC and getattr(message, "is_topic_message", False) else None
+    return (message.chat_id, topic)
+
+def shard_name(tenant: tuple) -> str:
+    chat_id, topic = tenant
+    return f"{chat_id}_{topic}" if topic else str(chat_id)
+
+def parse_shard_name(name: str) -> tuple | None:
+    m = SHARD_RE.match(name if name.endswith(".json") else f"{name}.json")
+    if not m:
+        return None
+    return (int(m.group(1)), int(m.group(2)) if m.group(2) else None)
+
+def shard_path(tenant: tuple) -> str:
+    return os.path.join(RECORDS_DIR, f"{shard_name(tenant)}.json")
+
+def history_path(tenant: tuple) -> str:
+    """
+    Все введённые подходы тенанта (JSON Lines, только дописывается) — для аналитики.
+    Удаление в панели — строка {"op": "delete", ...записи}: она отменяет одну такую же запись.
+    """
+    return os.path.join(RECORDS_DIR, f"{shard_name(tenant)}.history.jsonl")
+
+def bodyweight_path(tenant: tuple) -> str:
+    return os.path.join(RECORDS_DIR, f"{shard_name(tenant)}.bodyweight.json")
+
+def list_tenants() -> list[tuple]:
     try:
-        with open(RECORDS_FILE, "r", encoding="utf-8") as f:
+        names = os.listdir(RECORDS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(filter(None, map(parse_shard_name, names)), key=lambda t: (t[0], t[1] or 0))
+
+def _file_version(path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def read_shard(path) -> list[dict]:
+    """
+    Записи шарда. Повреждённый файл не подменяется молча пустым списком (следующая
+    запись затёрла бы рекорды группы): он переименовывается в <файл>.corrupt-<время>.
+    Ошибка чтения (права, диск) пробрасывается — записывать поверх нечего.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with JSON_IO_SECONDS.labels("load", "records").time(), open(path, "r", encoding="utf-8") as f:
             return json.load(f)
+    except ValueError as e:
+        broken = f"{path}.corrupt-{int(time.time())}"
+        os.replace(path, broken)
+        logger.error(f"Файл {path} повреждён ({e}), перенесён в {broken}")
+        return []
+
+def write_shard(path, records: list[dict]):
+    """
+    Атомарно (с fsync): читатели не видят наполовину записанный файл, сбой не обрезает его.
+    Ошибка записи пробрасывается — вызывающий не должен считать изменение сохранённым.
+    """
+    try:
+        with JSON_IO_SECONDS.labels("save", "records").time():
+            atomic_write_json(path, records)
     except Exception as e:
-        logger.error(f"Ошибка при чтении {RECORDS_FILE}: {e}")
-        return {}
+        logger.error(f"Ошибка при записи {path}: {e}")
+        raise
+
+def append_history(path, entries: list[dict]):
+    if not entries:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+    except Exception as e:
+        logger.error(f"Ошибка при записи {path}: {e}")
+
+def append_changes(tenant: tuple, before: list[dict], added: list[dict], removed: list[dict]):
+    """
+    Сохранённая правка шарда (бот, веб-панель): в историю — пометки об удалённых и новые
+    записи, чтобы аналитика видела то же, что шард. Вызывать под file_lock шарда.
+    """
+    if not added and not removed:
+        return
+    path = history_path(tenant)
+    seed = list(before) if not os.path.exists(path) else []  # истории ещё нет — начинаем её с шарда
+    append_history(path, seed + [{"op": "delete", **r} for r in removed] + list(added))
+
+# --- Писатель шарда ---
+BATCH_SIZE = histogram("records_write_batch_size", "Mutations applied per records file write",
+                       buckets=(1, 2, 5, 10, 25, 50, 100))
+BATCH_SECONDS = histogram("records_write_seconds", "Records batch load+apply+save duration")
+
+class RecordsWriter:
+    """
+    Все изменения шарда идут через одну задачу: мутации из очереди применяются
+    пачкой (apply_batch) и сохраняются одной записью файла.
+    Параллельные хендлеры не теряют обновления друг друга.
+    """
+
+    def __init__(self, apply_batch, name: str = "records_writer"):
+        self._apply_batch = apply_batch
+        self._name = name
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.pending = 0
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name=self._name)
 
-def save_records(records: dict):
+    async def submit(self, mutate):
+        """
+        mutate(records) меняет список на месте и возвращает новые записи для истории
+        (или None) — они дописываются, только если шард сохранился.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self.pending += 1
+        self._queue.put_nowait((mutate, future))
+        try:
+            return await future
+        finally:
+            self.pending -= 1
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            BATCH_SIZE.observe(len(batch))
+            try:
+                with BATCH_SECONDS.time():
+                    results = await asyncio.to_thread(self._apply_batch, batch)
+                for (_, future), (result, error) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if error:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            except Exception as e:
+                logger.exception(f"{self._name} error: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+# --- Шарды ---
+class RecordShard:
+    """Записи одного тенанта в памяти; файл перечитывается, только если его изменили извне."""
+
+    def __init__(self, tenant: tuple):
+        self.tenant = tenant
+        self.path = shard_path(tenant)
+        self.records: list[dict] | None = None
+        self.version = None  # (mtime_ns, size) файла, из которого получены records
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()  # загрузка и запись идут в потоках
+        self.writer = RecordsWriter(self._apply_batch, name=f"records_writer:{shard_name(tenant)}")
+
+    def _sync(self):
+        version = _file_version(self.path)
+        if self.records is None or version != self.version:
+            self.records = read_shard(self.path) if version else []
+            self.version = version
+
+    def load(self) -> list[dict]:
+        with self._lock:
+            self._sync()
+            return self.records
+
+    def _apply_batch(self, batch):
+        with file_lock(self.path), self._lock:  # веб-панель правит тот же файл из другого процесса
+            self._sync()
+            before = list(self.records)
+            results = []
+            for mutate, _ in batch:
+                try:
+                    results.append((mutate(self.records), None))
+                except Exception as e:
+                    results.append((None, e))
+            try:
+                write_shard(self.path, self.records)
+            except Exception:
+                # Пачка не сохранилась: память расходится с файлом — перечитаем его в следующий раз,
+                # а ошибка дойдёт до future каждого submit этой пачки
+                self.records = None
+                raise
+            self.version = _file_version(self.path)
+            # Под блокировкой шарда: порядок строк истории = порядок записей
+            append_changes(self.tenant, before, [entry for entries, _ in results for entry in entries or []], [])
+        return results
+
+    def idle_for(self, now: float) -> float:
+        return 0.0 if self.writer.pending else now - self.last_used
+
+class RecordStore:
+    def __init__(self):
+        self.shards: dict[tuple, RecordShard] = {}
+
+    def shard(self, tenant: tuple) -> RecordShard:
+        shard = self.shards.get(tenant)
+        if shard is None:
+            shard = self.shards[tenant] = RecordShard(tenant)
+        shard.last_used = time.monotonic()
+        return shard
+
+    async def records(self, tenant: tuple) -> list[dict]:
+        """Записи тенанта (общий список шарда — не изменять, только через submit)."""
+        return await asyncio.to_thread(self.shard(tenant).load)
+
+    async def read(self, tenant: tuple) -> list[dict]:
+        """Как records(), но не загружает в память неактивный шард (отчёты по всем чатам)."""
+        shard = self.shards.get(tenant)
+        if shard is not None:
+            return await asyncio.to_thread(shard.load)
+        return await asyncio.to_thread(read_shard, shard_path(tenant))
+
+    async def submit(self, tenant: tuple, mutate):
+        return await self.shard(tenant).writer.submit(mutate)
+
+    async def evict_idle(self, context=None, ttl: float | None = None) -> int:
+        """Job: выгружает шарды без обращений дольше RECORDS_IDLE_TTL."""
+        ttl = RECORDS_IDLE_TTL if ttl is None else ttl
+        now = time.monotonic()
+        evicted = 0
+        for tenant, shard in list(self.shards.items()):
+            if shard.idle_for(now) > ttl:
+                await shard.writer.stop()
+                if shard.idle_for(time.monotonic()) > ttl:  # за время stop() шард могли снова взять
+                    del self.shards[tenant]
+                    evicted += 1
+        if evicted:
+            logger.debug(f"records: evicted {evicted} idle shard(s), loaded {len(self.shards)}")
+        return evicted
+
+    async def stop(self):
+        for shard in list(self.shards.values()):
+            await shard.writer.stop()
+
+records_store = RecordStore()
+gauge("records_shards_loaded", "Record shards held in memory").set_function(lambda: len(records_store.shards))
+
+async def upsert_record(tenant: tuple, record: dict):
+    """Заменяет запись пользователя по тому же движению (или добавляет новую) и дописывает её в историю."""
+    def mutate(records):
+        records[:] = [r for r in records if not (r["user"] == record["user"] and r["movement"] == record["movement"])]
+        records.append(record)
+        return [record]
+    await records_store.submit(tenant, mutate)
+
+# --- Собственный вес (для DOTS) ---
+def load_bodyweights(tenant: tuple) -> dict:
+    """user -> {"bodyweight", "sex", "date"}."""
+    path = bodyweight_path(tenant)
+    if not os.path.exists(path):
+        return {}
     try:
-        with open(RECORDS_FILE, "w", encoding="utf-8") as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
     except Exception as e:
-        logger.error(f"Ошибка при записи {RECORDS_FILE}: {e}")
+        logger.error(f"Ошибка при чтении {path}: {e}")
+        return {}
+
+def _set_bodyweight(tenant: tuple, user: str, entry: dict):
+    path = bodyweight_path(tenant)
+    with file_lock(path):
+        data = load_bodyweights(tenant)
+        data[user] = entry
+        write_shard(path, data)
+
+async def set_bodyweight(tenant: tuple, user: str, bodyweight: float, sex: str, date: str):
+    await asyncio.to_thread(_set_bodyweight, tenant, user, {"bodyweight": bodyweight, "sex": sex, "date": date})
+
+# --- Перенос records.json (до шардирования) ---
+def migrate_legacy_records():
+    """
+    Общий records.json относился к основной группе: переносим его в шард GROUP_ID
+    и переименовываем в records.json.migrated. Повторный вызов ничего не делает.
+    """
+    if not os.path.exists(RECORDS_FILE):
+        return
+    with file_lock(RECORDS_FILE):
+        if not os.path.exists(RECORDS_FILE):
+            return
+        legacy = read_shard(RECORDS_FILE)
+        path = shard_path((GROUP_ID, None))
+        with file_lock(path):
+            write_shard(path, read_shard(path) + legacy)
+        os.replace(RECORDS_FILE, f"{RECORDS_FILE}.migrated")
+    logger.info(f"📦 records.json: {len(legacy)} записей перенесено в {path}")
@@ -0,0 +1,137 @@
+import calendar
+import time
+from src.config import ROLLUPS_FILE
+from src.utils.jsonstore import open_store
+from src.utils.metrics import histogram
+from src.logger import logger
+
+# Ряды пересылок по каналам для графиков панели. Каждая пересылка увеличивает
+# три счётчика — минута, час и день (одна строка журнала jsonstore), поэтому
+# графики строятся по готовым корзинам, а не по всей истории stats.json.
+# Хранение ограничено: старые минуты и часы удаляются (RETENTION), крупные
+# корзины при этом остаются — это и есть прореживание: свежие данные поминутно,
+# старые — по часам, совсем старые — по дням.
+#
+# rollups.json: {"minute": {channel: {bucket_start: count}}, "hour": {...}, "day": {...},
+#                "backfilled": true, "pruned_at": unix}; корзины — начало интервала в UTC.
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+RETENTION = {"minute": 2 * 86400, "hour": 60 * 86400, "day": 2 * 365 * 86400}
+DEFAULT_SPAN = {"minute": 120, "hour": 48, "day": 60}  # корзин на графике по умолчанию
+PRUNE_INTERVAL = 3600  # сек
+TOP_CHANNELS = 8  # отдельных линий на графике, остальное — "other"
+
+QUERY_SECONDS = histogram("rollup_query_seconds", "Rollup series build duration")
+
+def rollup_store():
+    return open_store(ROLLUPS_FILE, {}, fsync=False)
+
+def bucket(ts: float, resolution: str) -> int:
+    step = RESOLUTIONS[resolution]
+    return int(ts) - int(ts) % step
+
+def _keys(channel: str, ts: float) -> list[list]:
+    return [[resolution, channel, str(bucket(ts, resolution))] for resolution in RESOLUTIONS]
+
+def record(channel: str, ts: float | None = None):
+    """Пересылка из канала: +1 в минутную, часовую и дневную корзины."""
+    ts = time.time() if ts is None else ts
+    with rollup_store().transaction() as tx:
+        tx.incr(_keys(channel, ts))
+        if ts - tx.data.get("pruned_at", 0) > PRUNE_INTERVAL:
+            tx.replace(_pruned(tx.data, ts))
+
+def _pruned(data: dict, now: float) -> dict:
+    result = {key: value for key, value in data.items() if key not in RESOLUTIONS}
+    for resolution, retention in RETENTION.items():
+        oldest = now - retention
+        result[resolution] = {}
+        for channel, buckets in data.get(resolution, {}).items():
+            kept = {b: n for b, n in buckets.items() if int(b) >= oldest}
+            if kept:
+                result[resolution][channel] = kept
+    result["pruned_at"] = int(now)
+    return result
+
+def prune(now: float | None = None):
+    now = time.time() if now is None else now
+    with rollup_store().transaction() as tx:
+        tx.replace(_pruned(tx.data, now))
+
+# --- Начальное заполнение по stats.json ---
+def _entry_ts(entry: dict) -> int | None:
+    if "ts" in entry:
+        return int(entry["ts"])
+    try:
+        return calendar.timegm(time.strptime(entry.get("date", ""), "%Y-%m-%d"))
+    except ValueError:
+        return None
+
+def backfill(stats_path):
+    """
+    Один раз строит ряды по уже накопленной истории. У старых записей есть только
+    дата — они попадают лишь в дневные корзины. Повторный вызов ничего не делает.
+    Вызывает только forwarder до начала пересылок: record() пишет тот же процесс,
+    и пересылка не может попасть между чтением stats.json и заменой рядов.
+    """
+    with rollup_store().transaction() as tx:
+        if tx.data.get("backfilled"):
+            return
+        stats = open_store(stats_path, [], fsync=False).get()  # под блокировкой rollups.json
+        data = {resolution: {} for resolution in RESOLUTIONS}
+        for entry in stats:
+            ts = _entry_ts(entry)
+            if ts is None:
+                continue
+            channel = entry.get("channel", "?")
+            resolutions = RESOLUTIONS if "ts" in entry else ("day",)
+            for resolution in resolutions:
+                series = data[resolution].setdefault(channel, {})
+                key = str(bucket(ts, resolution))
+                series[key] = series.get(key, 0) + 1
+        # Учтено всё, что уже есть в stats.json — счётчики, набранные до заполнения, не складываем
+        data["backfilled"] = True
+        tx.replace(_pruned(data, time.time()))
+    logger.info(f"📈 Rollups: backfilled from {len(stats)} stats entries")
+
+# --- Ряды для графиков ---
+def series(data: dict, resolution: str, end: int, span: int | None = None, channel: str | None = None,
+           top: int = TOP_CHANNELS) -> dict:
+    """
+    Ряды за span корзин, заканчивая корзиной end (включительно): отдельные линии
+    для top каналов с наибольшим числом пересылок, остальные суммируются в "other".
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"unknown resolution '{resolution}'")
+    with QUERY_SECONDS.time():
+        step = RESOLUTIONS[resolution]
+        span = max(1, min(span or DEFAULT_SPAN[resolution], RETENTION[resolution] // step))
+        start = end - (span - 1) * step
+        buckets = list(range(start, end + 1, step))
+        index = {b: i for i, b in enumerate(buckets)}
+        points: dict[str, list[int]] = {}
+        for name, counts in data.get(resolution, {}).items():
+            if channel and name != channel:
+                continue
+            row = None
+            for b, n in counts.items():
+                i = index.get(int(b))
+                if i is not None:
+                    if row is None:
+                        row = [0] * span
+                    row[i] += n
+            if row is not None:
+                points[name] = row
+        totals = sorted(((sum(row), name) for name, row in points.items()), reverse=True)
+        lines = [{"channel": name, "total": total, "points": points[name]} for total, name in totals[:top]]
+        if len(totals) > top:
+            other = [sum(points[name][i] for _, name in totals[top:]) for i in range(span)]
+            lines.append({"channel": "other", "total": sum(other), "points": other})
+        return {
+            "resolution": resolution,
+            "step": step,
+            "buckets": buckets,
+            "series": lines,
+            "top": [{"channel": name, "count": total} for total, name in totals[:50]],
+            "total": sum(total for total, _ in totals),
+        }
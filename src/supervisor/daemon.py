@@ -0,0 +1,92 @@
+import asyncio
+import os
+import signal
+from src.config import RUN_DIR, DATA_DIR
+from src.supervisor.supervisor import Supervisor, ProcessSpec, BOT_SPECS
+from src.utils.ipc import ControlServer
+from src.utils.utils import load_json, save_json
+from src.logger import logger, setup_logging
+
+# Долгоживущий процесс-надзиратель. Веб-панель и main.py управляют
+# ботами только через его control socket (data/run/supervisor.sock),
+# поэтому перезапуск панели не трогает пересылку.
+
+CONTROL_NAME = "supervisor"
+STATE_FILE = os.path.join(RUN_DIR, "supervisor.json")
+DESIRED_FILE = os.path.join(RUN_DIR, "supervisor_desired.json")  # что поднять после рестарта демона
+PID_FILE = os.path.join(DATA_DIR, "pids", "supervisor.pid")
+
+SPECS = BOT_SPECS + [ProcessSpec("WebPanel", "src.webpanel.webpanel", stop_timeout=10)]
+
+def build_control(supervisor: Supervisor, stop_event: asyncio.Event) -> ControlServer:
+    control = ControlServer(CONTROL_NAME)
+
+    def remember():
+        save_json(DESIRED_FILE, sorted(name for name, mp in supervisor.processes.items() if mp.desired))
+
+    def check(bot):
+        if bot not in supervisor.processes:
+            raise ValueError(f"Bot '{bot}' not found")
+
+    @control.command("status")
+    async def status():
+        return supervisor.status()
+
+    @control.command("start")
+    async def start(bot: str):
+        check(bot)
+        state = supervisor.start(bot)
+        remember()
+        return state
+
+    @control.command("stop")
+    async def stop(bot: str):
+        check(bot)
+        state = supervisor.stop(bot)
+        remember()
+        return state
+
+    @control.command("restart")
+    async def restart(bot: str):
+        check(bot)
+        state = supervisor.restart(bot)
+        remember()
+        return state
+
+    @control.command("shutdown")
+    async def shutdown():
+        stop_event.set()
+        return {"stopping": True}
+
+    return control
+
+async def run_daemon():
+    setup_logging("supervisor")
+    os.makedirs(os.path.dirname(PID_FILE), exist_ok=True)
+    with open(PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+
+    supervisor = Supervisor(SPECS, state_file=STATE_FILE)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    control = build_control(supervisor, stop_event)
+    await control.start()
+    for name in load_json(DESIRED_FILE, []):
+        if name in supervisor.processes:
+            supervisor.start(name)
+    logger.info("🛡 Supervisor daemon running")
+
+    await stop_event.wait()
+    logger.info("🛑 Supervisor daemon stopping, draining processes...")
+    await control.stop()
+    await supervisor.shutdown()
+    try:
+        os.unlink(PID_FILE)
+    except FileNotFoundError:
+        pass
+
+if __name__ == "__main__":
+    asyncio.run(run_daemon())
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from src.config import BASE_DIR, LOG_DIR
+from src.utils.heartbeat import read_heartbeat
+from src.bot.error_reporter import add_error_to_queue
+from src.logger import logger
+
+# --- Параметры надзора ---
+SAMPLE_INTERVAL = 5  # сек: опрос /proc и heartbeat
+BACKOFF_BASE = 1  # сек
+BACKOFF_MAX = 60
+STABLE_AFTER = 60  # сек: после такого аптайма счётчик падений сбрасывается
+CRASH_LIMIT = 5  # падений за CRASH_WINDOW -> crashloop, автоперезапуск выключается
+CRASH_WINDOW = 300
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+class ProcessSpec:
+    def __init__(self, name: str, module: str, control: str | None = None,
+                 heartbeat_timeout: float = 60, stop_timeout: float = 20):
+        self.name = name
+        self.module = module  # модуль для запуска через -m
+        self.control = control  # имя процесса для heartbeat и control socket (None — не проверяем)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.stop_timeout = stop_timeout  # сколько ждать после SIGTERM до SIGKILL
+
+BOT_SPECS = [
+    ProcessSpec("Forwarder", "src.bot.forwarder", control="forwarder"),
+    ProcessSpec("Records", "src.bot.sil_bot", control="sil_bot"),
+]
+
+class ManagedProcess:
+    def __init__(self, spec: ProcessSpec):
+        self.spec = spec
+        self.proc: asyncio.subprocess.Process | None = None
+        self.task: asyncio.Task | None = None
+        self.state = "stopped"  # stopped | running | backoff | stopping | crashloop
+        self.desired = False
+        self.wakeup = asyncio.Event()
+        self.started_at = None
+        self.restarts = 0
+        self.crashes = deque()
+        self.last_exit = None
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self._cpu_sample = None
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc and self.proc.returncode is None else None
+
+    def sample(self):
+        """CPU% и RSS из /proc/<pid>."""
+        pid = self.pid
+        if not pid:
+            self.cpu_percent, self.rss, self._cpu_sample = 0.0, 0, None
+            return
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            ticks = int(fields[11]) + int(fields[12])  # utime + stime
+            with open(f"/proc/{pid}/statm") as f:
+                self.rss = int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            return
+        now = time.monotonic()
+        if self._cpu_sample:
+            prev_ticks, prev_time = self._cpu_sample
+            if now > prev_time:
+                self.cpu_percent = round((ticks - prev_ticks) / CLK_TCK / (now - prev_time) * 100, 1)
+        self._cpu_sample = (ticks, now)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.spec.name,
+            "active": self.pid is not None,
+            "state": self.state,
+            "pid": self.pid,
+            "uptime": round(time.time() - self.started_at) if self.pid and self.started_at else None,
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+            "cpu_percent": self.cpu_percent,
+            "rss": self.rss,
+        }
+
+class Supervisor:
+    """
+    Запускает процессы ботов, следит за ними и перезапускает при падении.
+    Методы start/stop/restart только меняют желаемое состояние и сразу возвращаются,
+    вся работа идёт в фоновых задачах event loop.
+    """
+
+    def __init__(self, specs: list[ProcessSpec], state_file: str | None = None):
+        self.processes = {spec.name: ManagedProcess(spec) for spec in specs}
+        self.state_file = state_file
+        self._sampler: asyncio.Task | None = None
+
+    # --- Управление ---
+    def start(self, name: str) -> dict:
+        mp = self.processes[name]
+        self._ensure_sampler()
+        mp.desired = True
+        if mp.state == "crashloop":
+            mp.crashes.clear()
+        if mp.task is None or mp.task.done():
+            mp.task = asyncio.create_task(self._supervise(mp), name=f"supervise:{name}")
+        else:
+            mp.wakeup.set()  # прерываем ожидание backoff
+        return mp.to_dict()
+
+    def stop(self, name: str) -> dict:
+        mp = self.processes[name]
+        mp.desired = False
+        mp.wakeup.set()
+        if mp.pid:
+            asyncio.create_task(self._terminate(mp))
+        return mp.to_dict()
+
+    def restart(self, name: str) -> dict:
+        mp = self.processes[name]
+        asyncio.create_task(self._restart(mp), name=f"restart:{name}")
+        return mp.to_dict()
+
+    async def _restart(self, mp: ManagedProcess):
+        if mp.task and not mp.task.done():
+            self.stop(mp.spec.name)
+            await asyncio.gather(mp.task, return_exceptions=True)
+        self.start(mp.spec.name)
+
+    def status(self) -> list[dict]:
+        return [mp.to_dict() for mp in self.processes.values()]
+
+    async def shutdown(self):
+        """Останавливает все процессы: SIGTERM, ожидание drain, затем SIGKILL."""
+        for mp in self.processes.values():
+            mp.desired = False
+            mp.wakeup.set()
+        await asyncio.gather(*(self._terminate(mp) for mp in self.processes.values() if mp.pid))
+        await asyncio.gather(*(mp.task for mp in self.processes.values() if mp.task), return_exceptions=True)
+        if self._sampler:
+            self._sampler.cancel()
+        self._write_state()
+
+    # --- Внутреннее ---
+    async def _spawn(self, mp: ManagedProcess):
+        log_path = os.path.join(LOG_DIR, f"{mp.spec.name.lower()}_subprocess.log")
+        os.makedirs(LOG_DIR, exist_ok=True)
+        env = dict(**os.environ)
+        env["PYTHONPATH"] = BASE_DIR
+        env["PYTHONUNBUFFERED"] = "1"
+        with open(log_path, "a", encoding="utf-8") as log_handle:
+            log_handle.write(f"\n=== Bot started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+            log_handle.flush()
+            mp.proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", mp.spec.module,
+                stdout=log_handle, stderr=asyncio.subprocess.STDOUT,
+                cwd=BASE_DIR, env=env, start_new_session=True,
+            )
+        mp.started_at = time.time()
+        mp.state = "running"
+        logger.info(f"✅ {mp.spec.name} started (PID {mp.proc.pid})")
+        self._write_state()
+
+    async def _watch(self, mp: ManagedProcess) -> int:
+        """Ждёт завершения процесса; зависший (без heartbeat) процесс перезапускается."""
+        while True:
+            try:
+                return await asyncio.wait_for(asyncio.shield(mp.proc.wait()), SAMPLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if not self._heartbeat_ok(mp):
+                logger.warning(f"💤 {mp.spec.name} heartbeat is stale, restarting")
+                add_error_to_queue(f"Supervisor: {mp.spec.name} heartbeat is stale")
+                await self._terminate(mp)
+
+    def _heartbeat_ok(self, mp: ManagedProcess) -> bool:
+        spec = mp.spec
+        if not spec.control or mp.state != "running":
+            return True
+        now = time.time()
+        if now - mp.started_at < spec.heartbeat_timeout:
+            return True  # процесс ещё стартует
+        hb = read_heartbeat(spec.control)
+        return bool(hb) and hb.get("pid") == mp.pid and now - hb.get("ts", 0) < spec.heartbeat_timeout
+
+    async def _terminate(self, mp: ManagedProcess):
+        proc = mp.proc
+        if not proc or proc.returncode is not None:
+            return
+        mp.state = "stopping"
+        try:
+            proc.send_signal(signal.SIGTERM)
+            await asyncio.wait_for(proc.wait(), mp.spec.stop_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱ {mp.spec.name} did not stop in {mp.spec.stop_timeout}s, killing")
+            proc.kill()
+            await proc.wait()
+        except ProcessLookupError:
+            pass
+
+    async def _supervise(self, mp: ManagedProcess):
+        name = mp.spec.name
+        while mp.desired:
+            try:
+                await self._spawn(mp)
+            except Exception as e:
+                logger.exception(f"❌ Failed to start {name}: {e}")
+                returncode = None
+            else:
+                returncode = await self._watch(mp)
+            mp.last_exit = {"code": returncode, "at": time.time()}
+            mp.sample()
+            if not mp.desired:
+                break
+
+            now = time.time()
+            if mp.started_at and now - mp.started_at >= STABLE_AFTER:
+                mp.crashes.clear()
+            mp.crashes.append(now)
+            while mp.crashes and now - mp.crashes[0] > CRASH_WINDOW:
+                mp.crashes.popleft()
+            if len(mp.crashes) >= CRASH_LIMIT:
+                mp.state = "crashloop"
+                mp.desired = False
+                logger.error(f"🔁 {name} crashed {len(mp.crashes)} times in {CRASH_WINDOW}s, giving up")
+                add_error_to_queue(f"Supervisor: {name} is crash-looping")
+                self._write_state()
+                return
+
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (len(mp.crashes) - 1))
+            mp.state = "backoff"
+            mp.restarts += 1
+            logger.warning(f"⚠️ {name} exited with code {returncode}, restarting in {delay}s")
+            self._write_state()
+            mp.wakeup.clear()
+            try:
+                await asyncio.wait_for(mp.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        mp.state = "stopped"
+        logger.info(f"✅ {name} stopped")
+        self._write_state()
+
+    def _ensure_sampler(self):
+        if self._sampler is None or self._sampler.done():
+            self._sampler = asyncio.create_task(self._sample_loop(), name="supervisor_sampler")
+
+    async def _sample_loop(self):
+        while True:
+            for mp in self.processes.values():
+                mp.sample()
+            self._write_state()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+
+    def _write_state(self):
+        if not self.state_file:
+            return
+        try:
+            tmp = f"{self.state_file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "ts": time.time(), "processes": self.status()}, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.warning(f"supervisor state write error: {e}")
+
+def read_state(state_file: str) -> dict | None:
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,52 @@
+import asyncio
+import json
+import os
+import time
+from src.config import RUN_DIR
+from src.logger import logger
+from src.utils.metrics import write_snapshot
+
+HEARTBEAT_INTERVAL = 5  # сек
+
+_providers = {}
+
+def heartbeat_path(name: str) -> str:
+    return os.path.join(RUN_DIR, f"{name}.heartbeat.json")
+
+def add_heartbeat_info(key: str, provider):
+    """provider() -> JSON-совместимое значение, добавляется в каждый heartbeat."""
+    _providers[key] = provider
+
+def write_heartbeat(name: str):
+    data = {"ts": time.time(), "pid": os.getpid()}
+    for key, provider in _providers.items():
+        try:
+            data[key] = provider()
+        except Exception as e:
+            data[key] = f"error: {e}"
+    os.makedirs(RUN_DIR, exist_ok=True)
+    path = heartbeat_path(name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+def read_heartbeat(name: str) -> dict | None:
+    try:
+        with open(heartbeat_path(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+async def heartbeat_loop(name: str):
+    """
+    Фоновая задача процесса бота: раз в HEARTBEAT_INTERVAL подтверждает, что event loop жив,
+    и заодно публикует снимок метрик для веб-панели.
+    """
+    while True:
+        try:
+            write_heartbeat(name)
+            write_snapshot(name)
+        except Exception as e:
+            logger.warning(f"heartbeat {name} error: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from src.config import RUN_DIR
+from src.logger import logger
+
+# Простой протокол поверх Unix-сокета:
+#   запрос  — одна JSON-строка {"cmd": "report", "args": {...}}
+#   ответ   — одна JSON-строка {"ok": true, "result": ...} или {"ok": false, "error": "..."}
+
+MAX_LINE = 1_000_000
+
+def socket_path(name: str) -> str:
+    return os.path.join(RUN_DIR, f"{name}.sock")
+
+class ControlServer:
+    """Локальный канал управления процессом (Unix-сокет, команды в JSON)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = socket_path(name)
+        self.handlers = {}
+        self.started_at = None
+        self._server = None
+        self.command("ping")(self._ping)
+
+    def command(self, cmd: str):
+        """Декоратор регистрации обработчика: async def handler(**args) -> result."""
+        def decorator(fn):
+            self.handlers[cmd] = fn
+            return fn
+        return decorator
+
+    async def _ping(self):
+        return {"name": self.name, "pid": os.getpid(), "uptime": round(time.time() - self.started_at, 1)}
+
+    async def start(self):
+        os.makedirs(RUN_DIR, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # сокет от прошлого запуска
+        self._server = await asyncio.start_unix_server(self._handle_conn, path=self.path, limit=MAX_LINE)
+        os.chmod(self.path, 0o600)
+        self.started_at = time.time()
+        logger.info(f"🔌 Control socket {self.name}: {self.path}")
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _handle_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            response = await self._dispatch(line)
+            writer.write(json.dumps(response, ensure_ascii=False, default=str).encode() + b"\n")
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Control socket {self.name} connection error: {e}")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            cmd = request["cmd"]
+            args = request.get("args") or {}
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "bad request"}
+        handler = self.handlers.get(cmd)
+        if handler is None:
+            return {"ok": False, "error": f"unknown command '{cmd}'"}
+        try:
+            return {"ok": True, "result": await handler(**args)}
+        except Exception as e:
+            logger.exception(f"Control command {self.name}/{cmd} failed: {e}")
+            return {"ok": False, "error": str(e)}
+
+def send_command(name: str, cmd: str, timeout: float = 2.0, **args) -> dict | None:
+    """
+    Синхронный клиент (для веб-панели и CLI).
+    Возвращает ответ процесса или None, если процесс недоступен.
+    """
+    path = socket_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps({"cmd": cmd, "args": args}).encode() + b"\n")
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+        return json.loads(b"".join(chunks))
+    except (OSError, ValueError) as e:
+        logger.warning(f"send_command {name}/{cmd} failed: {e}")
+        return None
+
+async def send_command_async(name: str, cmd: str, timeout: float = 2.0, **args) -> dict | None:
+    """Асинхронный вариант send_command для кода внутри event loop."""
+    path = socket_path(name)
+    if not os.path.exists(path):
+        return None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(path, limit=MAX_LINE), timeout)
+        try:
+            writer.write(json.dumps({"cmd": cmd, "args": args}).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        return json.loads(line) if line else None
+    except (OSError, ValueError, asyncio.TimeoutError) as e:
+        logger.warning(f"send_command_async {name}/{cmd} failed: {e}")
+        return None
@@ -0,0 +1,363 @@
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.utils.utils import file_lock, write_tmp, replace_durable, JSON_IO_SECONDS
+from src.utils.metrics import counter, histogram
+from src.logger import logger
+
+# Write-behind хранилище для JSON-файлов (channels.json, stats.json).
+# Изменение применяется к копии в памяти и сразу дописывается одной строкой в
+# журнал <file>.journal, а полный снимок файла пишется атомарно (tmp + fsync +
+# rename) не чаще раза в FLUSH_INTERVAL — серия правок стоит одной перезаписи.
+# При загрузке журнал проигрывается поверх снимка. Все процессы (боты, воркеры
+# веб-панели) работают под flock файла и перед каждой операцией дочитывают
+# чужие строки журнала, так что не затирают изменения друг друга.
+#
+# Журнал: первая строка {"base": [inode, mtime_ns]} — снимок, к которому относятся
+# операции; если снимок уже другой (упали между rename и очисткой журнала),
+# журнал устарел и отбрасывается. Дальше — {"op": ..., ...} по строке на операцию.
+#
+# Снимок сериализуется под блокировкой, а пишется (с fsync) уже без неё: record_stat
+# и прочие операции не ждут перезаписи всего stats.json. Операции, дописанные за это
+# время, остаются в журнале поверх нового снимка. Перед rename в журнал ставится
+# отметка {"base": <новый снимок>, "at": <байт>} — если упасть между rename и
+# переписыванием журнала, replay по ней пропустит операции, уже вошедшие в снимок.
+
+FLUSH_INTERVAL = float(os.getenv("JSONSTORE_FLUSH_MS", "500")) / 1000
+
+OPS = counter("jsonstore_ops_total", "Mutations journaled by JSON stores", ["file"])
+FLUSHES = counter("jsonstore_flushes_total", "Snapshots written by JSON stores", ["file"])
+REPLAYED = counter("jsonstore_replayed_ops_total", "Journal lines applied on load/sync", ["file"])
+FLUSH_BATCH = histogram("jsonstore_flush_batch_ops", "Journaled mutations folded into one snapshot",
+                        buckets=(1, 2, 5, 10, 25, 50, 100, 500))
+
+def journal_path(path) -> str:
+    return f"{path}.journal"
+
+def _snapshot_id(path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def version(path) -> tuple:
+    """Версия данных с учётом журнала (только stat, без блокировки) — для ETag и опроса изменений."""
+    try:
+        journal = os.stat(journal_path(path)).st_size
+    except FileNotFoundError:
+        journal = 0
+    return (_snapshot_id(path), journal)
+
+# --- Операции ---
+def apply_op(data, op: dict):
+    """Применяет операцию журнала; возвращает новые данные (replace меняет объект целиком)."""
+    kind = op["op"]
+    if kind == "append":
+        data.append(op["value"])
+    elif kind == "extend":
+        data.extend(op["value"])
+    elif kind == "remove":
+        if op["value"] in data:
+            data.remove(op["value"])
+    elif kind == "set":
+        data[op["key"]] = op["value"]
+    elif kind == "delete":
+        del data[op["key"]]
+    elif kind == "incr":
+        # Счётчики по вложенным путям: {"keys": [["a", "b", "c"], ...], "value": n}
+        for path in op["keys"]:
+            node = data
+            for part in path[:-1]:
+                node = node.setdefault(part, {})
+            node[path[-1]] = node.get(path[-1], 0) + op["value"]
+    elif kind == "replace":
+        return op["value"]
+    else:
+        raise ValueError(f"unknown journal op '{kind}'")
+    return data
+
+def _detach(data):
+    """
+    Копия для записи снимка без блокировки. Операции меняют на месте только сам
+    контейнер и вложенные словари (incr), поэтому глубже списки не копируются.
+    """
+    if isinstance(data, dict):
+        return {key: _detach(value) if isinstance(value, dict) else value for key, value in data.items()}
+    if isinstance(data, list):
+        return list(data)
+    return data
+
+class JsonStore:
+    """
+    Один JSON-файл в памяти процесса. Несколько операций атомарно:
+        with store.transaction() as tx:
+            if name not in tx.data:
+                tx.append(name)
+    """
+
+    def __init__(self, path, default, fsync: bool = True):
+        self.path = os.path.abspath(str(path))
+        self.journal = journal_path(self.path)
+        self.name = os.path.basename(self.path)
+        self.default = default
+        self.fsync = fsync  # False — строка журнала переживает падение процесса, но не сбой питания
+        self.data = None
+        self.snapshot = None  # _snapshot_id файла, поверх которого лежит self.data
+        self.offset = 0  # сколько байт журнала уже применено
+        self.pending = 0  # операций в журнале с последнего снимка
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # один снимок за раз: запись идёт без _lock
+        self._held = False
+        self._timer: threading.Timer | None = None
+        self._ops = OPS.labels(self.name)
+
+    # --- Синхронизация с диском (под flock) ---
+    def _load_snapshot(self):
+        snapshot = _snapshot_id(self.path)
+        data = copy.deepcopy(self.default)
+        if snapshot is not None:
+            try:
+                with JSON_IO_SECONDS.labels("load", self.name).time(), open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                # Не подменяем молча пустым значением: следующий снимок затёр бы файл
+                broken = f"{self.path}.corrupt-{int(time.time())}"
+                os.replace(self.path, broken)
+                logger.error(f"jsonstore: {self.path} is corrupt ({e}), moved to {broken}")
+                snapshot = None
+        self.data, self.snapshot, self.offset = data, snapshot, 0
+
+    def _sync(self):
+        if self.data is None or _snapshot_id(self.path) != self.snapshot:
+            self._load_snapshot()  # снимок переписал другой процесс: его журнал уже очищен
+        try:
+            size = os.path.getsize(self.journal)
+        except FileNotFoundError:
+            size = 0
+        if size < self.offset:
+            self._load_snapshot()
+        if size > self.offset:
+            self._replay()
+
+    def _replay(self):
+        with open(self.journal, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read()
+        applied = 0
+        consumed = 0
+        skip_until = 0  # операции до этого байта уже в снимке (отметка свёртки)
+        for line in chunk.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # оборванная строка упавшего писателя
+            start = self.offset + consumed
+            consumed += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                logger.error(f"jsonstore: bad journal line in {self.journal}: {e}")
+                continue
+            if "base" in entry:
+                if "at" in entry:
+                    continue  # отметка свёртки нужна, только если заголовок не совпал
+                if entry["base"] != self._base():
+                    skip_until = self._checkpoint(chunk)
+                    if skip_until is None:
+                        # Журнал к предыдущему снимку: его операции уже в файле
+                        logger.warning(f"jsonstore: stale journal {self.journal} discarded")
+                        self._truncate_journal()
+                        return
+                continue
+            if start < skip_until:
+                continue
+            self.data = apply_op(self.data, entry)
+            applied += 1
+        self.offset += consumed
+        self.pending += applied
+        if applied:
+            REPLAYED.labels(self.name).inc(applied)
+            self._schedule_flush()  # писатель мог упасть, не успев свернуть журнал
+        if consumed < len(chunk):
+            # Мы под flock, значит писатель этой строки мёртв — отрезаем хвост
+            with open(self.journal, "r+b") as f:
+                f.truncate(self.offset)
+
+    def _base(self):
+        return list(self.snapshot[:2]) if self.snapshot else None
+
+    def _checkpoint(self, chunk: bytes) -> int | None:
+        """Байт журнала, до которого операции вошли в текущий снимок (упали посреди свёртки)."""
+        base = self._base()
+        for line in chunk.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "at" in entry and entry.get("base") == base:
+                return entry["at"]
+        return None
+
+    def _truncate_journal(self):
+        with open(self.journal, "wb"):
+            pass
+        self.offset = 0
+        self.pending = 0
+
+    @contextmanager
+    def transaction(self):
+        """Блокировка (потоки + процессы) и актуальные данные на всё время блока."""
+        with self._lock:
+            if self._held:
+                yield self
+                return
+            with file_lock(self.path):
+                self._held = True
+                try:
+                    self._sync()
+                    yield self
+                finally:
+                    self._held = False
+
+    # --- Чтение ---
+    def get(self):
+        """Актуальные данные (общий объект — не изменять, только через операции)."""
+        with self.transaction():
+            return self.data
+
+    def read(self) -> tuple:
+        """(данные, версия) — как JsonCache.load, но с учётом журнала."""
+        with self.transaction():
+            return self.data, (self.snapshot, self.offset)
+
+    # --- Изменения ---
+    def _apply(self, op: dict):
+        with self.transaction():
+            self.data = apply_op(self.data, op)
+            line = json.dumps(op, ensure_ascii=False) + "\n"
+            with open(self.journal, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    f.write(json.dumps({"base": self._base()}) + "\n")
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self.offset = f.tell()
+            self.pending += 1
+            self._ops.inc()
+            self._schedule_flush()
+
+    def append(self, value):
+        self._apply({"op": "append", "value": value})
+
+    def extend(self, values: list):
+        self._apply({"op": "extend", "value": list(values)})
+
+    def remove(self, value):
+        self._apply({"op": "remove", "value": value})
+
+    def set(self, key, value):
+        self._apply({"op": "set", "key": key, "value": value})
+
+    def delete(self, key):
+        self._apply({"op": "delete", "key": key})
+
+    def incr(self, keys: list[list], value=1):
+        self._apply({"op": "incr", "keys": keys, "value": value})
+
+    def replace(self, value):
+        self._apply({"op": "replace", "value": value})
+
+    # --- Снимок ---
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Сворачивает журнал в атомарно записанный снимок."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            tmp = None
+            try:
+                # Под блокировкой — только копия; сериализация, запись и fsync — без неё
+                with self.transaction():
+                    if not self.offset:
+                        return
+                    data = _detach(self.data)
+                    base, flushed, pending = self.snapshot, self.offset, self.pending
+                with JSON_IO_SECONDS.labels("save", self.name).time():
+                    tmp = write_tmp(self.path, json.dumps(data, ensure_ascii=False, indent=2))
+                with self.transaction():
+                    if self.snapshot != base or self.offset < flushed:
+                        return  # журнал уже свернул другой процесс
+                    self._commit(tmp, flushed)
+                    tmp = None
+                    self.pending = max(0, self.pending - pending)
+                FLUSH_BATCH.observe(pending)
+                FLUSHES.labels(self.name).inc()
+            except Exception as e:
+                logger.error(f"jsonstore flush error {self.path}: {e}")
+            finally:
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def _commit(self, tmp: str, flushed: int):
+        """Ставит tmp снимком; операции журнала после байта flushed остаются поверх него."""
+        snapshot = _snapshot_id(tmp)  # rename сохраняет inode и mtime
+        base = list(snapshot[:2])
+        if self.offset == flushed:
+            replace_durable(tmp, self.path)
+            self.snapshot = snapshot
+            self._truncate_journal()
+            return
+        with open(self.journal, "r+b") as f:
+            f.seek(flushed)
+            tail = f.read(self.offset - flushed)
+            f.seek(self.offset)
+            f.write(json.dumps({"base": base, "at": flushed}).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        replace_durable(tmp, self.path)
+        self.snapshot = snapshot
+        header = json.dumps({"base": base}).encode() + b"\n"
+        journal_tmp = f"{self.journal}.{os.getpid()}.tmp"
+        with open(journal_tmp, "wb") as f:
+            f.write(header + tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(journal_tmp, self.journal)
+        self.offset = len(header) + len(tail)
+
+# --- Реестр: одно хранилище на файл в процессе ---
+_stores: dict[str, JsonStore] = {}
+_registry_lock = threading.Lock()
+
+def open_store(path, default, fsync: bool = True) -> JsonStore:
+    key = os.path.abspath(str(path))
+    with _registry_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = JsonStore(key, default, fsync=fsync)
+    return store
+
+def get_store(path) -> JsonStore | None:
+    return _stores.get(os.path.abspath(str(path)))
+
+def close_store(path):
+    store = _stores.pop(os.path.abspath(str(path)), None)
+    if store is not None:
+        store.flush()
+
+def flush_all():
+    for store in list(_stores.values()):
+        store.flush()
+
+atexit.register(flush_all)
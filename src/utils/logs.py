@@ -0,0 +1,261 @@
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from src.utils.utils import file_lock, write_tmp
+
+# Чтение логов без загрузки файла целиком.
+# Курсор "<inode>:<offset>" указывает на конец последней отданной строки;
+# по inode переживаем ротацию RotatingFileHandler (base -> base.1).
+
+BLOCK_SIZE = 64 * 1024
+MAX_CHUNK = 1024 * 1024  # не больше 1 МБ за один инкрементальный запрос
+
+def _decode(data: bytes) -> list[str]:
+    return data.decode("utf-8", errors="replace").splitlines()
+
+def make_cursor(inode: int, offset: int) -> str:
+    return f"{inode}:{offset}"
+
+def parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    try:
+        inode, offset = cursor.split(":")
+        return int(inode), int(offset)
+    except (AttributeError, ValueError):
+        return None
+
+def tail_lines(path, lines: int = 200) -> tuple[list[str], str]:
+    """Последние lines строк: читаем блоками с конца файла."""
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        end = st.st_size
+        pos, data = end, b""
+        # +1: первая строка в блоке может оказаться обрезанной
+        while pos > 0 and data.count(b"\n") <= lines:
+            step = min(BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    result = _decode(data)
+    if pos > 0:
+        result = result[1:]
+    return result[-lines:], make_cursor(st.st_ino, end)
+
+def _read_complete(path, offset: int, limit: int, final: bool = False) -> tuple[list[str], int]:
+    """
+    Полные строки начиная с offset (не больше limit байт). Возвращает строки и новый offset.
+    final=True — файл больше не растёт (ротирован), недописанный хвост тоже отдаём.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(limit)
+    cut = len(data) if final and len(data) < limit else data.rfind(b"\n") + 1
+    if cut == 0 and len(data) < limit:
+        return [], offset  # строка ещё дописывается
+    if cut == 0:
+        cut = len(data)  # одна огромная строка — отдаём как есть
+    return _decode(data[:cut]), offset + cut
+
+def _rotated_with_inode(path, inode: int) -> str | None:
+    for i in range(1, 6):
+        candidate = f"{path}.{i}"
+        try:
+            if os.stat(candidate).st_ino == inode:
+                return candidate
+        except FileNotFoundError:
+            break
+    return None
+
+def read_since(path, cursor: str | None, lines: int = 200) -> dict:
+    """
+    Новые строки после курсора. Без курсора (или если он потерян) — хвост файла.
+    reset=True означает, что клиенту нужно заменить содержимое, а не дописать.
+    """
+    parsed = parse_cursor(cursor)
+    if parsed is None:
+        tail, new_cursor = tail_lines(path, lines)
+        return {"lines": tail, "cursor": new_cursor, "reset": True}
+
+    inode, offset = parsed
+    st = os.stat(path)
+    if st.st_ino == inode:
+        if st.st_size < offset:  # файл усечён
+            tail, new_cursor = tail_lines(path, lines)
+            return {"lines": tail, "cursor": new_cursor, "reset": True}
+        new_lines, offset = _read_complete(path, offset, MAX_CHUNK)
+        return {"lines": new_lines, "cursor": make_cursor(inode, offset), "reset": False}
+
+    # Была ротация: дочитываем старый файл (теперь .1), затем новый с начала
+    rotated = _rotated_with_inode(path, inode)
+    if rotated is None:
+        tail, new_cursor = tail_lines(path, lines)
+        return {"lines": tail, "cursor": new_cursor, "reset": True}
+    new_lines, rotated_offset = _read_complete(rotated, offset, MAX_CHUNK, final=True)
+    if rotated_offset < os.path.getsize(rotated):
+        return {"lines": new_lines, "cursor": make_cursor(inode, rotated_offset), "reset": False}
+    more, offset = _read_complete(path, 0, MAX_CHUNK)
+    return {"lines": new_lines + more, "cursor": make_cursor(st.st_ino, offset), "reset": False}
+
+# --- Индекс по времени: timestamp -> byte offset ---
+# Для каждого файла (base, base.1 … base.5) храним контрольные точки каждые
+# CHECKPOINT_BYTES байт. Ключ — inode, поэтому после ротации индекс переезжает
+# вместе с файлом и не перестраивается. Время сравниваем как строки
+# "YYYY-MM-DD HH:MM:SS" (формат asctime).
+
+CHECKPOINT_BYTES = 64 * 1024
+BACKUP_COUNT = 5
+TS_LEN = 19
+
+JSON_TS_PREFIX = '{"ts": "'  # LOG_FORMAT=json, см. src/logger.py
+
+def line_ts(line: bytes | str) -> str | None:
+    if isinstance(line, bytes):
+        line = line[:TS_LEN + len(JSON_TS_PREFIX)].decode("ascii", errors="replace")
+    if line.startswith(JSON_TS_PREFIX):
+        line = line[len(JSON_TS_PREFIX):]
+    head = line[:TS_LEN]
+    if len(head) == TS_LEN and head[4] == "-" and head[10] == " " and head[13] == ":" and head[:4].isdigit():
+        return head
+    return None
+
+def line_level(line: str) -> str | None:
+    if line.startswith(JSON_TS_PREFIX):
+        try:
+            return json.loads(line).get("level")
+        except ValueError:
+            return None
+    parts = line.split(" - ", 2)
+    return parts[1] if len(parts) == 3 else None
+
+def log_files_chronological(path) -> list[str]:
+    """Старые ротации первыми: base.5 … base.1, base."""
+    files = [f"{path}.{i}" for i in range(BACKUP_COUNT, 0, -1)] + [str(path)]
+    return [f for f in files if os.path.exists(f)]
+
+class LogIndex:
+    """
+    Контрольные точки (время, смещение) по файлам лога. Индекс общий для потоков
+    и воркеров панели: обновление — под self._lock и flock файла индекса, перед
+    обновлением индекс перечитывается (его мог дочитать другой воркер).
+    """
+
+    def __init__(self, path, index_dir):
+        self.path = str(path)
+        self.index_file = os.path.join(index_dir, os.path.basename(self.path) + ".idx.json")
+        self.files: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.files = {}
+
+    def _scan(self, path: str, entry: dict, size: int):
+        """Дочитывает файл от entry['size'] до size, добавляя контрольные точки."""
+        offset = entry["size"]
+        last_checkpoint = entry["checkpoints"][-1][1] if entry["checkpoints"] else -CHECKPOINT_BYTES
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if offset + len(line) > size or not line.endswith(b"\n"):
+                    break  # строка ещё дописывается
+                ts = line_ts(line)
+                if ts:
+                    if entry["first"] is None:
+                        entry["first"] = ts
+                    entry["last"] = ts
+                    if offset - last_checkpoint >= CHECKPOINT_BYTES:
+                        entry["checkpoints"].append([ts, offset])
+                        last_checkpoint = offset
+                offset += len(line)
+        entry["size"] = offset
+
+    def refresh(self) -> list[tuple[str, dict]]:
+        """Обновляет индекс инкрементально; возвращает [(файл, запись)] по хронологии."""
+        with self._lock, file_lock(self.index_file):
+            self._load()  # записи не разделяются с предыдущими поисками: те ещё могут их читать
+            result, alive, changed = [], {}, False
+            for path in log_files_chronological(self.path):
+                st = os.stat(path)
+                key = str(st.st_ino)
+                entry = self.files.get(key)
+                if entry is None or entry["size"] > st.st_size:
+                    entry = {"size": 0, "first": None, "last": None, "checkpoints": []}
+                    changed = True
+                if entry["size"] < st.st_size:
+                    self._scan(path, entry, st.st_size)
+                    changed = True
+                alive[key] = entry
+                result.append((path, entry))
+            if changed or alive.keys() != self.files.keys():
+                self.files = alive
+                self._save()
+            return result
+
+    def _save(self):
+        # Индекс — кэш, его можно перестроить: fsync не нужен; tmp у каждого процесса свой
+        os.replace(write_tmp(self.index_file, json.dumps(self.files), fsync=False), self.index_file)
+
+    def search(self, start: str | None = None, end: str | None = None,
+               level: str | None = None, query: str | None = None, limit: int = 5000):
+        """
+        Генератор строк в диапазоне [start, end] с фильтром по уровню и подстроке.
+        Строки без времени (traceback) относятся к предыдущей записи.
+        """
+        level = level.upper() if level else None
+        emitted = 0
+        for path, entry in self.refresh():
+            if entry["first"] is None:
+                continue
+            if (start and entry["last"] < start) or (end and entry["first"] > end):
+                continue
+            offset = 0
+            if start:
+                keys = [cp[0] for cp in entry["checkpoints"]]
+                i = bisect.bisect_left(keys, start) - 1
+                if i >= 0:
+                    offset = entry["checkpoints"][i][1]
+            with open(path, "rb") as f:
+                f.seek(offset)
+                matched = False
+                for raw in f:
+                    line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                    ts = line_ts(line)
+                    if ts:
+                        if end and ts > end:
+                            return
+                        matched = (
+                            (not start or ts >= start)
+                            and (not level or line_level(line) == level)
+                            and (not query or query in line)
+                        )
+                    if matched:
+                        yield line
+                        emitted += 1
+                        if emitted >= limit:
+                            return
+
+TS_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+TIME_FORMATS = ("%H:%M:%S", "%H:%M")
+
+def normalize_ts(value: str | None, default_date: str) -> str | None:
+    """
+    '9:00', '14:00', '2025-10-24 14:00', '2025-10-24T14:00:05' -> 'YYYY-MM-DD HH:MM:SS'
+    (время дополняется нулями — строки сравниваются лексикографически).
+    Пусто — None; не разобралось — ValueError.
+    """
+    if not value:
+        return None
+    value = value.strip().replace("T", " ")
+    for fmt in TS_FORMATS + TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt in TIME_FORMATS:
+            return f"{default_date} {parsed:%H:%M:%S}"
+        return f"{parsed:%Y-%m-%d %H:%M:%S}"
+    raise ValueError(f"invalid time '{value}', expected HH:MM[:SS] or YYYY-MM-DD[ HH:MM[:SS]]")
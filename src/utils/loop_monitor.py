@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from src.config import BASE_DIR, LOOP_MONITOR, LOOP_SLOW_THRESHOLD
+from src.logger import logger
+from src.utils.metrics import counter, histogram
+
+# Монитор event loop: задача-метроном измеряет задержку планирования,
+# сторожевой поток замечает блокировку и снимает стек потока loop в момент
+# зависания — так видно, какой хендлер (forward_handler, table_cmd, ...)
+# делает синхронную работу: рендер matplotlib, перезапись JSON и т.п.
+
+TICK_INTERVAL = 0.25  # сек между замерами задержки
+LAG_WINDOW = 1200  # замеров для перцентилей (~5 минут)
+MAX_STALLS = 50  # сколько последних блокировок хранить со стеком
+STACK_DEPTH = 15
+
+LAG_SECONDS = histogram("event_loop_lag_seconds", "Event loop scheduling lag",
+                        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+STALLS = counter("event_loop_stalls_total", "Event loop blocked longer than threshold", ["handler"])
+
+SRC_DIR = os.path.join(BASE_DIR, "src") + os.sep
+# Инфраструктурные модули, через которые проходит любой хендлер, — имя хендлера ищем глубже
+_INFRA = tuple(os.path.join(SRC_DIR, p) for p in ("utils" + os.sep, "logger.py", os.path.join("bot", "update_processor.py")))
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def _describe_stack(frame):
+    """(имя хендлера, стек) для кадра потока event loop."""
+    stack = traceback.extract_stack(frame)
+    # Кадры выше Handle._run — сам event loop, ниже — выполняемый колбэк
+    start = 0
+    for i, fs in enumerate(stack):
+        if fs.name == "_run" and fs.filename.endswith(os.path.join("asyncio", "events.py")):
+            start = i + 1
+    callback = stack[start:]
+    handler = None
+    for fs in callback:
+        if fs.filename.startswith(SRC_DIR):
+            if not fs.filename.startswith(_INFRA):
+                handler = fs.name
+                break
+            handler = handler or fs.name
+    if handler is None:
+        handler = callback[0].name if callback else "unknown"
+    lines = [f"{os.path.relpath(fs.filename, BASE_DIR) if fs.filename.startswith(BASE_DIR) else fs.filename}"
+             f":{fs.lineno} in {fs.name}" for fs in callback[-STACK_DEPTH:]]
+    return handler, lines
+
+class LoopMonitor:
+    def __init__(self, threshold: float = LOOP_SLOW_THRESHOLD):
+        self.threshold = threshold
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.stalls = deque(maxlen=MAX_STALLS)
+        self.stall_count = 0
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop: threading.Event | None = None
+        self._loop_thread_id = None
+        self._last_tick = 0.0
+        self._pending = None  # блокировка, замеченная сторожем и ещё не завершившаяся
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def enable(self):
+        """Вызывать из потока event loop."""
+        if self.enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop = threading.Event()  # у каждого сторожа своё событие: быстрый off/on не плодит потоки
+        self._task = asyncio.get_running_loop().create_task(self._ticker(), name="loop_monitor")
+        self._watchdog = threading.Thread(target=self._watch, args=(self._stop,), name="loop_watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"🩺 Loop monitor enabled (threshold {self.threshold}s)")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+        logger.info("🩺 Loop monitor disabled")
+
+    def set_enabled(self, enabled: bool):
+        self.enable() if enabled else self.disable()
+
+    async def _ticker(self):
+        while True:
+            expected = time.monotonic() + TICK_INTERVAL
+            await asyncio.sleep(TICK_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            self.lags.append(lag)
+            LAG_SECONDS.observe(lag)
+            with self._lock:
+                stall, self._pending = self._pending, None
+            if stall:
+                stall["duration"] = round(lag, 3)
+                logger.warning(f"🐢 Event loop blocked {lag:.2f}s in {stall['handler']} ({stall['where']})")
+
+    def _watch(self, stop: threading.Event):
+        while not stop.wait(TICK_INTERVAL / 2):
+            blocked = time.monotonic() - self._last_tick - TICK_INTERVAL
+            if blocked < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            handler, stack = _describe_stack(frame)
+            stall = {
+                "ts": time.time(),
+                "handler": handler,
+                "where": stack[-1] if stack else "",
+                "duration": None,  # дописывает метроном, когда loop оживёт
+                "stack": stack,
+            }
+            with self._lock:
+                self._pending = stall
+                self.stalls.append(stall)
+                self.stall_count += 1
+            STALLS.labels(handler).inc()
+
+    def lag_summary(self) -> dict:
+        values = sorted(self.lags)
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "p50_ms": round(_percentile(values, 0.5) * 1000, 1),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 1),
+            "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+            "stalls": self.stall_count,
+        }
+
+    def report(self, stalls: int = 10) -> dict:
+        with self._lock:
+            recent = list(self.stalls)[-stalls:]
+        return {**self.lag_summary(), "recent_stalls": recent[::-1]}
+
+monitor = LoopMonitor()
+
+def start_loop_monitor():
+    """Запуск из post_init / run_* процесса бота; выключен, если LOOP_MONITOR=0."""
+    if LOOP_MONITOR:
+        monitor.enable()
+
+def register_loop_control(control):
+    """Команда control socket: loop [enabled=true|false] [threshold=сек]."""
+
+    @control.command("loop")
+    async def loop_command(enabled: bool | None = None, threshold: float | None = None):
+        if threshold is not None:
+            monitor.threshold = float(threshold)
+        if enabled is not None:
+            monitor.set_enabled(bool(enabled))
+        return monitor.report()
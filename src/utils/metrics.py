@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from src.config import RUN_DIR
+from src.logger import logger, get_process_name
+
+# Лёгкий реестр метрик (counter / gauge / histogram).
+# Горячий путь — только арифметика над полем объекта, без локов и I/O:
+#     FORWARDED = counter("forwarder_messages_total", "...", ["channel"])
+#     FORWARDED.labels("@chan").inc()
+# Каждый процесс периодически пишет снимок в data/run/metrics/<process>.<pid>.json,
+# веб-панель собирает их и отдаёт /metrics (Prometheus) и /api/metrics (JSON).
+
+METRICS_DIR = os.path.join(RUN_DIR, "metrics")
+SNAPSHOT_INTERVAL = 5  # сек
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+MAX_SERIES = 500  # на метрику: защита от взрыва числа меток
+
+# --- Значения ---
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+
+# --- Метрики ---
+class Metric:
+    type = ""
+    value_class = _CounterValue
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._overflow = None
+        self._default = None if self.labelnames else self.labels()
+
+    def _new_value(self):
+        return self.value_class()
+
+    def labels(self, *values):
+        """Возвращает серию для значений меток; её стоит держать в переменной на горячем пути."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            if len(self._series) >= MAX_SERIES:
+                if self._overflow is None:
+                    self._overflow = self._new_value()
+                    logger.warning(f"metrics: {self.name} exceeded {MAX_SERIES} series, folding into 'other'")
+                return self._overflow
+            series = self._series[values] = self._new_value()
+        return series
+
+    def _samples(self):
+        items = list(self._series.items())
+        if self._overflow is not None:
+            items.append((("other",) * len(self.labelnames), self._overflow))
+        for values, series in items:
+            yield dict(zip(self.labelnames, values)), series
+
+    def collect(self) -> dict:
+        return {
+            "name": self.name, "type": self.type, "help": self.help,
+            "samples": [{"labels": labels, "value": series.value} for labels, series in self._samples()],
+        }
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+class Gauge(Metric):
+    type = "gauge"
+    value_class = _GaugeValue
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value: float):
+        self._default.value = value
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+    def dec(self, amount: float = 1):
+        self._default.value -= amount
+
+    def set_function(self, fn):
+        """Значение вычисляется при снятии снимка (размеры очередей и т.п.)."""
+        self._function = fn
+
+    def collect(self) -> dict:
+        if self._function is not None:
+            try:
+                self._default.value = float(self._function())
+            except Exception as e:
+                logger.debug(f"metrics: gauge {self.name} callback error: {e}")
+        return super().collect()
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return _Timer(self._default)
+
+    def collect(self) -> dict:
+        return {
+            "name": self.name, "type": self.type, "help": self.help, "buckets": list(self.buckets),
+            "samples": [{"labels": labels, "counts": list(s.counts), "sum": s.sum, "count": s.count}
+                        for labels, s in self._samples()],
+        }
+
+# --- Реестр ---
+_registry: dict[str, Metric] = {}
+
+def _register(cls, name, help, labelnames, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        metric = _registry[name] = cls(name, help, labelnames, **kwargs)
+    elif not isinstance(metric, cls):
+        raise ValueError(f"metric {name} already registered as {metric.type}")
+    return metric
+
+def counter(name: str, help: str, labelnames=()) -> Counter:
+    return _register(Counter, name, help, labelnames)
+
+def gauge(name: str, help: str, labelnames=()) -> Gauge:
+    return _register(Gauge, name, help, labelnames)
+
+def histogram(name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+def collect() -> list[dict]:
+    return [metric.collect() for metric in _registry.values()]
+
+# --- Снимки между процессами ---
+def snapshot_path(process: str, pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{process}.{pid}.json")
+
+def write_snapshot(process: str | None = None):
+    process = process or get_process_name()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = snapshot_path(process, os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"process": process, "pid": os.getpid(), "ts": time.time(), "metrics": collect()}, f)
+    os.replace(tmp, path)
+
+async def snapshot_loop(process: str | None = None):
+    """Для процессов без heartbeat_loop (воркеры веб-панели)."""
+    while True:
+        try:
+            write_snapshot(process)
+        except Exception as e:
+            logger.warning(f"metrics snapshot error: {e}")
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def read_snapshots() -> list[dict]:
+    """Снимки живых процессов; файлы завершившихся процессов удаляются."""
+    snapshots = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return snapshots
+    for filename in names:
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _pid_alive(snap.get("pid", 0)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            continue
+        snapshots.append(snap)
+    return snapshots
+
+def aggregate(snapshots: list[dict]) -> list[dict]:
+    """
+    Сливает снимки в одну выборку с меткой process.
+    Несколько pid одного процесса (воркеры панели) суммируются.
+    """
+    merged: dict[str, dict] = {}
+    for snap in snapshots:
+        for metric in snap["metrics"]:
+            target = merged.setdefault(metric["name"], {**metric, "samples": {}})
+            for sample in metric["samples"]:
+                labels = {"process": snap["process"], **sample["labels"]}
+                key = tuple(sorted(labels.items()))
+                current = target["samples"].get(key)
+                if current is None:
+                    target["samples"][key] = {**sample, "labels": labels}
+                elif metric["type"] == "histogram":
+                    current["counts"] = [a + b for a, b in zip(current["counts"], sample["counts"])]
+                    current["sum"] += sample["sum"]
+                    current["count"] += sample["count"]
+                else:
+                    current["value"] += sample["value"]
+    for metric in merged.values():
+        metric["samples"] = list(metric["samples"].values())
+    return sorted(merged.values(), key=lambda m: m["name"])
+
+def _format_labels(labels: dict, extra: tuple | None = None) -> str:
+    items = list(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_prometheus(metrics: list[dict]) -> str:
+    """Текстовый формат экспозиции Prometheus 0.0.4."""
+    lines = []
+    for metric in metrics:
+        name = metric["name"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for sample in metric["samples"]:
+            labels = sample["labels"]
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(sample['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], sample["counts"]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {sample['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from src.config import BASE_DIR, PROFILES_DIR
+from src.logger import logger, get_process_name
+
+# Профилирование работающего процесса по запросу (control-команда "profile"):
+# поток-сэмплер раз в SAMPLE_INTERVAL снимает стек потока event loop
+# (wall-clock: ожидание в select тоже видно — это простой), параллельно
+# tracemalloc считает, где выделялась память. Через N секунд отчёт пишется
+# в data/profiles/<process>-<время>.json.
+
+SAMPLE_INTERVAL = 0.005  # сек
+MAX_SECONDS = 300
+TOP_N = 30
+TRACE_FRAMES = 5
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "_run_once"}  # loop ждёт событий
+
+_NAME_RE = re.compile(r"^[\w.-]+\.json$")
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    if path.startswith(BASE_DIR):
+        path = os.path.relpath(path, BASE_DIR)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({path}:{code.co_firstlineno})"
+
+class Profiler:
+    def __init__(self):
+        self._thread: threading.Thread | None = None
+        self.current: dict | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float = 30, target_thread: int | None = None) -> dict:
+        """Запускает профилирование в фоне и сразу возвращается."""
+        if self.running:
+            raise RuntimeError(f"profiling already running until {self.current['until']}")
+        seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+        started = datetime.now()
+        name = f"{get_process_name()}-{started.strftime('%Y%m%d-%H%M%S')}.json"
+        self.current = {"file": name, "seconds": seconds, "until": time.time() + seconds}
+        self._thread = threading.Thread(
+            target=self._run, args=(name, seconds, target_thread or threading.get_ident(), started),
+            name="profiler", daemon=True,
+        )
+        self._thread.start()
+        logger.info(f"🔬 Profiling {get_process_name()} for {seconds:.0f}s -> {name}")
+        return dict(self.current)
+
+    def _run(self, name, seconds, target_thread, started):
+        own_tracing = not tracemalloc.is_tracing()
+        if own_tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        # Собственные выделения tracemalloc и профилировщика — шум
+        noise = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        mem_before = tracemalloc.take_snapshot().filter_traces(noise)
+
+        self_counts = Counter()  # функция на вершине стека
+        total_counts = Counter()  # функция где-либо в стеке
+        stacks = Counter()  # свёрнутые стеки (формат flamegraph)
+        samples = idle = 0
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(target_thread)
+                if frame is None:
+                    break
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                frame = None
+                samples += 1
+                if labels[0].split(" ", 1)[0].rsplit(".", 1)[-1] in IDLE_FUNCTIONS:
+                    idle += 1
+                self_counts[labels[0]] += 1
+                for label in set(labels):
+                    total_counts[label] += 1
+                stacks[";".join(reversed(labels))] += 1
+                time.sleep(SAMPLE_INTERVAL)
+
+            mem_after = tracemalloc.take_snapshot().filter_traces(noise)
+        finally:
+            if own_tracing:
+                tracemalloc.stop()
+
+        allocations = []
+        for stat in mem_after.compare_to(mem_before, "traceback")[:TOP_N]:
+            frames = [f"{os.path.relpath(f.filename, BASE_DIR) if f.filename.startswith(BASE_DIR) else f.filename}:{f.lineno}"
+                      for f in stat.traceback]
+            allocations.append({
+                "where": frames[-1] if frames else "?",
+                "traceback": frames,
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size,
+            })
+
+        def top(counter):
+            return [{"function": label, "samples": n, "percent": round(n * 100 / samples, 1)}
+                    for label, n in counter.most_common(TOP_N)] if samples else []
+
+        report = {
+            "process": get_process_name(),
+            "pid": os.getpid(),
+            "started": started.isoformat(timespec="seconds"),
+            "seconds": seconds,
+            "interval": SAMPLE_INTERVAL,
+            "samples": samples,
+            "idle_percent": round(idle * 100 / samples, 1) if samples else 0.0,
+            "top_self": top(self_counts),
+            "top_total": top(total_counts),
+            "stacks": [{"stack": stack, "samples": n} for stack, n in stacks.most_common(200)],
+            "allocations": allocations,
+            "memory_diff": sum(stat.size_diff for stat in mem_after.compare_to(mem_before, "filename")),
+        }
+        try:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            path = os.path.join(PROFILES_DIR, name)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False)
+            os.replace(f"{path}.tmp", path)
+            logger.info(f"🔬 Profile written: {name} ({samples} samples)")
+        except OSError as e:
+            logger.error(f"profile write error {name}: {e}")
+        self.current = None
+
+profiler = Profiler()
+
+def register_profile_control(control):
+    """Команда control socket: profile [seconds=30]."""
+
+    @control.command("profile")
+    async def profile_command(seconds: float = 30):
+        return profiler.start(seconds)
+
+# --- Отчёты ---
+def list_profiles() -> list[dict]:
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    result = []
+    for filename in os.listdir(PROFILES_DIR):
+        if not _NAME_RE.match(filename):
+            continue
+        stat = os.stat(os.path.join(PROFILES_DIR, filename))
+        result.append({"name": filename, "size": stat.st_size, "mtime": stat.st_mtime})
+    return sorted(result, key=lambda p: p["mtime"], reverse=True)
+
+def read_profile(name: str) -> dict | None:
+    if not _NAME_RE.match(name):
+        return None
+    try:
+        with open(os.path.join(PROFILES_DIR, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -1,38 +1,165 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
 from telegram import Bot
+from telegram.error import RetryAfter, BadRequest, NetworkError, TimedOut
 from src.logger import logger
+from src.utils.metrics import counter, histogram
 
-async def safe_reply(bot: Bot, chat_id, text: str, thread_id=None, **kwargs):
+# --- Лимиты Telegram Bot API ---
+GLOBAL_RATE = 30  # сообщений в секунду на бота
+PRIVATE_RATE, PRIVATE_BURST = 1.0, 1  # личные чаты: ~1 сообщение в секунду
+GROUP_RATE, GROUP_BURST = 20 / 60, 3  # группы: 20 сообщений в минуту
+MAX_CHAT_BUCKETS = 1000
+
+# --- Повторы ---
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0  # сек
+BACKOFF_MAX = 30.0
+
+# --- Приоритеты: фоновые отправки ждут, пока есть интерактивные ---
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_DELIVERIES = counter("telegram_deliveries_total", "Bot API sends by result", ["result"])
+_stats = {result: _DELIVERIES.labels(result) for result in ("sent", "retried", "throttled", "failed")}
+_RETRY_AFTER = counter("telegram_retry_after_seconds_total", "Seconds of RetryAfter imposed by Telegram")
+_SEND_SECONDS = histogram("telegram_send_seconds", "Bot API call duration (without limiter wait)")
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # RetryAfter от Telegram
+
+    def wait_time(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        return now >= self.blocked_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class DeliveryLimiter:
+    """Общий и поканальный token bucket, один на процесс бота."""
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.interactive_waiting = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                for key in [k for k, b in self.chat_buckets.items() if b.idle(now)]:
+                    del self.chat_buckets[key]
+            is_group = isinstance(chat_id, str) or chat_id < 0  # @username или отрицательный id
+            rate, burst = (GROUP_RATE, GROUP_BURST) if is_group else (PRIVATE_RATE, PRIVATE_BURST)
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, burst)
+        return bucket
+
+    def pause(self, chat_id, seconds: float):
+        self._chat_bucket(chat_id).blocked_until = time.monotonic() + seconds
+
+    async def acquire(self, chat_id, priority: int):
+        interactive = priority == PRIORITY_INTERACTIVE
+        if interactive:
+            self.interactive_waiting += 1
+        throttled = False
+        try:
+            while True:
+                if not interactive and self.interactive_waiting:
+                    delay = 0.05
+                else:
+                    now = time.monotonic()
+                    chat_bucket = self._chat_bucket(chat_id)
+                    delay = max(self.global_bucket.wait_time(now), chat_bucket.wait_time(now))
+                    if delay <= 0:
+                        self.global_bucket.take()
+                        chat_bucket.take()
+                        return
+                if not throttled:
+                    throttled = True
+                    _stats["throttled"].inc()
+                await asyncio.sleep(delay)
+        finally:
+            if interactive:
+                self.interactive_waiting -= 1
+
+limiter = DeliveryLimiter()
+
+def get_delivery_stats() -> dict:
+    return {**{k: int(v.value) for k, v in _stats.items()}, "chats": len(limiter.chat_buckets), "interactive_waiting": limiter.interactive_waiting}
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    value = e.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+async def deliver(send, chat_id, thread_id=None, priority=PRIORITY_INTERACTIVE, before_attempt=None):
     """
-    Безопасная отправка текста. Если thread_id указан — отправка в тред.
+    Отправка через лимитер с повторами.
+    send(**extra) — корутина отправки; extra содержит message_thread_id, если тред задан.
+    RetryAfter выдерживается точно, сетевые ошибки — экспоненциальная пауза с джиттером.
+    Без треда повторяем только если Telegram ответил, что тред не найден.
     """
-    try:
-        if thread_id:
-            return await bot.send_message(chat_id, text, message_thread_id=thread_id, **kwargs)
-        return await bot.send_message(chat_id, text, **kwargs)
-    except Exception as e:
-        logger.warning("safe_reply error: %s", e)
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.acquire(chat_id, priority)
+        if before_attempt:
+            before_attempt()
         try:
-            return await bot.send_message(chat_id, text, **kwargs)
+            extra = {"message_thread_id": thread_id} if thread_id else {}
+            with _SEND_SECONDS.time():
+                result = await send(**extra)
+            _stats["sent"].inc()
+            return result
+        except RetryAfter as e:
+            seconds = _retry_after_seconds(e)
+            logger.warning("deliver: RetryAfter %ss for chat %s", seconds, chat_id)
+            limiter.pause(chat_id, seconds)
+            _RETRY_AFTER.inc(seconds)
+        except BadRequest as e:
+            if thread_id and "thread not found" in str(e).lower():
+                logger.warning("deliver: thread %s not found in chat %s, sending without thread", thread_id, chat_id)
+                thread_id = None
+            else:
+                logger.warning("deliver: bad request for chat %s: %s", chat_id, e)
+                break
+        except (TimedOut, NetworkError) as e:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning("deliver: network error for chat %s: %s, retry in %.1fs", chat_id, e, delay)
+            await asyncio.sleep(delay)
         except Exception:
-            logger.exception("safe_reply final error")
-            return None
+            logger.exception("deliver: unexpected error for chat %s", chat_id)
+            break
+        _stats["retried"].inc()
+    _stats["failed"].inc()
+    return None
 
-async def safe_reply_photo(bot: Bot, chat_id, photo_buf, caption=None, thread_id=None, **kwargs):
+async def safe_reply(bot: Bot, chat_id, text: str, thread_id=None, priority=PRIORITY_INTERACTIVE, **kwargs):
+    """
+    Безопасная отправка текста. Если thread_id указан — отправка в тред.
+    """
+    async def send(**extra):
+        return await bot.send_message(chat_id, text, **kwargs, **extra)
+    return await deliver(send, chat_id, thread_id, priority)
+
+async def safe_reply_photo(bot: Bot, chat_id, photo_buf, caption=None, thread_id=None,
+                           priority=PRIORITY_INTERACTIVE, **kwargs):
     """
     Безопасная отправка фото. Если thread_id указан — отправка в тред.
     """
     if not photo_buf:
         return None
-    try:
-        photo_buf.seek(0)
-        if thread_id:
-            return await bot.send_photo(chat_id, photo=photo_buf, caption=caption, message_thread_id=thread_id, **kwargs)
-        return await bot.send_photo(chat_id, photo=photo_buf, caption=caption, **kwargs)
-    except Exception as e:
-        logger.warning("safe_reply_photo error: %s", e)
-        try:
-            photo_buf.seek(0)
-            return await bot.send_photo(chat_id, photo=photo_buf, caption=caption, **kwargs)
-        except Exception:
-            logger.exception("safe_reply_photo final error")
-            return None
+    async def send(**extra):
+        return await bot.send_photo(chat_id, photo=photo_buf, caption=caption, **kwargs, **extra)
+    return await deliver(send, chat_id, thread_id, priority, before_attempt=lambda: photo_buf.seek(0))
@@ -1,7 +1,11 @@
 # src/utils.py
+import fcntl
 import json
 import os
+import time
+from contextlib import contextmanager
 from src.logger import logger
+from src.utils.metrics import histogram
 from datetime import datetime
 
 def ensure_dir(path):
@@ -16,40 +20,83 @@ def ensure_file(path, default):
         except Exception as e:
             logger.error(f"ensure_file write error {path}: {e}")
 
+@contextmanager
+def file_lock(path):
+    """
+    Межпроцессная advisory-блокировка (fcntl.flock) на файл-спутник <path>.lock.
+    Защищает циклы чтение-изменение-запись между ботами и веб-панелью.
+    """
+    ensure_dir(os.path.dirname(path))
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+JSON_IO_SECONDS = histogram("json_io_seconds", "JSON file load/save duration", ["op", "file"])
+
 def load_json(path, default):
     ensure_file(path, default)
     try:
-        with open(path, "r", encoding="utf-8") as f:
+        with JSON_IO_SECONDS.labels("load", os.path.basename(path)).time(), \
+                open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception as e:
         logger.error(f"load_json error {path}: {e}")
         return default
 
+def atomic_write_json(path, data, indent=2):
+    """
+    Временный файл + fsync + rename: при падении посреди записи на диске
+    остаётся либо старая, либо новая версия, но не обрезанный JSON.
+    """
+    replace_durable(write_tmp(path, json.dumps(data, ensure_ascii=False, indent=indent)), path)
+
+def write_tmp(path, text: str, fsync: bool = True) -> str:
+    """Текст во временный файл рядом с path (для replace_durable); возвращает его путь."""
+    ensure_dir(os.path.dirname(path) or ".")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    return tmp
+
+def replace_durable(tmp, path):
+    os.replace(tmp, path)
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)  # сам rename тоже должен пережить сбой питания
+    finally:
+        os.close(dir_fd)
+
 def save_json(path, data):
     try:
-        ensure_dir(os.path.dirname(path))
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with JSON_IO_SECONDS.labels("save", os.path.basename(path)).time():
+            atomic_write_json(path, data)
     except Exception as e:
         logger.error(f"save_json error {path}: {e}")
 
 def record_stat(stats_path, channel):
     """
     Append a simple record for stats (date + channel).
-    stats stored as list of {"date":"YYYY-MM-DD","channel":"-100... or @name"}
+    stats stored as list of {"date":"YYYY-MM-DD","channel":"-100... or @name","ts":unix}
+    (ts — for minute/hour rollups; older entries have only the date).
+    Goes through the write-behind store: one journal line per call, snapshot coalesced.
     """
-    stats = load_json(stats_path, [])
-    date = datetime.utcnow().strftime("%Y-%m-%d")
-    stats.append({"date": date, "channel": channel})
-    save_json(stats_path, stats)
+    from src.utils.jsonstore import open_store
+    now = time.time()
+    date = datetime.utcfromtimestamp(now).strftime("%Y-%m-%d")
+    open_store(stats_path, [], fsync=False).append({"date": date, "channel": channel, "ts": int(now)})
 
 def tail(path, lines=200):
     if not os.path.exists(path):
         return []
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            all_lines = f.read().splitlines()
-            return all_lines[-lines:]
+        from src.utils.logs import tail_lines
+        return tail_lines(path, lines)[0]
     except Exception as e:
         logger.error(f"tail error {path}: {e}")
         return []
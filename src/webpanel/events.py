@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from src.logger import logger
+
+# Push-канал дашборда (/api/events, SSE). Один опрос на воркер панели, а не на
+# вкладку: источники проверяют дешёвую версию (mtime/размер файла) раз в
+# POLL_INTERVAL и только пока есть подписчики; данные перечитываются лишь при
+# смене версии, клиентам уходит разница с прошлым состоянием.
+
+POLL_INTERVAL = 2.0  # сек
+MAX_QUEUE = 100  # событий на клиента; переполнение — клиент отключается и переподключится со снимком
+RESYNC = "resync"
+
+def diff(old: dict, new: dict) -> dict | None:
+    """Изменённые и удалённые ключи; None, если изменений нет."""
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    removed = [key for key in old if key not in new]
+    if not changed and not removed:
+        return None
+    return {"changed": changed, "removed": removed}
+
+class EventHub:
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.sources = {}  # имя -> (version_fn, payload_fn)
+        self.state = {}  # имя -> (версия, payload)
+        self.subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+        self._start_lock = asyncio.Lock()  # два клиента разом не запускают два опроса
+        self._poll_lock = threading.Lock()  # поток отменённого опроса может ещё работать
+
+    def source(self, name: str, version_fn, payload_fn):
+        """version_fn() — дешёвая проверка; payload_fn() -> dict, вызывается только при смене версии."""
+        self.sources[name] = (version_fn, payload_fn)
+
+    def _poll(self) -> list[tuple[str, dict]]:
+        with self._poll_lock:
+            return self._poll_sources()
+
+    def _poll_sources(self) -> list[tuple[str, dict]]:
+        changes = []
+        for name, (version_fn, payload_fn) in self.sources.items():
+            try:
+                version = version_fn()
+                old = self.state.get(name)
+                if old is not None and old[0] == version:
+                    continue
+                payload = payload_fn()
+            except Exception as e:
+                logger.warning(f"events: source {name} failed: {e}")
+                continue
+            if old is not None:
+                delta = diff(old[1], payload)
+                if delta:
+                    changes.append((name, delta))
+            self.state[name] = (version, payload)
+        return changes
+
+    async def subscribe(self) -> asyncio.Queue:
+        async with self._start_lock:
+            if self._task is None or self._task.done():
+                await asyncio.to_thread(self._poll)  # актуальный снимок до первого клиента
+                self._task = asyncio.create_task(self._run(), name="dashboard_events")
+            queue = asyncio.Queue(maxsize=MAX_QUEUE)
+            queue.put_nowait(("snapshot", {name: payload for name, (_, payload) in self.state.items()}))
+            self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            self.stop()  # никто не смотрит — не опрашиваем
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for name, delta in await asyncio.to_thread(self._poll):
+                for queue in list(self.subscribers):
+                    try:
+                        queue.put_nowait((name, delta))
+                    except asyncio.QueueFull:
+                        # Клиент не успевает: сбрасываем очередь, поток закроется, и браузер
+                        # переподключится, получив свежий снимок
+                        while not queue.empty():
+                            queue.get_nowait()
+                        queue.put_nowait((RESYNC, None))
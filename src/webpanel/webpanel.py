@@ -1,22 +1,49 @@
 import os
-import sys
 import time
 import json
-import subprocess
+import asyncio
+import hashlib
+import threading
 from pathlib import Path
 from datetime import datetime
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import FastAPI, Request, Form, UploadFile, File
+from fastapi.responses import Response, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 # ------------------------
 # Абсолютные импорты через пакет src
 # ------------------------
-from src.utils.utils import load_json, save_json, ensure_dir
+from src.utils.utils import load_json, ensure_dir, file_lock
+from src.utils.ipc import send_command, send_command_async
+from src.utils.jsonstore import open_store, version as store_version
+from src.utils.logs import read_since, LogIndex, normalize_ts
+from src.bot.error_reporter import get_errors, flush_errors
+from src.utils.profiler import list_profiles, read_profile
+from src.services.records_service import (
+    shard_path, shard_name, parse_shard_name, list_tenants, read_shard, write_shard, append_changes,
+    migrate_legacy_records,
+)
+from src.services.analytics_service import analytics
+from src.services.records_io import detect_format, import_records, export_rows
+from src.services import rollup_service
+from src.bot import channel_import
+from src.services.query_service import query_records, record_facets, query_channels, StatsAggregate, file_version, cache
+from src.utils.metrics import counter, gauge, histogram, snapshot_loop, write_snapshot, read_snapshots, aggregate, render_prometheus
+from src.supervisor.supervisor import BOT_SPECS, read_state
+from src.supervisor.daemon import STATE_FILE as SUPERVISOR_STATE_FILE, PID_FILE as SUPERVISOR_PID_FILE
+from src.webpanel.events import EventHub, RESYNC
 from src import config
-from src.logger import logger
+from src.logger import logger, setup_logging, worker_log_name
+
+# Модуль импортирует uvicorn, поэтому не в __main__. При WEB_WORKERS > 1 мастер и каждый
+# воркер — отдельные процессы: у воркеров свои файлы webpanel-<n>.log, иначе они
+# ротировали бы один файл наперегонки; webpanel.log остаётся мастеру.
+if config.WEB_WORKERS > 1 and __name__ != "__main__":
+    setup_logging(worker_log_name("webpanel", config.WEB_WORKERS))
+else:
+    setup_logging("webpanel")
 
 # ------------------------
 # Директории и файлы
@@ -29,94 +56,42 @@ ensure_dir(LOGS_DIR)
 
 CHANNELS_FILE = Path(config.CHANNELS_FILE)
 STATS_FILE = Path(config.STATS_FILE)
-RECORDS_FILE = Path(config.RECORDS_FILE)
-ensure_dir(Path(RECORDS_FILE).parent / "logs")
+# channels.json/stats.json — через write-behind хранилище: чтение учитывает журнал,
+# правки из панели и ботов не затирают друг друга
+channels_store = open_store(CHANNELS_FILE, [])
+DEFAULT_CHAT = shard_name((config.GROUP_ID, None))  # рекорды основной группы
 
 STATIC_DIR = PROJECT_DIR / "static"
 TEMPLATES_DIR = PROJECT_DIR / "templates"
 ensure_dir(STATIC_DIR)
 
 # ------------------------
-# Bot management
+# Bot management (через supervisor daemon)
 # ------------------------
-class Bot:
-    def __init__(self, name: str, module: str):
-        self.name = name
-        self.module = module  # модуль для запуска через -m
-        self.proc: subprocess.Popen | None = None
-        self.log_file: Path | None = None
-        self.active = False
-
-    def is_running(self):
-        return self.proc is not None and self.proc.poll() is None
-
-    def start(self):
-        if self.is_running():
-            logger.info(f"✅ {self.name} уже запущен")
-            return True
+SUPERVISOR = "supervisor"
+CONTROL_NAMES = {spec.name: spec.control for spec in BOT_SPECS}
+SUPERVISOR_OFFLINE = {"status": "error", "message": "Supervisor is not running (python3 main.py start)"}
 
-        self.log_file = LOGS_DIR / f"{self.name.lower()}_subprocess.log"
-        log_handle = open(self.log_file, "a", encoding="utf-8")
-        log_handle.write(f"\n=== Bot started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-        log_handle.flush()
-
-        env = dict(**os.environ)
-        env["PYTHONPATH"] = str(ROOT_DIR.parent)
-        env["PYTHONUNBUFFERED"] = "1"
-
-        try:
-            self.proc = subprocess.Popen(
-                [sys.executable, "-m", self.module],
-                stdout=log_handle,
-                stderr=subprocess.STDOUT,
-                cwd=ROOT_DIR.parent,
-                env=env,
-            )
-            time.sleep(1)
-            if self.proc.poll() is not None:
-                logger.error(f"❌ {self.name} crashed immediately. Check logs: {self.log_file}")
-                return False
-            self.active = True
-            logger.info(f"✅ {self.name} started successfully (PID {self.proc.pid})")
-            return True
-        except Exception as e:
-            logger.exception(f"❌ Failed to start {self.name}: {e}")
-            return False
-
-    def stop(self):
-        if not self.is_running():
-            logger.info(f"ℹ️ {self.name} не запущен")
-            return False
-        try:
-            self.proc.terminate()
-            self.proc.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            self.proc.kill()
-            self.proc.wait()
-        finally:
-            self.proc = None
-            self.active = False
-        logger.info(f"✅ {self.name} stopped")
-        return True
+def control_name(name: str) -> str | None:
+    return CONTROL_NAMES.get(name)
 
-# ------------------------
-# Initialize bots
-# ------------------------
-bot_status = {
-    "Forwarder": Bot("Forwarder", "src.bot.forwarder"),
-    "Records": Bot("Records", "src.bot.sil_bot"),
-}
+def notify_forwarder_reload():
+    """Просим forwarder сразу перечитать каналы (если он запущен)."""
+    send_command(control_name("Forwarder"), "reload", timeout=1.0)
 
 # ------------------------
-# Lifespan для корректного завершения
+# Lifespan
 # ------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("🚀 WebPanel starting...")
+    migrate_legacy_records()
+    snapshots = asyncio.create_task(snapshot_loop("webpanel"))
     yield
-    logger.info("🛑 Shutting down WebPanel, stopping all bots...")
-    for bot in bot_status.values():
-        bot.stop()
+    snapshots.cancel()
+    event_hub.stop()
+    # Боты принадлежат supervisor daemon и продолжают работать
+    logger.info("🛑 Shutting down WebPanel")
 
 # ------------------------
 # FastAPI app
@@ -126,110 +101,564 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 templates.env.globals.update(enumerate=enumerate, len=len, range=range, zip=zip, str=str)
 
+# ------------------------
+# Metrics
+# ------------------------
+HTTP_REQUESTS = counter("webpanel_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_SECONDS = histogram("webpanel_request_seconds", "HTTP request duration", ["route"])
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Шаблон маршрута, а не путь: /api/bots/{action}, а не /api/bots/start
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_SECONDS.labels(route).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+    return response
+
+# ------------------------
+# Conditional GET (ETag / If-None-Match)
+# ------------------------
+def make_etag(*parts) -> str:
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest() + '"'
+
+def conditional(request: Request, version, build):
+    """
+    ETag = версия хранилища (mtime/размер файла) + путь и параметры запроса.
+    Совпал If-None-Match — 304 без чтения данных; no-cache заставляет браузер
+    перепроверять ответ при каждом fetch(), так что дашборду ничего делать не нужно.
+    """
+    etag = make_etag(request.url.path, request.url.query, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    result = build()
+    if isinstance(result, Response):  # ошибки (400 и т.п.) не кешируются
+        return result
+    return JSONResponse(result, headers=headers)
+
 # ------------------------
 # Routes
 # ------------------------
 @app.get("/admin")
 def admin(request: Request):
-    channels = load_json(CHANNELS_FILE, [])
-    stats = load_json(STATS_FILE, {})
-    records = load_json(RECORDS_FILE, [])
+    # Данные (рекорды, каналы, статистика, боты) страница подгружает через API —
+    # размер и время отдачи не зависят от объёма истории
     log_files = sorted([f.name for f in LOGS_DIR.glob("*.log")], reverse=True)
-    bots = [{"name": b.name, "active": b.is_running()} for b in bot_status.values()]
-
     return templates.TemplateResponse(
         "dashboard.html",
-        {"request": request, "channels": channels, "stats": stats, "records": records, "logs": log_files, "bots": bots}
+        {"request": request, "logs": log_files, "default_chat": DEFAULT_CHAT,
+         "profilable": [name for name, control in CONTROL_NAMES.items() if control]}
     )
 
+def _bad_query(e: ValueError):
+    return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+def records_path(chat: str | None) -> Path:
+    """Файл рекордов чата; chat — имя шарда (<chat_id> или <chat_id>_<topic>)."""
+    tenant = parse_shard_name(chat or DEFAULT_CHAT)
+    if tenant is None:
+        raise ValueError(f"invalid chat '{chat}'")
+    return Path(shard_path(tenant))
+
+def _records_versions() -> tuple:
+    return tuple((shard_name(t), file_version(shard_path(t))) for t in list_tenants())
+
+# --- Read API (курсорная пагинация) ---
+@app.get("/api/records/chats")
+def list_record_chats(request: Request):
+    return conditional(request, _records_versions(), lambda: [
+        {"chat": shard_name(t), "total": len(cache.load(shard_path(t), [])[0])} for t in list_tenants()])
+
+@app.get("/api/records")
+def list_records(request: Request, chat: str | None = None, user: str | None = None, movement: str | None = None,
+                 date_from: str | None = None, date_to: str | None = None,
+                 sort: str = "date", order: str = "desc", cursor: str | None = None, limit: int = 50):
+    try:
+        path = records_path(chat)
+    except ValueError as e:
+        return _bad_query(e)
+
+    def build():
+        try:
+            return query_records(path, user, movement, date_from, date_to, sort, order, cursor, limit)
+        except ValueError as e:
+            return _bad_query(e)
+    return conditional(request, file_version(path), build)
+
+@app.get("/api/records/facets")
+def get_record_facets(request: Request, chat: str | None = None):
+    try:
+        path = records_path(chat)
+    except ValueError as e:
+        return _bad_query(e)
+    return conditional(request, file_version(path), lambda: record_facets(path))
+
+@app.get("/api/analytics")
+def get_analytics(request: Request, chat: str | None = None, movement: str | None = None):
+    """e1RM, DOTS, перцентили и прогресс по истории чата (кеш по версии файлов)."""
+    tenant = parse_shard_name(chat or DEFAULT_CHAT)
+    if tenant is None:
+        return _bad_query(ValueError(f"invalid chat '{chat}'"))
+    return conditional(request, analytics.version(tenant), lambda: analytics.get(tenant).to_dict(movement))
+
+@app.get("/api/channels")
+def list_channels(request: Request, q: str | None = None, cursor: str | None = None, limit: int = 100):
+    def build():
+        try:
+            return query_channels(CHANNELS_FILE, q, cursor, limit)
+        except ValueError as e:
+            return _bad_query(e)
+    return conditional(request, store_version(CHANNELS_FILE), build)
+
+stats_aggregate = StatsAggregate(STATS_FILE)
+
+@app.get("/api/stats")
+def get_stats(request: Request, channel: str | None = None, date_from: str | None = None,
+              date_to: str | None = None, cursor: str | None = None, limit: int = 100):
+    """Пересылки по каналам и дням (агрегация на сервере), новые дни первыми."""
+    def build():
+        try:
+            return stats_aggregate.query(channel, date_from, date_to, cursor, limit)
+        except ValueError as e:
+            return _bad_query(e)
+    return conditional(request, store_version(STATS_FILE), build)
+
+@app.get("/api/rollups")
+def get_rollups(request: Request, resolution: str = "hour", span: int | None = None, channel: str | None = None):
+    """
+    Пересылки по каналам из готовых корзин (минута/час/день) для графиков.
+    Ответ кешируется, пока нет новых пересылок и не началась следующая корзина.
+    """
+    if resolution not in rollup_service.RESOLUTIONS:
+        return _bad_query(ValueError(f"unknown resolution '{resolution}'"))
+    end = rollup_service.bucket(time.time(), resolution)
+
+    def build():
+        with rollup_service.rollup_store().transaction() as tx:
+            version = (tx.snapshot, tx.offset)
+            return cache.view(("rollups", version, resolution, span, channel, end),
+                              lambda: rollup_service.series(tx.data, resolution, end, span, channel))
+    return conditional(request, (store_version(config.ROLLUPS_FILE), end), build)
+
+# --- Push-события дашборда (SSE) ---
+EVENTS_KEEPALIVE = 15.0  # сек
+
+def _supervisor_alive() -> bool:
+    try:
+        os.kill(int(Path(SUPERVISOR_PID_FILE).read_text().strip()), 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+def _bots_payload() -> dict:
+    state = read_state(SUPERVISOR_STATE_FILE) if _supervisor_alive() else None
+    if not state:
+        return {}  # пусто — supervisor не запущен
+    # uptime меняется каждую секунду, а CPU/RSS — при каждом замере; округляем,
+    # чтобы дельты уходили при заметных изменениях, а не на каждый тик
+    return {bot["name"]: {**bot, "uptime": None, "cpu_percent": round(bot.get("cpu_percent") or 0),
+                          "rss": round((bot.get("rss") or 0) / 2 ** 20) * 2 ** 20}
+            for bot in state.get("processes", [])}
+
+def _counters_payload() -> dict:
+    stats_aggregate.refresh()
+    today = datetime.now().strftime("%Y-%m-%d")
+    counts = stats_aggregate.counts
+    return {"forwarded": sum(counts.values()),
+            "today": sum(n for (_, date), n in counts.items() if date == today)}
+
+def _errors_payload() -> dict:
+    errors = load_json(config.ERRORS_FILE, {})
+    return {"fingerprints": len(errors), "total": sum(e.get("count", 0) for e in errors.values())}
+
+def _store_payload(path) -> dict:
+    data, version = cache.load(path, [])  # тот же разобранный файл, что и у /api/records, /api/channels
+    return {"total": len(data), "version": make_etag(version)}
+
+def _records_payload() -> dict:
+    return {shard_name(t): _store_payload(shard_path(t)) for t in list_tenants()}
+
+event_hub = EventHub()
+event_hub.source("bots", lambda: (file_version(SUPERVISOR_STATE_FILE), _supervisor_alive()), _bots_payload)
+event_hub.source("counters", lambda: store_version(STATS_FILE), _counters_payload)
+event_hub.source("errors", lambda: file_version(config.ERRORS_FILE), _errors_payload)
+event_hub.source("records", _records_versions, _records_payload)  # по чатам: {chat: {total, version}}
+event_hub.source("channels", lambda: store_version(CHANNELS_FILE), lambda: {"all": _store_payload(CHANNELS_FILE)})
+gauge("webpanel_event_subscribers", "Open dashboard event streams").set_function(lambda: len(event_hub.subscribers))
+
+@app.get("/api/events")
+async def dashboard_events(request: Request):
+    """
+    Server-Sent Events: сначала snapshot, затем только изменения
+    (event: bots|counters|errors|records|channels, data: {changed, removed}).
+    """
+    queue = await event_hub.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    name, data = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if name == RESYNC:
+                    break  # браузер переподключится и получит свежий snapshot
+                yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            event_hub.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 # --- Channels API ---
+def _start_channel_import(text: str, replace: str | None = None) -> JSONResponse:
+    """Каналы проверяет forwarder фоновым заданием (import_channels); в channels.json — только найденные."""
+    args = {"replace": replace} if replace else {}
+    response = send_command(control_name("Forwarder"), "import_channels", text=text, **args)
+    if response is None:
+        return JSONResponse({"status": "error", "message": "Forwarder is not reachable: it validates channels"},
+                            status_code=503)
+    if not response.get("ok"):
+        return JSONResponse({"status": "error", "message": response.get("error")}, status_code=409)
+    return JSONResponse({"status": "ok", "job": response["result"]})
+
+def _single_channel(name: str) -> str:
+    channel = channel_import.normalize(name)
+    if channel is None:
+        raise ValueError(f"'{name}' is not a channel username or t.me link")
+    return channel
+
 @app.post("/api/channels/add")
 def add_channel(name: str = Form(...)):
-    channels = load_json(CHANNELS_FILE, [])
-    if name and name not in channels:
-        channels.append(name)
-        save_json(CHANNELS_FILE, channels)
-    return JSONResponse({"status": "ok"})
+    """Один канал — тем же заданием, что и импорт: ответ — задание, отчёт — GET /api/channels/import/{job}."""
+    try:
+        channel = _single_channel(name)
+    except ValueError as e:
+        return _bad_query(e)
+    return _start_channel_import(channel)
 
 @app.post("/api/channels/delete")
 def delete_channel(name: str = Form(...)):
-    channels = load_json(CHANNELS_FILE, [])
-    if name in channels:
-        channels.remove(name)
-        save_json(CHANNELS_FILE, channels)
+    with channels_store.transaction() as tx:
+        changed = name in tx.data
+        if changed:
+            tx.remove(name)
+    if changed:
+        notify_forwarder_reload()
     return JSONResponse({"status": "ok"})
 
 @app.post("/api/channels/edit")
 def edit_channel(old_name: str = Form(...), new_name: str = Form(...)):
-    channels = load_json(CHANNELS_FILE, [])
-    if old_name in channels and new_name:
-        idx = channels.index(old_name)
-        channels[idx] = new_name
-        save_json(CHANNELS_FILE, channels)
-    return JSONResponse({"status": "ok"})
+    """Новое имя проверяется в Telegram и встаёт на место old_name, только если канал найден."""
+    try:
+        channel = _single_channel(new_name)
+    except ValueError as e:
+        return _bad_query(e)
+    if old_name not in channels_store.get():
+        return JSONResponse({"status": "error", "message": f"Channel {old_name} not found"}, status_code=404)
+    return _start_channel_import(channel, replace=old_name)
+
+CHANNEL_IMPORT_FILE_LIMIT = 256 * 1024  # байт
+
+@app.post("/api/channels/import")
+def import_channels(text: str | None = Form(None), file: UploadFile | None = File(None)):
+    """
+    Список каналов (текст и/или файл .txt/.csv): forwarder проверяет их в Telegram
+    фоновым заданием и добавляет найденные одной записью. Ответ — задание,
+    ход и отчёт по каждому элементу — GET /api/channels/import/{job}.
+    """
+    if file is not None:
+        data = file.file.read(CHANNEL_IMPORT_FILE_LIMIT + 1)
+        if len(data) > CHANNEL_IMPORT_FILE_LIMIT:
+            return _bad_query(ValueError(f"file is too large (> {CHANNEL_IMPORT_FILE_LIMIT // 1024} KB)"))
+        text = f"{text or ''}\n{data.decode('utf-8-sig', errors='replace')}"
+    tokens = channel_import.parse_channels(text)
+    if not tokens:
+        return _bad_query(ValueError("no channels in the list"))
+    if len(tokens) > config.CHANNEL_IMPORT_LIMIT:
+        return _bad_query(ValueError(f"too many channels: {len(tokens)} > {config.CHANNEL_IMPORT_LIMIT}, split the list"))
+    return _start_channel_import("\n".join(tokens))
+
+@app.get("/api/channels/import/{job_id}")
+def import_channels_status(job_id: str):
+    response = send_command(control_name("Forwarder"), "import_status", job=job_id)
+    if response is None:
+        return JSONResponse({"status": "error", "message": "Forwarder is not reachable"}, status_code=503)
+    if not response.get("ok"):
+        return JSONResponse({"status": "error", "message": response.get("error")}, status_code=409)
+    if response["result"] is None:
+        # Задания нет: forwarder перезапущен или отчёт вытеснен более новыми
+        return JSONResponse({"status": "error", "message": "Import job not found"}, status_code=404)
+    return JSONResponse({"status": "ok", "job": response["result"]})
 
 # --- Logs API ---
+LOG_FOLLOW_INTERVAL = 1.0  # сек
+LOG_KEEPALIVE = 15.0  # сек
+
+def _log_path(file: str) -> Path | None:
+    path = (LOGS_DIR / file).resolve()
+    if path.parent != LOGS_DIR.resolve() or not path.is_file():
+        return None
+    return path
+
 @app.get("/api/logs")
 def get_log(file: str):
-    path = LOGS_DIR / file
-    if not path.exists():
+    path = _log_path(file)
+    if not path:
         return PlainTextResponse("File not found", status_code=404)
     return PlainTextResponse(path.read_text(encoding="utf-8"))
 
+@app.get("/api/logs/tail")
+def tail_log(file: str, lines: int = 200, cursor: str | None = None):
+    """Хвост лога (без cursor) или строки, дописанные после cursor."""
+    path = _log_path(file)
+    if not path:
+        return JSONResponse({"status": "error", "message": "File not found"}, status_code=404)
+    return read_since(path, cursor, max(1, min(lines, 5000)))
+
+_log_indexes: dict[Path, LogIndex] = {}
+_log_indexes_lock = threading.Lock()  # sync-эндпоинты идут в пуле потоков
+
+@app.get("/api/logs/search")
+def search_log(file: str, start: str | None = None, end: str | None = None,
+               level: str | None = None, q: str | None = None, limit: int = 5000):
+    """
+    Строки лога за интервал времени (учитывая ротации .1–.5),
+    например ?file=forwarder.log&start=14:00&end=14:10&level=ERROR.
+    """
+    path = _log_path(file)
+    if not path:
+        return JSONResponse({"status": "error", "message": "File not found"}, status_code=404)
+    today = datetime.now().strftime("%Y-%m-%d")
+    try:
+        start, end = normalize_ts(start, today), normalize_ts(end, today)
+    except ValueError as e:
+        return _bad_query(e)
+    with _log_indexes_lock:
+        index = _log_indexes.get(path)
+        if index is None:
+            index = _log_indexes[path] = LogIndex(path, LOGS_DIR / ".index")
+    lines = index.search(start, end, level, q, max(1, min(limit, 100_000)))
+    return StreamingResponse((line + "\n" for line in lines), media_type="text/plain; charset=utf-8")
+
+@app.get("/api/logs/follow")
+async def follow_log(request: Request, file: str, cursor: str | None = None, lines: int = 200):
+    """Server-Sent Events: отправляем только новые строки по мере их появления."""
+    path = _log_path(file)
+    if not path:
+        return JSONResponse({"status": "error", "message": "File not found"}, status_code=404)
+
+    async def events():
+        nonlocal cursor
+        idle = 0.0
+        while not await request.is_disconnected():
+            try:
+                chunk = await asyncio.to_thread(read_since, path, cursor, lines)
+            except FileNotFoundError:
+                chunk = {"lines": [], "cursor": cursor, "reset": False}
+            if chunk["lines"] or chunk["cursor"] != cursor:
+                cursor = chunk["cursor"]
+                idle = 0.0
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            elif idle >= LOG_KEEPALIVE:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(LOG_FOLLOW_INTERVAL)
+            idle += LOG_FOLLOW_INTERVAL
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# --- Errors API ---
+@app.get("/api/errors")
+def get_errors_view(request: Request, limit: int = 100):
+    flush_errors()  # ошибки самой панели — в файл до вычисления версии
+    return conditional(request, file_version(config.ERRORS_FILE), lambda: get_errors()[:limit])
+
+# --- Metrics API ---
+def _collect_metrics():
+    write_snapshot("webpanel")  # свой снимок — свежий, остальные не старше SNAPSHOT_INTERVAL
+    return aggregate(read_snapshots())
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(render_prometheus(_collect_metrics()), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/metrics")
+def get_metrics(request: Request):
+    metrics = _collect_metrics()
+    return conditional(request, metrics, lambda: metrics)
+
+# --- Profiles API ---
+@app.get("/api/profiles")
+def get_profiles(request: Request):
+    return conditional(request, file_version(config.PROFILES_DIR), list_profiles)
+
+@app.get("/api/profiles/{profile}")
+def get_profile(profile: str):
+    report = read_profile(profile)
+    if report is None:
+        return JSONResponse({"status": "error", "message": "Profile not found"}, status_code=404)
+    return report
+
+@app.post("/api/profile")
+def start_profile(name: str = Form(...), seconds: float = Form(30)):
+    control = control_name(name)
+    if not control:
+        return JSONResponse({"status": "error", "message": f"Bot '{name}' cannot be profiled"}, status_code=404)
+    response = send_command(control, "profile", seconds=seconds)
+    if response is None:
+        return JSONResponse({"status": "error", "message": f"{name} is not reachable"}, status_code=503)
+    if not response.get("ok"):
+        return JSONResponse({"status": "error", "message": response.get("error")}, status_code=409)
+    return JSONResponse({"status": "ok", **response["result"]})
+
 # --- Bots API ---
 @app.get("/api/bots")
-def get_bots():
-    return [{"name": b.name, "active": b.is_running()} for b in bot_status.values()]
+async def get_bots(request: Request):
+    response = await send_command_async(SUPERVISOR, "status")
+    if response is None:
+        return JSONResponse(SUPERVISOR_OFFLINE, status_code=503)
+    bots = response["result"]
+    return conditional(request, [{**bot, "uptime": None} for bot in bots], lambda: bots)
 
 @app.post("/api/bots/{action}")
-def control_bot(action: str, name: str = Form(...)):
-    bot = bot_status.get(name)
-    if not bot:
-        return JSONResponse({"status": "error", "message": f"Bot '{name}' not found"}, status_code=404)
+async def control_bot(action: str, name: str = Form(...)):
+    if action not in ("start", "stop", "restart"):
+        return JSONResponse({"status": "error", "message": f"Unknown action '{action}'"}, status_code=400)
+    # Supervisor только меняет желаемое состояние — запрос не ждёт запуска/остановки
+    response = await send_command_async(SUPERVISOR, action, bot=name)
+    if response is None:
+        return JSONResponse(SUPERVISOR_OFFLINE, status_code=503)
+    if not response.get("ok"):
+        return JSONResponse({"status": "error", "message": response.get("error")}, status_code=400)
+    return JSONResponse({"status": "ok", "message": f"{action} {name} scheduled", "bot": response["result"]})
 
-    if action in ("start", "restart"):
-        if action == "restart":
-            bot.stop()
-        success = bot.start()
-        if not success:
-            return JSONResponse({"status": "error", "message": f"Start {name} failed"}, status_code=500)
-    elif action == "stop":
-        bot.stop()
-    else:
+@app.post("/api/control/{action}")
+def control_command(action: str, name: str = Form(...), enabled: bool | None = Form(None)):
+    control = control_name(name)
+    if not control:
+        return JSONResponse({"status": "error", "message": f"Bot '{name}' not found"}, status_code=404)
+    if action not in ("status", "reload", "loop", "queues"):
         return JSONResponse({"status": "error", "message": f"Unknown action '{action}'"}, status_code=400)
-    return JSONResponse({"status": "ok", "message": f"{action} {name} successful"})
+    # loop: отчёт монитора event loop; enabled=true/false включает/выключает его без перезапуска
+    # queues: очереди forwarder по каналам (глубина, ожидание, веса)
+    args = {"enabled": enabled} if action == "loop" and enabled is not None else {}
+    response = send_command(control, action, **args)
+    if response is None:
+        return JSONResponse({"status": "error", "message": f"{name} is not reachable"}, status_code=503)
+    if not response.get("ok"):
+        return JSONResponse({"status": "error", "message": response.get("error")}, status_code=500)
+    return JSONResponse({"status": "ok", "result": response["result"]})
+
+# --- Reports API ---
+@app.post("/api/report")
+def request_report(chat: str | None = Form(None)):
+    # chat — отчёт одному чату; без него бот отправит каждому чату его таблицу
+    if chat and parse_shard_name(chat) is None:
+        return _bad_query(ValueError(f"invalid chat '{chat}'"))
+    response = send_command(control_name("Records"), "report", **({"chat": chat} if chat else {}))
+    if response and response.get("ok"):
+        return JSONResponse({"status": "ok", "via": "socket", **response["result"]})
+    # Бот недоступен по сокету — оставляем триггер-файл, он подхватит его при запуске
+    ensure_dir(config.REQUESTS_DIR)
+    trigger = Path(config.REQUESTS_DIR) / f"report_trigger_{int(time.time() * 1000)}"
+    trigger.touch()
+    return JSONResponse({"status": "ok", "via": "file"})
 
 # --- Records API ---
+def _update_records(chat: str | None, mutate):
+    """
+    Чтение-изменение-запись шарда под той же блокировкой, что у писателя бота.
+    mutate(records) -> (добавленные, удалённые) или None, если менять нечего;
+    изменения дописываются и в историю — иначе аналитика их не увидит.
+    """
+    try:
+        path = records_path(chat)
+    except ValueError as e:
+        return _bad_query(e)
+    try:
+        with file_lock(path):
+            records = read_shard(path)
+            before = list(records)
+            changes = mutate(records)
+            if changes is not None:
+                write_shard(path, records)
+                append_changes(parse_shard_name(path.name), before, *changes)
+    except OSError as e:
+        return JSONResponse({"status": "error", "message": f"records not saved: {e}"}, status_code=500)
+    return JSONResponse({"status": "ok"})
+
+@app.post("/api/records/import")
+def import_records_file(file: UploadFile = File(...), chat: str | None = Form(None),
+                        format: str | None = Form(None), dry_run: bool = Form(False)):
+    """
+    CSV (заголовок user,movement,weight,date[,reps]) или JSON Lines. Файл читается
+    потоком; все строки — в историю, в шард — последняя по каждому движению
+    пользователя (records_io.import_records); dry_run=true — только отчёт.
+    """
+    try:
+        tenant = parse_shard_name(chat or DEFAULT_CHAT)
+        if tenant is None:
+            raise ValueError(f"invalid chat '{chat}'")
+        report = import_records(file.file, detect_format(file.filename, format), tenant, dry_run)
+    except (ValueError, UnicodeDecodeError) as e:
+        return _bad_query(ValueError(str(e)))
+    except OSError as e:
+        return JSONResponse({"status": "error", "message": f"records not saved: {e}"}, status_code=500)
+    return JSONResponse({"status": "ok", **report})
+
+@app.get("/api/records/export")
+def export_records(chat: str | None = None, format: str = "csv"):
+    try:
+        path = records_path(chat)
+        fmt = detect_format(None, format)
+    except ValueError as e:
+        return _bad_query(e)
+    records, _ = cache.load(path, [])
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    filename = f"records-{path.stem}.{fmt}"
+    return StreamingResponse(export_rows(records, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.post("/api/records/add")
-def add_record(user: str = Form(...), movement: str = Form(...), weight: float = Form(...), date: str = Form(...)):
+def add_record(user: str = Form(...), movement: str = Form(...), weight: float = Form(...), date: str = Form(...),
+               chat: str | None = Form(None)):
     try:
         date = datetime.strptime(date, "%Y-%m-%d").strftime("%d.%m.%Y")
     except ValueError:
         pass
-    records = load_json(RECORDS_FILE, [])
-    records.append({"user": user, "movement": movement, "weight": weight, "date": date})
-    save_json(RECORDS_FILE, records)
-    return JSONResponse({"status": "ok"})
+    record = {"user": user, "movement": movement, "weight": weight, "date": date}
+
+    def mutate(records):
+        records.append(record)
+        return [record], []
+    return _update_records(chat, mutate)
 
 @app.post("/api/records/delete")
-def delete_record(index: int = Form(...)):
-    records = load_json(RECORDS_FILE, [])
-    if 0 <= index < len(records):
-        records.pop(index)
-        save_json(RECORDS_FILE, records)
-    return JSONResponse({"status": "ok"})
+def delete_record(index: int = Form(...), chat: str | None = Form(None)):
+    def mutate(records):
+        if not 0 <= index < len(records):
+            return None
+        return [], [records.pop(index)]
+    return _update_records(chat, mutate)
 
 @app.post("/api/records/edit")
-def edit_record(index: int = Form(...), user: str = Form(...), movement: str = Form(...), weight: float = Form(...), date: str = Form(...)):
+def edit_record(index: int = Form(...), user: str = Form(...), movement: str = Form(...), weight: float = Form(...), date: str = Form(...),
+                chat: str | None = Form(None)):
     try:
         date = datetime.strptime(date, "%Y-%m-%d").strftime("%d.%m.%Y")
     except ValueError:
         pass
-    records = load_json(RECORDS_FILE, [])
-    if 0 <= index < len(records):
-        records[index] = {"user": user, "movement": movement, "weight": weight, "date": date}
-        save_json(RECORDS_FILE, records)
-    return JSONResponse({"status": "ok"})
+
+    def mutate(records):
+        if not 0 <= index < len(records):
+            return None
+        old, records[index] = records[index], {"user": user, "movement": movement, "weight": weight, "date": date}
+        return [records[index]], [old]  # исправление: старое значение отменяется, новое добавляется
+    return _update_records(chat, mutate)
 
 if __name__ == "__main__":
     import uvicorn
@@ -237,5 +666,5 @@ if __name__ == "__main__":
         "src.webpanel.webpanel:app",
         host=config.WEB_HOST,
         port=config.WEB_PORT,
-        reload=True
+        workers=config.WEB_WORKERS,
     )
\ No newline at end of file